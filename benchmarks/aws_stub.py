@@ -0,0 +1,268 @@
+'''A local, in-memory stand-in for the AWS APIs used by the tagger
+
+Calls made by boto3 clients are answered from in-memory state before any
+request is sent, much like moto does, so benchmarks run without network or
+credentials. The number of calls is counted per service and operation.
+'''
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import boto3
+
+from botocore.awsrequest import AWSResponse
+
+
+class StubAwsError(Exception):
+
+  def __init__(self, code, message='', status_code=400):
+    super().__init__(message)
+    self.code = code
+    self.message = message
+    self.status_code = status_code
+
+
+class StubAws:
+  '''In-memory AWS state and the operations that read and write it'''
+
+  def __init__(self):
+    self.buckets = {}
+    self.instances = {}
+    self.ec2_tags = {}
+    self.batch_tags = {}
+    self.stacks = {}
+    self.roles = {}
+    self.parameters = {}
+    self.calls = Counter()
+    self._lock = threading.Lock()
+
+  # state setup
+
+  def add_bucket(self, name, tags):
+    self.buckets[name] = dict(tags)
+
+  def add_instance(self, instance_id, tags, volume_ids=(), network_interface_ids=()):
+    self.instances[instance_id] = {
+      'volume_ids': list(volume_ids),
+      'network_interface_ids': list(network_interface_ids),
+    }
+    self.ec2_tags[instance_id] = dict(tags)
+    for resource_id in list(volume_ids) + list(network_interface_ids):
+      self.ec2_tags.setdefault(resource_id, {})
+
+  def add_batch_resource(self, arn, tags=None):
+    self.batch_tags[arn] = dict(tags or {})
+
+  def add_stack(self, stack_id, tags, resources=()):
+    '''resources is a list of (resource type, physical resource id) pairs'''
+    self.stacks[stack_id] = {'tags': dict(tags), 'resources': list(resources)}
+
+  def add_role(self, name, role_id):
+    self.roles[name] = role_id
+
+  def add_parameter(self, name, value, version=1):
+    self.parameters[name] = {'Value': value, 'Version': version}
+
+  def calls_per_service(self):
+    '''The number of calls made to each service'''
+    services = Counter()
+    for (service, _), count in self.calls.items():
+      services[service] += count
+    return dict(services)
+
+  # botocore event handlers
+
+  def _save_params(self, params, context, **kwargs):
+    context['stub_aws_params'] = params
+
+  def _respond(self, model, context, **kwargs):
+    service = model.service_model.service_name
+    operation = model.name
+    with self._lock:
+      self.calls[(service, operation)] += 1
+      handler = getattr(self, f'_{service.replace("-", "_")}_{operation}', None)
+      try:
+        if handler is None:
+          raise StubAwsError('NotImplemented', f'{service} {operation} is not stubbed', 501)
+        parsed = handler(context['stub_aws_params']) or {}
+        status_code = 200
+      except StubAwsError as e:
+        parsed = {'Error': {'Code': e.code, 'Message': e.message}}
+        status_code = e.status_code
+    parsed['ResponseMetadata'] = {'HTTPStatusCode': status_code, 'RetryAttempts': 0}
+    return AWSResponse('https://stub.amazonaws.com', status_code, {}, None), parsed
+
+  def register(self, events):
+    events.register('before-parameter-build', self._save_params)
+    events.register('before-call', self._respond)
+
+  def unregister(self, events):
+    events.unregister('before-parameter-build', self._save_params)
+    events.unregister('before-call', self._respond)
+
+  # s3
+
+  def _s3_GetBucketTagging(self, params):
+    tags = self._bucket(params['Bucket'])
+    if not tags:
+      raise StubAwsError('NoSuchTagSet', 'The TagSet does not exist', 404)
+    return {'TagSet': to_tag_list(tags)}
+
+  def _s3_PutBucketTagging(self, params):
+    self.buckets[params['Bucket']] = from_tag_list(params['Tagging']['TagSet'])
+
+  def _bucket(self, name):
+    if name not in self.buckets:
+      raise StubAwsError('NoSuchBucket', 'The specified bucket does not exist', 404)
+    return self.buckets[name]
+
+  # ec2
+
+  def _ec2_DescribeTags(self, params):
+    filters = {f['Name']: f['Values'] for f in params.get('Filters', [])}
+    resource_ids = filters.get('resource-id', list(self.ec2_tags))
+    keys = filters.get('key')
+    tags = []
+    for resource_id in resource_ids:
+      for key, value in self.ec2_tags.get(resource_id, {}).items():
+        if keys is None or key in keys:
+          tags.append({
+            'ResourceId': resource_id,
+            'ResourceType': resource_type(resource_id),
+            'Key': key,
+            'Value': value,
+          })
+    return {'Tags': tags}
+
+  def _ec2_DescribeInstances(self, params):
+    instances = []
+    for instance_id in params.get('InstanceIds', list(self.instances)):
+      if instance_id not in self.instances:
+        raise StubAwsError('InvalidInstanceID.NotFound', f'{instance_id} does not exist')
+      instance = self.instances[instance_id]
+      instances.append({
+        'InstanceId': instance_id,
+        'Tags': to_tag_list(self.ec2_tags[instance_id]),
+        'BlockDeviceMappings': [
+          {'DeviceName': f'/dev/xvd{chr(97 + i)}', 'Ebs': {'VolumeId': volume_id}}
+          for i, volume_id in enumerate(instance['volume_ids'])
+        ],
+        'NetworkInterfaces': [
+          {'NetworkInterfaceId': eni_id} for eni_id in instance['network_interface_ids']
+        ],
+      })
+    return {'Reservations': [{'ReservationId': 'r-1', 'Instances': instances}]}
+
+  def _ec2_DescribeVolumes(self, params):
+    instance_id = attached_instance_id(params)
+    volume_ids = self.instances.get(instance_id, {}).get('volume_ids', [])
+    return {'Volumes': [{'VolumeId': volume_id} for volume_id in volume_ids]}
+
+  def _ec2_DescribeNetworkInterfaces(self, params):
+    instance_id = attached_instance_id(params)
+    eni_ids = self.instances.get(instance_id, {}).get('network_interface_ids', [])
+    return {'NetworkInterfaces': [{'NetworkInterfaceId': eni_id} for eni_id in eni_ids]}
+
+  def _ec2_CreateTags(self, params):
+    for resource_id in params['Resources']:
+      if resource_id not in self.ec2_tags:
+        raise StubAwsError('InvalidID', f'{resource_id} does not exist')
+    for resource_id in params['Resources']:
+      self.ec2_tags[resource_id].update(from_tag_list(params['Tags']))
+
+  # iam
+
+  def _iam_GetRole(self, params):
+    name = params['RoleName']
+    if name not in self.roles:
+      raise StubAwsError('NoSuchEntity', f'The role with name {name} cannot be found.', 404)
+    return {'Role': {
+      'Path': '/', 'RoleName': name, 'RoleId': self.roles[name],
+      'Arn': f'arn:aws:iam::111111111111:role/{name}', 'CreateDate': '2020-01-01T00:00:00Z',
+    }}
+
+  # cloudformation
+
+  def _cloudformation_DescribeStacks(self, params):
+    stack = self._stack(params['StackName'])
+    return {'Stacks': [{
+      'StackId': params['StackName'], 'StackName': params['StackName'],
+      'CreationTime': '2020-01-01T00:00:00Z', 'StackStatus': 'CREATE_COMPLETE',
+      'Tags': to_tag_list(stack['tags']),
+    }]}
+
+  def _cloudformation_ListStackResources(self, params):
+    stack = self._stack(params['StackName'])
+    return {'StackResourceSummaries': [{
+      'LogicalResourceId': f'Resource{i}', 'PhysicalResourceId': physical_id,
+      'ResourceType': resource_type, 'LastUpdatedTimestamp': '2020-01-01T00:00:00Z',
+      'ResourceStatus': 'CREATE_COMPLETE',
+    } for i, (resource_type, physical_id) in enumerate(stack['resources'])]}
+
+  def _stack(self, stack_name):
+    for stack_id, stack in self.stacks.items():
+      if stack_name in (stack_id, stack_id.split('/')[1] if '/' in stack_id else stack_id):
+        return stack
+    raise StubAwsError('ValidationError', f'Stack with id {stack_name} does not exist')
+
+  # batch
+
+  def _batch_ListTagsForResource(self, params):
+    return {'tags': dict(self._batch_resource(params['resourceArn']))}
+
+  def _batch_TagResource(self, params):
+    self._batch_resource(params['resourceArn']).update(params['tags'])
+
+  def _batch_resource(self, arn):
+    if arn not in self.batch_tags:
+      raise StubAwsError('ClientException', f'{arn} does not exist')
+    return self.batch_tags[arn]
+
+  # ssm
+
+  def _ssm_GetParameter(self, params):
+    name = params['Name']
+    if name not in self.parameters:
+      raise StubAwsError('ParameterNotFound', '')
+    return {'Parameter': dict(self.parameters[name], Name=name, Type='String')}
+
+
+def to_tag_list(tags):
+  return [{'Key': key, 'Value': value} for key, value in tags.items()]
+
+def from_tag_list(tags):
+  return {tag['Key']: tag['Value'] for tag in tags}
+
+def resource_type(resource_id):
+  prefix = resource_id.split('-')[0]
+  return {'i': 'instance', 'vol': 'volume', 'eni': 'network-interface'}.get(prefix, prefix)
+
+def attached_instance_id(params):
+  for f in params.get('Filters', []):
+    if f['Name'] == 'attachment.instance-id':
+      return f['Values'][0]
+  return None
+
+
+@contextmanager
+def stub_aws(stub=None):
+  '''Answer all AWS calls made by boto3 clients from a StubAws'''
+  from set_tags import utils
+
+  stub = stub or StubAws()
+  env = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+  }
+  with patch.dict('os.environ', env):
+    events = boto3._get_default_session().events
+    stub.register(events)
+    utils.reset_clients()
+    try:
+      yield stub
+    finally:
+      stub.unregister(events)
+      utils.reset_clients()
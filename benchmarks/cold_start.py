@@ -0,0 +1,137 @@
+'''Measure cold start time to first response for each lambda handler
+
+Every handler and event in the events folder is run in a fresh python
+process against the local AWS and Synapse stand-ins. The time to import the
+handler module, the time for the handler to send its response and the
+import time of the heavy dependencies are reported.
+
+Usage:
+  python -m benchmarks.cold_start
+'''
+import argparse
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from contextlib import nullcontext
+
+HANDLERS = ['set_bucket_tags', 'set_instance_tags', 'set_batch_tags']
+REQUEST_TYPES = ['create', 'update', 'delete']
+MODULES = ['boto3', 'crhelper', 'set_tags.utils', 'requests', 'synapseclient']
+EVENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'events')
+OWNER_ID = '1111111'
+PRINCIPAL_ARN = f'arn:aws:sts::111111111111:assumed-role/ServiceCatalogEndusers/{OWNER_ID}'
+PRODUCT_ARN = 'arn:aws:servicecatalog:us-east-1:111111111111:stack/my-product/pp-mycpuogt2i45s'
+IMPORT_TIME = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+class LambdaContext:
+
+  def get_remaining_time_in_millis(self):
+    return 15000
+
+
+def load_event(handler_name, request_type):
+  with open(os.path.join(EVENTS_DIR, handler_name, f'{request_type}.json')) as f:
+    return json.load(f)
+
+
+def add_resources(aws, handler_name, event):
+  '''Add the resources referenced by an event to the AWS stand-in'''
+  sc_tags = {
+    'aws:servicecatalog:provisioningPrincipalArn': PRINCIPAL_ARN,
+    'aws:servicecatalog:provisionedProductArn': PRODUCT_ARN,
+  }
+  properties = event['ResourceProperties']
+  if handler_name == 'set_bucket_tags':
+    aws.add_bucket(properties['BucketName'], sc_tags)
+  elif handler_name == 'set_instance_tags':
+    aws.add_instance(properties['InstanceId'], sc_tags, ['vol-1'], ['eni-1'])
+    aws.add_role('ServiceCatalogEndusers', 'AROAEXAMPLE')
+  elif handler_name == 'set_batch_tags':
+    aws.add_stack(event['StackId'], sc_tags)
+    for arn in properties['BatchResources'].values():
+      aws.add_batch_resource(arn)
+
+
+def child(handler_name, request_type):
+  '''Import and run a handler, runs in a fresh process'''
+  os.environ.update({
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+  })
+  start = time.perf_counter()
+  module = importlib.import_module(f'set_tags.{handler_name}')
+  import_time = time.perf_counter() - start
+
+  from benchmarks.aws_stub import stub_aws
+  from benchmarks.synapse_stub import stub_synapse
+
+  event = load_event(handler_name, request_type)
+  responses = []
+  module.helper._send = lambda status=None, reason='': responses.append(
+    (time.perf_counter(), status or module.helper.Status, reason or module.helper.Reason))
+  # delete events should never need synapse
+  synapse = nullcontext() if request_type == 'delete' else stub_synapse()
+  with stub_aws() as aws, synapse:
+    add_resources(aws, handler_name, event)
+    handler_start = time.perf_counter()
+    module.handler(event, LambdaContext())
+
+  response_time, status, reason = responses[0]
+  print(json.dumps({
+    'import_ms': import_time * 1000,
+    'handler_ms': (response_time - handler_start) * 1000,
+    'status': status,
+    'reason': reason,
+  }))
+
+
+def parse_import_times(stderr):
+  '''Get the cumulative import time in ms of the modules of interest'''
+  times = {}
+  for line in stderr.splitlines():
+    match = IMPORT_TIME.match(line)
+    if match and match.group(3) in MODULES and match.group(3) not in times:
+      times[match.group(3)] = int(match.group(1)) / 1000
+  return times
+
+
+def run(handler_name, request_type):
+  result = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-m', 'benchmarks.cold_start',
+     '--child', handler_name, request_type],
+    capture_output=True, text=True, check=True)
+  measurement = json.loads(result.stdout.strip().splitlines()[-1])
+  measurement['modules'] = parse_import_times(result.stderr)
+  return measurement
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.child:
+    return child(*args.child)
+
+  header = f'{"handler":<20}{"event":<8}{"status":<9}{"import ms":>10}{"handler ms":>12}{"total ms":>10}'
+  module_header = ''.join(f'{module:>16}' for module in MODULES)
+  print(header + module_header)
+  for handler_name in HANDLERS:
+    for request_type in REQUEST_TYPES:
+      m = run(handler_name, request_type)
+      row = (f'{handler_name:<20}{request_type:<8}{m["status"]:<9}{m["import_ms"]:>10.1f}'
+             f'{m["handler_ms"]:>12.1f}{m["import_ms"] + m["handler_ms"]:>10.1f}')
+      modules = ''.join(
+        f'{m["modules"][module]:>16.1f}' if module in m['modules'] else f'{"-":>16}'
+        for module in MODULES)
+      print(row + modules)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,192 @@
+'''Measure end-to-end latency, API calls and memory of the lambda handlers
+
+Each handler is invoked with its create event against the local AWS and
+Synapse stand-ins, with as many volumes attached to the instance and teams
+in the TeamToRoleArnMap as each scenario asks for. The user is only a member
+of the last team. Caches are cleared before every invocation so each one
+does all of its lookups, clients are kept the way a warm container keeps
+them.
+
+Results can be saved and later checked against, a check fails when a
+scenario makes more API calls than the saved run, or takes more time or
+memory than the saved run times the tolerance.
+
+Usage:
+  python -m benchmarks.handlers [--volumes 1 10 100] [--teams 1 10 50 200]
+  python -m benchmarks.handlers --save baseline.json
+  python -m benchmarks.handlers --check baseline.json [--tolerance 1.5]
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from unittest.mock import patch
+
+from benchmarks.aws_stub import stub_aws
+from benchmarks.cold_start import LambdaContext, load_event, OWNER_ID, PRINCIPAL_ARN, PRODUCT_ARN
+from benchmarks.synapse_stub import stub_synapse
+
+HANDLERS = ['set_bucket_tags', 'set_instance_tags', 'set_batch_tags']
+TEAM_TO_ROLE_ARN_MAP = '/service-catalog/TeamToRoleArnMap'
+
+
+def get_scenarios(volume_counts, team_counts):
+  '''Every handler with each number of teams, then the instance handler with
+  each number of volumes
+  :return a list of (handler name, volume count, team count) tuples
+  '''
+  scenarios = [(handler_name, 1, teams) for teams in team_counts for handler_name in HANDLERS]
+  scenarios += [('set_instance_tags', volumes, team_counts[0])
+                for volumes in volume_counts if volumes != 1]
+  return scenarios
+
+def get_team_ids(team_count):
+  return [str(3000000 + i) for i in range(team_count)]
+
+def add_resources(aws, handler_name, event, volume_count, team_count):
+  '''Add the resources of a scenario to the AWS stand-in'''
+  sc_tags = {
+    'aws:servicecatalog:provisioningPrincipalArn': PRINCIPAL_ARN,
+    'aws:servicecatalog:provisionedProductArn': PRODUCT_ARN,
+  }
+  team_to_role_arn_map = [
+    {'teamId': team_id, 'roleArn': f'arn:aws:iam::111111111111:role/team-{team_id}'}
+    for team_id in get_team_ids(team_count)
+  ]
+  aws.add_parameter(TEAM_TO_ROLE_ARN_MAP, json.dumps(team_to_role_arn_map))
+  properties = event['ResourceProperties']
+  if handler_name == 'set_bucket_tags':
+    aws.add_bucket(properties['BucketName'], sc_tags)
+  elif handler_name == 'set_instance_tags':
+    volume_ids = [f'vol-{i:017x}' for i in range(volume_count)]
+    aws.add_instance(properties['InstanceId'], sc_tags, volume_ids, ['eni-1'])
+    aws.add_role('ServiceCatalogEndusers', 'AROAEXAMPLEROLEID')
+  elif handler_name == 'set_batch_tags':
+    aws.add_stack(event['StackId'], sc_tags)
+    for arn in properties['BatchResources'].values():
+      aws.add_batch_resource(arn)
+
+
+def invoke(module, event, aws, handler_name, volume_count, team_count):
+  '''Invoke a handler on fresh resources and cold caches
+  :return the status sent to cloudformation
+  '''
+  from set_tags import utils
+
+  add_resources(aws, handler_name, event, volume_count, team_count)
+  utils.clear_caches()
+  statuses = []
+  module.helper._send = lambda status=None, reason='': statuses.append(
+    (status or module.helper.Status, reason or module.helper.Reason))
+  # the handler prints its metrics record to stdout
+  with contextlib.redirect_stdout(io.StringIO()):
+    module.handler(event, LambdaContext())
+  status, reason = statuses[0]
+  if status != 'SUCCESS':
+    raise Exception(f'{handler_name} failed: {reason}')
+  return status
+
+def run(scenario, latency, repeat):
+  '''Run a scenario
+  :return a dict of the mean wall time in ms, the API calls per invocation
+          by service and the peak memory in KB
+  '''
+  from set_tags import utils
+
+  handler_name, volume_count, team_count = scenario
+  module = importlib.import_module(f'set_tags.{handler_name}')
+  event = load_event(handler_name, 'create')
+  members = {get_team_ids(team_count)[-1]: [OWNER_ID]}
+  env = {'TEAM_TO_ROLE_ARN_MAP_PARAM_NAME': TEAM_TO_ROLE_ARN_MAP}
+  # the synapse client must be built against this scenario's stub server
+  utils.reset_synapse_client()
+  with stub_aws() as aws, stub_synapse(latency, members) as synapse, \
+    patch.dict(os.environ, env):
+      # warm up the clients the way a warm lambda container has them
+      invoke(module, event, aws, handler_name, volume_count, team_count)
+      aws.calls.clear()
+      synapse.request_count = 0
+
+      elapsed = 0
+      for _ in range(repeat):
+        start = time.perf_counter()
+        invoke(module, event, aws, handler_name, volume_count, team_count)
+        elapsed += time.perf_counter() - start
+      calls = {service: count / repeat for service, count in aws.calls_per_service().items()}
+      calls['synapse'] = synapse.request_count / repeat
+
+      tracemalloc.start()
+      try:
+        invoke(module, event, aws, handler_name, volume_count, team_count)
+        _, peak = tracemalloc.get_traced_memory()
+      finally:
+        tracemalloc.stop()
+
+  return {'wall_ms': elapsed / repeat * 1000, 'calls': calls, 'peak_kb': peak / 1024}
+
+
+def get_key(scenario):
+  handler_name, volume_count, team_count = scenario
+  return f'{handler_name} volumes={volume_count} teams={team_count}'
+
+def check(results, baseline, tolerance):
+  '''Compare results with a saved run
+  :return a list of regressions, empty when there are none
+  '''
+  regressions = []
+  for key, result in results.items():
+    saved = baseline.get(key)
+    if saved is None:
+      continue
+    for service, count in result['calls'].items():
+      if count > saved['calls'].get(service, 0):
+        regressions.append(f'{key}: {service} calls {saved["calls"].get(service, 0):g} -> {count:g}')
+    for metric in ['wall_ms', 'peak_kb']:
+      if result[metric] > saved[metric] * tolerance:
+        regressions.append(f'{key}: {metric} {saved[metric]:.1f} -> {result[metric]:.1f}')
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--volumes', type=int, nargs='+', default=[1, 10, 100])
+  parser.add_argument('--teams', type=int, nargs='+', default=[1, 10, 50, 200])
+  parser.add_argument('--latency', type=float, default=0.005,
+                      help='seconds the stub synapse server waits per request')
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--save', help='save the results to a json file')
+  parser.add_argument('--check', help='fail on regressions from the results in a json file')
+  parser.add_argument('--tolerance', type=float, default=1.5,
+                      help='allowed ratio of time and memory to the checked results')
+  args = parser.parse_args()
+  # crhelper builds a lambda client when the handler modules are imported
+  os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+  results = {}
+  print(f'{"scenario":<44}{"wall ms":>10}{"peak KB":>10}  calls per invocation')
+  for scenario in get_scenarios(args.volumes, args.teams):
+    result = run(scenario, args.latency, args.repeat)
+    results[get_key(scenario)] = result
+    calls = ', '.join(f'{service} {count:g}' for service, count in sorted(result['calls'].items()))
+    print(f'{get_key(scenario):<44}{result["wall_ms"]:>10.1f}{result["peak_kb"]:>10.1f}  {calls}')
+
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2)
+  if args.check:
+    with open(args.check) as f:
+      regressions = check(results, json.load(f), args.tolerance)
+    for regression in regressions:
+      print(f'Regression: {regression}')
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
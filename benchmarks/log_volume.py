@@ -0,0 +1,104 @@
+'''Measure the CPU time and log volume of tagging resources with large tag sets
+
+An instance with many volumes and a bucket, each with many tags, are tagged
+against the AWS stand-in at each log setting. DEBUG with full values is how
+the lambdas logged before LOG_LEVEL and LOG_MAX_VALUE_LENGTH, INFO is the
+default now.
+
+Usage:
+  python -m benchmarks.log_volume [--tags 50] [--volumes 100] [--repeat 20]
+'''
+import argparse
+import logging
+import os
+import time
+
+from unittest.mock import patch
+
+from benchmarks.aws_stub import stub_aws
+
+PRINCIPAL_ARN = 'arn:aws:sts::111111111111:assumed-role/ServiceCatalogEndusers/1111111'
+PRODUCT_ARN = 'arn:aws:servicecatalog:us-east-1:111111111111:stack/my-product/pp-1'
+SYNAPSE_TAGS = [
+  {'Key': 'synapse:ownerId', 'Value': '1111111'},
+  {'Key': 'synapse:userName', 'Value': 'jsmith'},
+  {'Key': 'synapse:email', 'Value': 'jsmith@synapse.org'},
+  {'Key': 'synapse:teamId', 'Value': '3000000'},
+]
+SETTINGS = [
+  ('DEBUG, full values', 'DEBUG', '0'),
+  ('DEBUG, truncated', 'DEBUG', ''),
+  ('INFO', 'INFO', ''),
+]
+
+
+class ByteCounter(logging.Handler):
+  '''Format log records the way the lambda runtime would and count the bytes'''
+
+  def __init__(self):
+    super().__init__()
+    self.setFormatter(logging.Formatter('[%(levelname)s] %(asctime)s %(message)s'))
+    self.bytes = 0
+    self.records = 0
+
+  def emit(self, record):
+    self.bytes += len(self.format(record).encode()) + 1
+    self.records += 1
+
+
+def add_resources(aws, tag_count, volume_count):
+  tags = {f'cost-center:{i}': f'value-{i}-' + 'x' * 40 for i in range(tag_count)}
+  tags['aws:servicecatalog:provisioningPrincipalArn'] = PRINCIPAL_ARN
+  tags['aws:servicecatalog:provisionedProductArn'] = PRODUCT_ARN
+  volume_ids = [f'vol-{i:017x}' for i in range(volume_count)]
+  aws.add_instance('i-0123456789abcdef0', tags, volume_ids, ['eni-1'])
+  aws.add_bucket('my-bucket', tags)
+  aws.add_role('ServiceCatalogEndusers', 'AROAEXAMPLEROLEID')
+
+
+def run(level, max_value_length, tag_count, volume_count, repeat):
+  from set_tags import set_bucket_tags
+  from set_tags import set_instance_tags
+  from set_tags import utils
+
+  loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict
+             if name.startswith('set_tags.')]
+  counter = ByteCounter()
+  logging.getLogger('set_tags').addHandler(counter)
+  for logger in loggers:
+    logger.setLevel(level)
+  cpu = 0
+  try:
+    with stub_aws() as aws, \
+      patch.dict(os.environ, {'LOG_MAX_VALUE_LENGTH': max_value_length}):
+        for _ in range(repeat):
+          add_resources(aws, tag_count, volume_count)
+          utils.clear_caches()
+          start = time.process_time()
+          set_instance_tags.tag_instance('i-0123456789abcdef0', SYNAPSE_TAGS)
+          set_bucket_tags.tag_bucket('my-bucket', SYNAPSE_TAGS)
+          cpu += time.process_time() - start
+  finally:
+    logging.getLogger('set_tags').removeHandler(counter)
+  return cpu / repeat, counter.bytes / repeat, counter.records / repeat
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--tags', type=int, default=50, help='tags on each resource')
+  parser.add_argument('--volumes', type=int, default=100, help='volumes attached to the instance')
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args()
+
+  # crhelper builds a lambda client when the handler modules are imported
+  os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+  # warm up the clients outside of the measurement
+  run('INFO', '', args.tags, args.volumes, 1)
+  print(f'{"setting":<20}{"cpu ms":>10}{"log KB":>10}{"records":>10}')
+  for name, level, max_value_length in SETTINGS:
+    cpu, size, records = run(level, max_value_length, args.tags, args.volumes, args.repeat)
+    print(f'{name:<20}{cpu * 1000:>10.2f}{size / 1024:>10.1f}{records:>10.0f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,53 @@
+'''Compare the synapse overhead of each invocation with and without a shared session
+
+Usage:
+  python -m benchmarks.synapse_session --invocations 50 --latency 0.005
+'''
+import argparse
+import time
+
+from benchmarks.synapse_stub import stub_synapse
+from set_tags import utils
+
+OWNER_ID = '1111111'
+TEAM_IDS = ['2222222', '3333333']
+
+
+def invoke(reuse_session):
+  '''The synapse lookups made by a single create or update event'''
+  if not reuse_session:
+    # the old behaviour built a new client for each lookup
+    utils.reset_synapse_client()
+  utils.get_synapse_user_profile(OWNER_ID)
+  if not reuse_session:
+    utils.reset_synapse_client()
+  utils.get_synapse_user_team_id(OWNER_ID, TEAM_IDS)
+
+
+def run(reuse_session, invocations, latency):
+  utils.reset_synapse_client()
+  with stub_synapse(latency, members={TEAM_IDS[-1]: [OWNER_ID]}) as server:
+    start = time.perf_counter()
+    for _ in range(invocations):
+      invoke(reuse_session)
+    elapsed = time.perf_counter() - start
+    requests = server.request_count
+  utils.reset_synapse_client()
+  return elapsed / invocations, requests / invocations
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--invocations', type=int, default=50)
+  parser.add_argument('--latency', type=float, default=0.005,
+                      help='seconds the stub synapse server waits per request')
+  args = parser.parse_args()
+
+  print(f'{"mode":<16}{"ms/invocation":>16}{"requests/invocation":>22}')
+  for label, reuse_session in (('new client', False), ('shared session', True)):
+    per_invocation, requests = run(reuse_session, args.invocations, args.latency)
+    print(f'{label:<16}{per_invocation * 1000:>16.2f}{requests:>22.2f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,96 @@
+'''A local stand-in for the Synapse REST API used by the benchmarks'''
+import json
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+USER_PROFILE_PATH = re.compile(r'^/repo/v1/userProfile/(\d+)$')
+MEMBERSHIP_STATUS_PATH = re.compile(r'^/repo/v1/team/(\d+)/member/(\d+)/membershipStatus$')
+
+
+class StubSynapseServer(ThreadingHTTPServer):
+  '''Serve user profiles and team membership status with a fixed latency
+
+  latency: seconds to wait before answering each request
+  members: a dict of team id to the list of user ids in that team
+  '''
+  daemon_threads = True
+
+  def __init__(self, latency=0.0, members=None):
+    super().__init__(('127.0.0.1', 0), StubSynapseHandler)
+    self.latency = latency
+    self.members = members or {}
+    self.request_count = 0
+    self._count_lock = threading.Lock()
+
+  @property
+  def endpoints(self):
+    '''The synapse client endpoints that point at this server'''
+    url = f'http://127.0.0.1:{self.server_address[1]}'
+    return {
+      'repoEndpoint': f'{url}/repo/v1',
+      'authEndpoint': f'{url}/auth/v1',
+      'fileHandleEndpoint': f'{url}/file/v1',
+      'portalEndpoint': f'{url}/',
+    }
+
+  def count_request(self):
+    with self._count_lock:
+      self.request_count += 1
+
+
+class StubSynapseHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def do_GET(self):
+    self.server.count_request()
+    time.sleep(self.server.latency)
+    match = USER_PROFILE_PATH.match(self.path)
+    if match:
+      owner_id = match.group(1)
+      return self.send_json({
+        'ownerId': owner_id,
+        'firstName': 'Joe',
+        'lastName': 'Smith',
+        'userName': f'user{owner_id}',
+        'company': 'Sage Bionetworks',
+      })
+    match = MEMBERSHIP_STATUS_PATH.match(self.path)
+    if match:
+      team_id, user_id = match.groups()
+      is_member = user_id in self.server.members.get(team_id, [])
+      return self.send_json({'teamId': team_id, 'userId': user_id, 'isMember': is_member})
+    # endpoint checks made by the synapse client when it is constructed
+    return self.send_json({})
+
+  def send_json(self, body):
+    content = json.dumps(body).encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def log_message(self, format, *args):
+    pass
+
+
+@contextmanager
+def stub_synapse(latency=0.0, members=None):
+  '''Run a stub synapse server and point the synapse client at it'''
+  import synapseclient.client
+
+  server = StubSynapseServer(latency, members)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  try:
+    with patch.dict(synapseclient.client.PRODUCTION_ENDPOINTS, server.endpoints):
+      yield server
+  finally:
+    server.shutdown()
+    server.server_close()
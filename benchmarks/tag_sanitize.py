@@ -0,0 +1,100 @@
+'''Measure the throughput of deriving sanitized tags from synapse user profiles
+
+Large synthetic profiles, with long values full of characters that are not
+allowed in tags, are sanitized with a regex substitution per field, the way
+profile tags were sanitized before the normalize module, and with the
+normalize module's translation tables. The sanitization alone and the whole
+derivation of profile tags, which also applies the AWS length and prefix
+rules, are measured. Both must give the same tags.
+
+Usage:
+  python -m benchmarks.tag_sanitize [--profiles 20000] [--length 200] [--non-ascii 0.1]
+'''
+import argparse
+import random
+import re
+import time
+
+from set_tags import normalize
+from set_tags import utils
+
+ASCII = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 .,()&\'"!?-_@/'
+NON_ASCII = 'àéîõüçñßøåæœ中文日本語한국어😀'
+
+
+def get_profiles(count, length, non_ascii, seed=0):
+  rng = random.Random(seed)
+  def text():
+    chars = [rng.choice(ASCII) for _ in range(rng.randint(1, length))]
+    if rng.random() < non_ascii:
+      chars[rng.randrange(len(chars))] = rng.choice(NON_ASCII)
+    return ''.join(chars)
+  return [{
+    'ownerId': str(1000000 + i),
+    'firstName': text(),
+    'lastName': text(),
+    'userName': text(),
+    'company': text(),
+    'teamName': text(),
+    'summary': text(),
+  } for i in range(count)]
+
+def regex_profile_tags(user_profile, includes=utils.SYNAPSE_USER_PROFILE_INCLUDES):
+  '''The regex based sanitization that the normalize module replaced'''
+  VALID_TAG_CHARS = r'[^a-zA-Z0-9.+=_:@/\-]'
+
+  tags = []
+  for key, value in user_profile.items():
+    if key not in includes:
+      continue
+    value = re.sub(VALID_TAG_CHARS, ' ', value)
+    if key == "userName":
+      synapse_email = f'{value}@synapse.org'
+      tags.append({'Key': f'{utils.SYNAPSE_TAG_PREFIX}:email', 'Value': synapse_email})
+      tags.append({'Key': 'OwnerEmail', 'Value': synapse_email})
+    tags.append({'Key': f'{utils.SYNAPSE_TAG_PREFIX}:{key}', 'Value': value})
+  return tags
+
+def measure(fn, profiles, repeat=3):
+  '''The best time of a few runs of fn over the profiles'''
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    results = [fn(profile) for profile in profiles]
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best, results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--profiles', type=int, default=20000)
+  parser.add_argument('--length', type=int, default=200,
+                      help='max characters of each profile field, at most 243 so emails are not cut')
+  parser.add_argument('--non-ascii', type=float, default=0.1,
+                      help='fraction of profile fields with a non ASCII character')
+  args = parser.parse_args()
+
+  profiles = get_profiles(args.profiles, args.length, args.non_ascii)
+  pattern = re.compile(r'[^a-zA-Z0-9.+=_:@/\-]')
+  translator = normalize.DEFAULT.translator
+  rows = []
+  for name, regex_fn, table_fn in [
+    ('sanitize values',
+     lambda profile: [pattern.sub(' ', value) for value in profile.values()],
+     lambda profile: translator.translate_many(list(profile.values()))),
+    ('profile tags', regex_profile_tags, utils.get_synapse_user_profile_tags),
+  ]:
+    regex_time, regex_results = measure(regex_fn, profiles)
+    table_time, table_results = measure(table_fn, profiles)
+    assert regex_results == table_results, f'{name} results differ'
+    rows.append((name, regex_time, table_time))
+
+  print(f'{"":<18}{"regex profiles/s":>18}{"table profiles/s":>18}{"speedup":>10}')
+  for name, regex_time, table_time in rows:
+    print(f'{name:<18}{args.profiles / regex_time:>18.0f}{args.profiles / table_time:>18.0f}'
+          f'{regex_time / table_time:>10.2f}')
+
+
+if __name__ == '__main__':
+  main()
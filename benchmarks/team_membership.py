@@ -0,0 +1,54 @@
+'''Measure team membership resolution latency as the number of teams grows
+
+The user is only a member of the last team in the map, the worst case for a
+serial lookup.
+
+Usage:
+  python -m benchmarks.team_membership --latency 0.02 --teams 1 8 32 64
+'''
+import argparse
+import os
+import time
+
+from unittest.mock import patch
+
+from benchmarks.synapse_stub import stub_synapse
+from set_tags import utils
+
+OWNER_ID = '1111111'
+
+
+def run(team_count, workers, latency, repeat):
+  team_ids = [str(3000000 + i) for i in range(team_count)]
+  utils.reset_synapse_client()
+  with stub_synapse(latency, members={team_ids[-1]: [OWNER_ID]}), \
+    patch.dict(os.environ, {'SYNAPSE_TEAM_LOOKUP_WORKERS': str(workers)}):
+      # build the shared client outside of the measurement
+      utils.get_synapse_client()
+      start = time.perf_counter()
+      for _ in range(repeat):
+        team_id = utils.get_synapse_user_team_id(OWNER_ID, team_ids)
+        assert team_id == team_ids[-1]
+      elapsed = time.perf_counter() - start
+  utils.reset_synapse_client()
+  return elapsed / repeat
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--teams', type=int, nargs='+', default=[1, 8, 32, 64])
+  parser.add_argument('--workers', type=int, default=32)
+  parser.add_argument('--latency', type=float, default=0.02,
+                      help='seconds the stub synapse server waits per request')
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  print(f'{"teams":>6}{"serial ms":>12}{"concurrent ms":>16}')
+  for team_count in args.teams:
+    serial = run(team_count, 1, args.latency, args.repeat)
+    concurrent = run(team_count, args.workers, args.latency, args.repeat)
+    print(f'{team_count:>6}{serial * 1000:>12.1f}{concurrent * 1000:>16.1f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,129 @@
+'''Measure tagging success rate and latency against a throttling AWS API
+
+A burst of batch TagResource calls is sent to a stand-in that only accepts a
+limited rate of requests and answers the rest with ThrottlingException, the
+way AWS control plane APIs do. The burst is sent without retries and with the
+retry layer, reporting the success rate, latency and retry metrics.
+
+Usage:
+  python -m benchmarks.throttling [--calls 300] [--workers 20] [--rate 50]
+'''
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from botocore.awsrequest import AWSResponse
+
+from set_tags import retry
+from set_tags import utils
+
+
+class ThrottlingApi:
+  '''Answer requests from a token bucket of rate requests per second, with
+  room for a burst of one second, and throttle the rest'''
+
+  THROTTLED = (429, b'{"__type": "ThrottlingException", "message": "Rate exceeded"}')
+  OK = (200, b'{}')
+
+  def __init__(self, rate, latency):
+    self.rate = rate
+    self.latency = latency
+    self.tokens = rate
+    self.updated = time.monotonic()
+    self.requests = 0
+    self.throttled = 0
+    self._lock = threading.Lock()
+
+  def before_send(self, request, **kwargs):
+    time.sleep(self.latency)
+    with self._lock:
+      now = time.monotonic()
+      self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+      self.updated = now
+      self.requests += 1
+      if self.tokens >= 1:
+        self.tokens -= 1
+        status_code, body = self.OK
+      else:
+        self.throttled += 1
+        status_code, body = self.THROTTLED
+    return AWSResponse(request.url, status_code, {}, RawBody(body))
+
+
+class RawBody:
+
+  def __init__(self, body):
+    self.body = body
+
+  def stream(self, **kwargs):
+    yield self.body
+
+
+def tag(arn):
+  start = time.perf_counter()
+  try:
+    utils.get_batch_client().tag_resource(resourceArn=arn, tags={'foo': 'bar'})
+    return True, time.perf_counter() - start
+  except Exception:
+    return False, time.perf_counter() - start
+
+
+def run(calls, workers, rate, latency, env):
+  with patch.dict('os.environ', env):
+    utils.reset_clients()
+    retry.reset()
+    api = ThrottlingApi(rate, latency)
+    utils.get_batch_client().meta.events.register('before-send', api.before_send)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      results = list(executor.map(tag, [f'arn:aws:batch:job-queue/q{i}' for i in range(calls)]))
+    wall = time.perf_counter() - start
+    metrics = retry.get_metrics().get('batch', {})
+    utils.reset_clients()
+
+  latencies = sorted(latency for _, latency in results)
+  return {
+    'success': sum(ok for ok, _ in results) / calls,
+    'p50': statistics.median(latencies),
+    'p99': latencies[int(len(latencies) * 0.99) - 1],
+    'max': latencies[-1],
+    'wall': wall,
+    'requests': api.requests,
+    'throttled': api.throttled,
+    'metrics': metrics,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--calls', type=int, default=300)
+  parser.add_argument('--workers', type=int, default=20)
+  parser.add_argument('--rate', type=int, default=50, help='requests per second accepted')
+  parser.add_argument('--latency', type=float, default=0.02, help='seconds per request')
+  args = parser.parse_args()
+
+  env = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+  }
+  modes = {
+    'no retries': dict(env, AWS_MAX_ATTEMPTS='1'),
+    'retry layer': dict(env, AWS_MAX_ATTEMPTS='5', RETRY_BUDGET=str(args.calls * 4)),
+  }
+  print(f'{args.calls} calls, {args.workers} workers, {args.rate} requests/s accepted')
+  print(f'{"mode":<14}{"success":>9}{"p50 s":>8}{"p99 s":>8}{"max s":>8}{"wall s":>8}'
+        f'{"requests":>10}{"throttled":>11}  metrics')
+  for name, mode_env in modes.items():
+    m = run(args.calls, args.workers, args.rate, args.latency, mode_env)
+    print(f'{name:<14}{m["success"]:>9.1%}{m["p50"]:>8.2f}{m["p99"]:>8.2f}{m["max"]:>8.2f}'
+          f'{m["wall"]:>8.2f}{m["requests"]:>10}{m["throttled"]:>11}  {m["metrics"]}')
+
+
+if __name__ == '__main__':
+  main()
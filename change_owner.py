@@ -1,10 +1,15 @@
 # A wrapper script to Change ownership of Service Catalog provisioned products.
-# This script supports changing ownership on one product at a time.
+# This script changes ownership on one product, or on many products listed
+# in a manifest file.
 # More info at IT-4483
 #
 # Usage:
 #   AWS_PROFILE=my-aws-profile AWS_DEFAULT_REGION=us-east-1 pipenv run change_owner --help
 #
+# Example to change the owner of every resource in the product's stack:
+#   pipenv run change_owner \
+#   --ProvisionedProductId pp-j6npiwvn72hjg \
+#   --NewOwnerArn arn:aws:sts::999999999999:assumed-role/ServiceCatalogEndusers/1234567
 # Example to change bucket owner:
 #   pipenv run change_owner \
 #   --ProvisionedProductId pp-j6npiwvn72hjg \
@@ -15,22 +20,35 @@
 #   --ProvisionedProductId pp-j6npiwvn72hjg \
 #   --NewOwnerArn arn:aws:sts::999999999999:assumed-role/ServiceCatalogEndusers/1234567 \
 #   --InstanceId i-0c1d159b27a027a33
-# Example to change scheduled jobs owner:
+# Example to change the owner of every resource in a stack:
 #   pipenv run change_owner \
 #   --ProvisionedProductId pp-j6npiwvn72hjg \
 #   --NewOwnerArn arn:aws:sts::999999999999:assumed-role/ServiceCatalogEndusers/1234567 \
 #   --StackId 'arn:aws:cloudformation:us-east-1:999999999999:stack/SC-999999999999-pp-dtstzmysqf36i/f3a44380-9418-11f0-930e-1204b39d8e69'
+# Example to change the owner of many products:
+#   pipenv run change_owner --Manifest changes.csv --ResultFile results.jsonl
+#
+# A manifest is a CSV file with a header row, or a JSONL file, with the
+# fields ProvisionedProductId, NewOwnerArn and optionally StackId, BucketName
+# and InstanceId. Each row gets a line in the JSONL result file.
+#
+# The resources of the product's stack are discovered when neither
+# --BucketName nor --InstanceId is given, or when --StackId is given.
 
 import argparse
+import csv
 import json
-import boto3
 import os
 import re
 import sys
 import set_tags.utils as utils
+import set_tags.bulk as bulk
+import set_tags.retry as retry
 import set_tags.set_bucket_tags as set_bucket_tags
-import set_tags.set_instance_tags as set_instance_tags
-import set_tags.set_batch_tags as set_batch_tags
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MANIFEST_FIELDS = ["ProvisionedProductId", "NewOwnerArn", "StackId", "BucketName", "InstanceId"]
 
 
 def get_args():
@@ -41,22 +59,27 @@ def get_args():
         description="Change Service Catalog provisioned product ownership."
     )
 
-    # Required argument
+    # Required argument, either a single product or a manifest
     parser.add_argument(
         "--ProvisionedProductId",
-        help="The identifier of the provisioned product (required)",
-        required=True
+        help="The identifier of the provisioned product (required without --Manifest)",
+        default=None
     )
     parser.add_argument(
         "--NewOwnerArn",
-        help="The ARN of the new owner (required)",
-        required=True
+        help="The ARN of the new owner (required without --Manifest)",
+        default=None
+    )
+    parser.add_argument(
+        "--Manifest",
+        help="A CSV or JSONL file listing the products to change",
+        default=None
     )
 
     # Optional arguments
     parser.add_argument(
         "--StackId",
-        help="The CloudFormation stack ID for batch scheduled jobs",
+        help="The CloudFormation stack ID, all of its resources are re-tagged",
         default=None
     )
     parser.add_argument(
@@ -69,8 +92,22 @@ def get_args():
         help="The EC2 instance ID",
         default=None
     )
+    parser.add_argument(
+        "--ResultFile",
+        help="The JSONL file to write the result of each manifest row to",
+        default="change_owner_results.jsonl"
+    )
+    parser.add_argument(
+        "--MaxWorkers",
+        help="The max number of manifest rows processed concurrently",
+        type=int,
+        default=10
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.Manifest and not (args.ProvisionedProductId and args.NewOwnerArn):
+        parser.error("--ProvisionedProductId and --NewOwnerArn are required without --Manifest")
+    return args
 
 def get_account_and_user_id_from_arn(arn: str):
     """
@@ -110,7 +147,7 @@ def update_bucket_principal_arn(bucket_name: str, target_user_id: str, new_assum
         Must be in the format:
         'arn:aws:sts::<account_id>:assumed-role/ServiceCatalogEndusers/<user_id>'
     """
-    s3 = boto3.client("s3")
+    s3 = utils.get_s3_client()
 
     try:
         # Fetch current bucket policy
@@ -148,123 +185,168 @@ def update_bucket_principal_arn(bucket_name: str, target_user_id: str, new_assum
 
     except s3.exceptions.NoSuchBucketPolicy:
         print(f"No policy found for bucket {bucket_name}.")
-    except Exception as e:
-        print(f"Error updating bucket policy: {e}")
 
-def get_batch_resource_arns(stack_name: str) -> dict:
+def get_resources(row: dict) -> dict:
     """
-    Retrieves physical IDs of Batch resources from a CloudFormation stack.
-
-    Args:
-        stack_name (str): The name or ID of the CloudFormation stack.
+    Gets the resources of a provisioned product to re-tag. The resources in
+    the product's stack are discovered when the row has a StackId or has
+    neither a BucketName nor an InstanceId.
 
     Returns:
-        dict: Dictionary containing ARNs for:
-            - JobDefinitionArn
-            - ComputeEnvironmentArn
-            - SchedulingPolicyArn
-            - JobQueueArn
+    - dict of resource kind to a list of physical resource IDs
     """
-    cf_client = boto3.client("cloudformation")
-    result = {}
-
-    try:
-        # Call describe_stack_resources API
-        response = cf_client.describe_stack_resources(StackName=stack_name)
-        stack_resources = response.get("StackResources", [])
+    resources = {}
+    if row.get("BucketName"):
+        resources[bulk.BUCKET] = [row["BucketName"]]
+    if row.get("InstanceId"):
+        resources[bulk.INSTANCE] = [row["InstanceId"]]
 
-        for resource in stack_resources:
-            resource_type = resource.get("ResourceType")
-            physical_id = resource.get("PhysicalResourceId")
+    if row.get("StackId") or not resources:
+        stack_id = row.get("StackId") or bulk.get_product_stack_id(row["ProvisionedProductId"])
+        print(f"Discover resources in stack: {stack_id}")
+        for kind, ids in bulk.get_stack_resources(stack_id).items():
+            known = resources.setdefault(kind, [])
+            known.extend(i for i in ids if i not in known)
 
-            if resource_type == "AWS::Batch::JobDefinition":
-                result["JobDefinitionArn"] = physical_id
-            elif resource_type == "AWS::Batch::ComputeEnvironment":
-                result["ComputeEnvironmentArn"] = physical_id
-            elif resource_type == "AWS::Batch::SchedulingPolicy":
-                result["SchedulingPolicyArn"] = physical_id
-            elif resource_type == "AWS::Batch::JobQueue":
-                result["JobQueueArn"] = physical_id
+    return resources
 
-        return result
-
-    except cf_client.exceptions.ClientError as e:
-        print(f"Error retrieving stack resources: {e}")
-        return {}
 
+def change_owner(row: dict, synapse_tags: list):
+    """
+    Changes the owner of a provisioned product and re-tags its resources.
 
-def main():
-    args = get_args()
-    new_owner_arn = args.NewOwnerArn
-    new_account_id, new_user_id = get_account_and_user_id_from_arn(new_owner_arn)
+    Parameters:
+    - row: dict → a manifest row, ProvisionedProductId and NewOwnerArn are
+      required, StackId, BucketName and InstanceId are optional
+    - synapse_tags: list → the Synapse tags of the new owner
+    """
+    new_owner_arn = row["NewOwnerArn"]
 
     # Execute a Service catalog change owner action
-    sc_client = boto3.client("servicecatalog")
+    sc_client = utils.get_client("servicecatalog")
     print(f"Executing Service Catalog change owner action for product "
-          f"{args.ProvisionedProductId} to new owner {new_owner_arn}")
+          f"{row['ProvisionedProductId']} to new owner {new_owner_arn}")
     response = sc_client.update_provisioned_product_properties(
-        ProvisionedProductId=args.ProvisionedProductId,
+        ProvisionedProductId=row["ProvisionedProductId"],
         ProvisionedProductProperties={
             "OWNER": new_owner_arn
         }
     )
     print(f"Service Catalog change owner response: {response}")
 
-    # Update tags for service catalog products
+    resources = get_resources(row)
+    print(f"Update tags on resources: {resources}")
+
+    # Get the existing synapse user id of each bucket before it is re-tagged
+    existing_user_ids = {
+        bucket_name: utils.get_synapse_owner_id(set_bucket_tags.get_bucket_tags(bucket_name))
+        for bucket_name in resources.get(bulk.BUCKET, [])
+    }
+    bulk.tag_resources(resources, synapse_tags)
+    print("Tags updated successfully.")
+
+    # Update the bucket policies to allow new owner access
+    for bucket_name, existing_user_id in existing_user_ids.items():
+        print(f"Update policy on bucket: {bucket_name}")
+        update_bucket_principal_arn(bucket_name, existing_user_id, new_owner_arn)
+
+def get_new_owner_tags(new_owner_arn: str) -> list:
+    """
+    Derives the Synapse tags of a new owner, always looking up the owner's
+    Synapse profile and team fresh.
+    """
+    new_account_id, new_user_id = get_account_and_user_id_from_arn(new_owner_arn)
+    utils.invalidate_synapse_user(new_user_id)
+    return utils.get_synapse_tags(new_user_id)
+
+def read_manifest(path: str) -> list:
+    """
+    Reads the rows of a CSV (with a header row) or JSONL manifest file.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    for row in rows:
+        if not row.get("ProvisionedProductId") or not row.get("NewOwnerArn"):
+            raise ValueError(f"Manifest row {row} requires ProvisionedProductId and NewOwnerArn")
+    return rows
+
+def run_manifest(rows: list, result_file: str, max_workers: int = 10) -> int:
+    """
+    Changes the owner of every product in a manifest. The rows are grouped by
+    new owner so that each owner's Synapse tags are derived once, then the
+    rows are processed concurrently. Each owner and each row has its own
+    retry budget.
+
+    Returns:
+    - the number of rows that failed
+    """
+    failed = 0
+
+    with open(result_file, "w") as results, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def record(index, row, error=None):
+            nonlocal failed
+            result = {"Row": index}
+            result.update({field: row.get(field) for field in MANIFEST_FIELDS if row.get(field)})
+            result["Status"] = "FAILED" if error else "SUCCESS"
+            if error:
+                result["Error"] = str(error)
+                failed += 1
+            results.write(json.dumps(result) + "\n")
+            results.flush()
+            print(f"Row {index} {result['Status']}: {row['ProvisionedProductId']}"
+                  + (f" {error}" if error else ""))
+
+        owners = {}
+        for index, row in enumerate(rows, 1):
+            owners.setdefault(row["NewOwnerArn"], []).append((index, row))
+        print(f"Changing owner of {len(rows)} products to {len(owners)} owners")
+
+        owner_futures = {executor.submit(retry.run, get_new_owner_tags, arn): arn for arn in owners}
+        row_futures = {}
+        for future in as_completed(owner_futures):
+            owner_rows = owners[owner_futures[future]]
+            try:
+                synapse_tags = future.result()
+            except Exception as e:
+                for index, row in owner_rows:
+                    record(index, row, e)
+                continue
+            for index, row in owner_rows:
+                row_futures[executor.submit(retry.run, change_owner, row, synapse_tags)] = (index, row)
+
+        for future in as_completed(row_futures):
+            index, row = row_futures[future]
+            try:
+                future.result()
+                record(index, row)
+            except Exception as e:
+                record(index, row, e)
+
+    print(f"Changed owner of {len(rows) - failed} products, {failed} failed, "
+          f"results written to {result_file}")
+    return failed
+
+
+def main():
+    args = get_args()
     os.environ["TEAM_TO_ROLE_ARN_MAP_PARAM_NAME"] = "/service-catalog/TeamToRoleArnMap"
-    if args.StackId:
-        stack_id = args.StackId
-        print(f"StackId: {stack_id}")
-        event = {"StackId": stack_id}
-        stack_name = stack_id.split("stack/")[1].split("/")[0]
-        try:
-            # monkey patch to return the Synapse owner id from the passed in OwnerArn
-            utils.get_synapse_owner_id = lambda tags: new_user_id
-
-            # monkey patch to return a dict of batch resource ARNs from the list of cloudformation resources
-            batch_resources = get_batch_resource_arns(stack_name)
-            utils.get_property_value = lambda event, key: batch_resources
-
-            print(f"Update tags on batch resources: {batch_resources}")
-            set_batch_tags.create_or_update(event, None)
-            print("Batch tags updated successfully.")
-        except Exception as e:
-            print(f"Failed to update batch resources: {e}")
-            sys.exit(1)
-    if args.BucketName:
-        bucket_name = args.BucketName
-        event = {"ResourceProperties":{"BucketName": bucket_name}}
-        try:
-            # Get existing synapse user id
-            bucket_tags = set_bucket_tags.get_bucket_tags(bucket_name)
-            existing_user_id = utils.get_synapse_owner_id(bucket_tags)
-
-            # monkey patch to return the Synapse owner id from the passed in OwnerArn
-            utils.get_synapse_owner_id = lambda tags: new_user_id
-
-            print(f"Update tags on bucket: {bucket_name}")
-            set_bucket_tags.create_or_update(event, None)
-            print("Bucket tags updated successfully.")
-
-            # Update the bucket policy to allow new owner access
-            print(f"Update policy on bucket: {bucket_name}")
-            update_bucket_principal_arn(bucket_name, existing_user_id, new_owner_arn)
-        except Exception as e:
-            print(f"Failed to update bucket: {e}")
-            sys.exit(1)
-    if args.InstanceId:
-        instance_id = args.InstanceId
-        event = {"ResourceProperties":{"InstanceId": instance_id}}
-        try:
-            # monkey patch to return the Synapse owner id from the passed in OwnerArn
-            utils.get_synapse_owner_id = lambda tags: new_user_id
-
-            print(f"Update tags on EC2 instance: {instance_id}")
-            set_instance_tags.create_or_update(event, None)
-            print("Instance tags updated successfully.")
-        except Exception as e:
-            print(f"Failed to update instance: {e}")
+
+    if args.Manifest:
+        failed = run_manifest(read_manifest(args.Manifest), args.ResultFile, args.MaxWorkers)
+        if failed:
             sys.exit(1)
+        return
+
+    row = {field: getattr(args, field) for field in MANIFEST_FIELDS}
+    try:
+        change_owner(row, get_new_owner_tags(args.NewOwnerArn))
+    except Exception as e:
+        print(f"Failed to change owner: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
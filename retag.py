@@ -0,0 +1,147 @@
+# A wrapper script to re-tag the resources of many Service Catalog provisioned
+# products at once, i.e. after a change to the tag schema.
+#
+# Usage:
+#   AWS_PROFILE=my-aws-profile AWS_DEFAULT_REGION=us-east-1 pipenv run retag --help
+#
+# Example to re-tag some provisioned products:
+#   pipenv run retag --ProvisionedProductIds pp-j6npiwvn72hjg pp-mycpuogt2i45s
+# Example to re-tag every product of a portfolio, resumable if interrupted:
+#   pipenv run retag \
+#   --TagFilter aws:servicecatalog:portfolioArn=arn:aws:catalog:us-east-1:999999999999:portfolio/port-abcdefghijklm \
+#   --Checkpoint retag-checkpoint.jsonl
+# Example to re-tag a portfolio's products in several accounts and regions,
+# the roles are assumed with the credentials of the AWS profile:
+#   pipenv run retag \
+#   --TagFilter aws:servicecatalog:portfolioArn \
+#   --Regions us-east-1 us-west-2 \
+#   --RoleArns arn:aws:iam::111111111111:role/SynapseTagger arn:aws:iam::222222222222:role/SynapseTagger
+
+import argparse
+import logging
+import os
+import sys
+import set_tags.bulk as bulk
+import set_tags.retry as retry
+import set_tags.targets as targets
+
+
+def get_args():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Re-tag the resources of Service Catalog provisioned products."
+    )
+    parser.add_argument(
+        "--ProvisionedProductIds",
+        help="The identifiers of the provisioned products",
+        nargs="+",
+        default=[]
+    )
+    parser.add_argument(
+        "--StackIds",
+        help="The CloudFormation stack IDs of the provisioned products",
+        nargs="+",
+        default=[]
+    )
+    parser.add_argument(
+        "--TagFilter",
+        help="Re-tag the stacks with a tag, KEY or KEY=VALUE, may be repeated",
+        action="append",
+        default=[]
+    )
+    parser.add_argument(
+        "--Checkpoint",
+        help="A file recording the re-tagged stacks, they are skipped when run again",
+        default=None
+    )
+    parser.add_argument(
+        "--Regions",
+        help="Re-tag the stacks in each of these regions, default is the profile's region",
+        nargs="+",
+        default=[]
+    )
+    parser.add_argument(
+        "--RoleArns",
+        help="Re-tag the stacks in each account by assuming a role in it, default is the profile's account",
+        nargs="+",
+        default=[]
+    )
+    parser.add_argument(
+        "--MaxWorkers",
+        help="The max number of stacks re-tagged concurrently",
+        type=int,
+        default=10
+    )
+
+    args = parser.parse_args()
+    if not (args.ProvisionedProductIds or args.StackIds or args.TagFilter):
+        parser.error("one of --ProvisionedProductIds, --StackIds or --TagFilter is required")
+    return args
+
+def get_tag_filters(tag_filters: list) -> dict:
+    """
+    Converts KEY or KEY=VALUE strings to a dict of tag key to values.
+    """
+    filters = {}
+    for tag_filter in tag_filters:
+        key, _, value = tag_filter.partition("=")
+        values = filters.setdefault(key, [])
+        if value:
+            values.append(value)
+    return filters
+
+
+def get_stack_ids(args, multi_target: bool) -> list:
+    """
+    Finds the stacks to re-tag in the current target. With many targets each
+    of the --StackIds is only re-tagged in the target that owns it.
+    """
+    stack_ids = [
+        stack_id for stack_id in args.StackIds
+        if not multi_target or targets.get_current().owns(stack_id)
+    ]
+    for provisioned_product_id in args.ProvisionedProductIds:
+        try:
+            stack_ids.append(retry.run(bulk.get_product_stack_id, provisioned_product_id))
+        except ValueError:
+            # a product is only in one of the targets
+            if not multi_target:
+                raise
+    if args.TagFilter:
+        stack_ids.extend(bulk.get_filtered_stack_ids(get_tag_filters(args.TagFilter)))
+    return stack_ids
+
+
+def get_unowned_stack_ids(stack_ids: list, target_list: list) -> list:
+    """
+    Finds the stacks that are not in the account and region of any target.
+    """
+    return [
+        stack_id for stack_id in stack_ids
+        if not any(target.owns(stack_id) for target in target_list)
+    ]
+
+
+def main():
+    args = get_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    os.environ.setdefault("TEAM_TO_ROLE_ARN_MAP_PARAM_NAME", "/service-catalog/TeamToRoleArnMap")
+
+    target_list = targets.get_targets(args.Regions, args.RoleArns)
+    if len(target_list) == 1:
+        with targets.use(target_list[0]):
+            failures = bulk.retag_stacks(get_stack_ids(args, False), args.Checkpoint, args.MaxWorkers)
+    else:
+        failures = bulk.retag_targets(
+            target_list, lambda: get_stack_ids(args, True), args.Checkpoint, args.MaxWorkers)
+        for stack_id in get_unowned_stack_ids(args.StackIds, target_list):
+            failures[stack_id] = "not in the account and region of any of the --Regions and --RoleArns"
+    for stack_id, error in failures.items():
+        print(f"Failed to re-tag {stack_id}: {error}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
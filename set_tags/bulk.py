@@ -0,0 +1,314 @@
+import json
+import logging
+import os
+import threading
+import time
+import set_tags.logs as logs
+import set_tags.retry as retry
+import set_tags.targets as targets
+import set_tags.utils as utils
+import set_tags.set_batch_tags as set_batch_tags
+import set_tags.set_bucket_tags as set_bucket_tags
+import set_tags.set_instance_tags as set_instance_tags
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+# Map of the cloudformation resource types that can be tagged to the kind
+# of tagger that handles them
+BUCKET = 'bucket'
+INSTANCE = 'instance'
+VOLUME = 'volume'
+BATCH = 'batch'
+RESOURCE_TYPE_TAGGERS = {
+  'AWS::S3::Bucket': BUCKET,
+  'AWS::EC2::Instance': INSTANCE,
+  'AWS::EC2::Volume': VOLUME,
+  'AWS::Batch::JobDefinition': BATCH,
+  'AWS::Batch::ComputeEnvironment': BATCH,
+  'AWS::Batch::SchedulingPolicy': BATCH,
+  'AWS::Batch::JobQueue': BATCH,
+}
+
+
+def get_product_stack_id(provisioned_product_id):
+  '''Get the cloudformation stack of a service catalog provisioned product
+  :param provisioned_product_id: the provisioned product ID, i.e. pp-j6npiwvn72hjg
+  :return the stack ID
+  '''
+  client = utils.get_client('servicecatalog')
+  response = client.search_provisioned_products(
+    AccessLevelFilter={'Key': 'Account', 'Value': 'self'},
+    Filters={'SearchQuery': [f'id:{provisioned_product_id}']}
+  )
+  for product in response.get('ProvisionedProducts', []):
+    if product.get('Id') == provisioned_product_id and product.get('PhysicalId'):
+      return product['PhysicalId']
+
+  raise ValueError(f'No stack found for provisioned product {provisioned_product_id}')
+
+def get_filtered_stack_ids(tag_filters):
+  '''Find the cloudformation stacks that match tag filters
+  :param tag_filters: a dict of tag key to list of values, an empty list
+         matches any value. i.e. {'aws:servicecatalog:portfolioArn': ['arn...']}
+  :return a list of stack IDs
+  '''
+  client = utils.get_client('resourcegroupstaggingapi')
+  paginator = client.get_paginator('get_resources')
+  pages = paginator.paginate(
+    ResourceTypeFilters=['cloudformation:stack'],
+    TagFilters=[{'Key': key, 'Values': values} for key, values in tag_filters.items()]
+  )
+  stack_ids = []
+  for page in pages:
+    for resource in page['ResourceTagMappingList']:
+      stack_ids.append(resource['ResourceARN'])
+
+  return stack_ids
+
+def get_stack_resources(stack_id):
+  '''Find the resources in a stack that can be tagged
+  :param stack_id: the cloudformation stack ID
+  :return a dict of tagger kind to a list of physical resource IDs
+  '''
+  client = utils.get_cfn_client()
+  paginator = client.get_paginator('list_stack_resources')
+  resources = {}
+  for page in paginator.paginate(StackName=stack_id):
+    for summary in page['StackResourceSummaries']:
+      kind = RESOURCE_TYPE_TAGGERS.get(summary['ResourceType'])
+      if kind and summary.get('PhysicalResourceId'):
+        resources.setdefault(kind, []).append(summary['PhysicalResourceId'])
+
+  return resources
+
+def get_stack_owner_id(stack_id):
+  '''Get the synapse owner of a provisioned product stack
+  :param stack_id: the cloudformation stack ID
+  :return the synapse user id
+  '''
+  owner_id = utils.get_synapse_owner_id(utils.get_cfn_stack_tags(stack_id))
+  if not owner_id:
+    raise ValueError(f'No synapse owner found in the tags of stack {stack_id}')
+
+  return owner_id
+
+def tag_resources(resources, synapse_tags):
+  '''Apply synapse tags to resources concurrently. Each bucket and instance
+  is tagged on its own while volumes and batch resources are tagged together.
+  The number of concurrent taggers can be tuned with the STACK_TAG_MAX_WORKERS
+  environment variable.
+  :param resources: a dict of tagger kind to a list of physical resource IDs
+  :param synapse_tags: the synapse tags to apply
+  '''
+  tasks = {}
+  for bucket_name in resources.get(BUCKET, []):
+    tasks[bucket_name] = (set_bucket_tags.tag_bucket, bucket_name)
+  for instance_id in resources.get(INSTANCE, []):
+    tasks[instance_id] = (set_instance_tags.tag_instance, instance_id)
+  if resources.get(VOLUME):
+    tasks[VOLUME] = (set_instance_tags.tag_volumes, resources[VOLUME])
+  if resources.get(BATCH):
+    tasks[BATCH] = (set_batch_tags.tag_batch_resources, resources[BATCH])
+  if not tasks:
+    return
+
+  failures = {}
+  max_workers = min(len(tasks), utils.get_env_var_int('STACK_TAG_MAX_WORKERS', 8))
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {
+      targets.submit(executor, tagger, resource, synapse_tags): name
+      for name, (tagger, resource) in tasks.items()
+    }
+    for future in as_completed(futures):
+      try:
+        future.result()
+      except Exception as e:
+        log.error(f'Failed to apply tags to {futures[future]}: {e}')
+        failures[futures[future]] = str(e)
+
+  if failures:
+    raise Exception(f'Failed to apply tags to resources: {failures}')
+
+def tag_stack_resources(stack_id, synapse_tags):
+  '''Apply synapse tags to all the resources in a stack that can be tagged
+  :param stack_id: the cloudformation stack ID
+  :param synapse_tags: the synapse tags to apply
+  :return a dict of tagger kind to the number of resources tagged
+  '''
+  resources = get_stack_resources(stack_id)
+  tag_resources(resources, synapse_tags)
+  return {kind: len(ids) for kind, ids in resources.items()}
+
+
+def load_checkpoint(path):
+  '''Get the stacks that were already re-tagged from a checkpoint file
+  :param path: the checkpoint file, None for no checkpoint
+  :return a set of stack IDs
+  '''
+  done = set()
+  if path and os.path.exists(path):
+    with open(path) as f:
+      for line in f:
+        if line.strip():
+          done.add(json.loads(line)['StackId'])
+
+  return done
+
+
+class Progress:
+  '''Report progress and record completed stacks in a checkpoint file'''
+
+  def __init__(self, total, checkpoint_path=None):
+    self.total = total
+    self.completed = 0
+    self.failed = 0
+    self.checkpoint_path = checkpoint_path
+    self.start = time.monotonic()
+    self._lock = threading.Lock()
+
+  def done(self, stack_id, tagged):
+    with self._lock:
+      self.completed += 1
+      if self.checkpoint_path:
+        with open(self.checkpoint_path, 'a') as f:
+          f.write(json.dumps({'StackId': stack_id, 'Tagged': tagged}) + '\n')
+      self.report(f'{stack_id} tagged {tagged}')
+
+  def fail(self, stack_id, error):
+    with self._lock:
+      self.failed += 1
+      self.report(f'{stack_id} failed: {error}')
+
+  def report(self, message):
+    elapsed = time.monotonic() - self.start
+    finished = self.completed + self.failed
+    log.info(f'[{finished}/{self.total} {elapsed:.0f}s, {self.failed} failed] {message}')
+
+
+def retag_stacks(stack_ids, checkpoint_path=None, max_workers=10, stack_targets=None):
+  '''Re-tag the resources of many provisioned product stacks.
+  The synapse tags are derived once for each distinct owner, then the stacks
+  are tagged concurrently. Stacks recorded in the checkpoint file are skipped
+  and each stack is added to it once tagged so that a run can be resumed.
+  Each stack, and each owner, has its own retry budget so that a long run
+  does not use up its retries on the first throttles.
+  :param stack_ids: the cloudformation stack IDs
+  :param checkpoint_path: the checkpoint file, None for no checkpoint
+  :param max_workers: the max number of stacks tagged concurrently
+  :param stack_targets: a dict of stack ID to the targets.Target that the
+         stack is in, None when every stack is in the current target
+  :return a dict of stack ID to error message for the stacks that failed
+  '''
+  stack_targets = stack_targets or {}
+  current_target = targets.get_current()
+  done = load_checkpoint(checkpoint_path)
+  pending = [stack_id for stack_id in dict.fromkeys(stack_ids) if stack_id not in done]
+  log.info(f'Re-tag {len(pending)} stacks, {len(done)} already done')
+  progress = Progress(len(pending), checkpoint_path)
+  failures = {}
+  budgets = {stack_id: retry.new_budget() for stack_id in pending}
+
+  def run_stack(stack_id, fn, *args):
+    with retry.use(budgets[stack_id]):
+      return targets.run(stack_targets.get(stack_id, current_target), fn, *args)
+
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    # resolve the owner of each stack
+    owners = {}
+    futures = {
+      executor.submit(run_stack, stack_id, get_stack_owner_id, stack_id): stack_id
+      for stack_id in pending
+    }
+    for future in as_completed(futures):
+      stack_id = futures[future]
+      try:
+        owners[stack_id] = future.result()
+      except Exception as e:
+        failures[stack_id] = str(e)
+        progress.fail(stack_id, e)
+
+    # derive the synapse tags once for each owner, whichever target their
+    # stacks are in
+    owner_tags = {}
+    futures = {
+      targets.submit(executor, retry.run, utils.get_synapse_tags, owner_id): owner_id
+      for owner_id in set(owners.values())
+    }
+    for future in as_completed(futures):
+      owner_id = futures[future]
+      try:
+        owner_tags[owner_id] = future.result()
+      except Exception as e:
+        log.error(f'Failed to get synapse tags for owner {owner_id}: {e}')
+        owner_tags[owner_id] = e
+
+    # tag the resources of each stack
+    futures = {}
+    for stack_id, owner_id in owners.items():
+      synapse_tags = owner_tags[owner_id]
+      if isinstance(synapse_tags, Exception):
+        failures[stack_id] = str(synapse_tags)
+        progress.fail(stack_id, synapse_tags)
+        continue
+      futures[executor.submit(run_stack, stack_id, tag_stack_resources, stack_id, synapse_tags)] = stack_id
+    for future in as_completed(futures):
+      stack_id = futures[future]
+      try:
+        progress.done(stack_id, future.result())
+      except Exception as e:
+        failures[stack_id] = str(e)
+        progress.fail(stack_id, e)
+
+  log.info(f'Re-tagged {progress.completed} stacks, {len(failures)} failed')
+  return failures
+
+def find_target_stacks(target_list, get_stack_ids, max_workers=10):
+  '''Find stacks in many targets concurrently
+  :param target_list: the targets.Targets to look in
+  :param get_stack_ids: a function that returns the IDs of the stacks to
+         re-tag in the current target
+  :param max_workers: the max number of targets looked in concurrently
+  :return a dict of stack ID to the Target that it is in, and a dict of
+          target name to error message for the targets that failed
+  '''
+  stack_targets = {}
+  failures = {}
+  with ThreadPoolExecutor(max_workers=min(len(target_list), max_workers)) as executor:
+    futures = {
+      executor.submit(retry.run, targets.run, target, get_stack_ids): target
+      for target in target_list
+    }
+    for future in as_completed(futures):
+      target = futures[future]
+      try:
+        stack_ids = future.result()
+      except Exception as e:
+        log.error(f'Failed to find stacks in {target}: {e}')
+        failures[str(target)] = str(e)
+        continue
+      log.info(f'Found {len(stack_ids)} stacks in {target}')
+      for stack_id in stack_ids:
+        stack_targets.setdefault(stack_id, target)
+
+  return stack_targets, failures
+
+def retag_targets(target_list, get_stack_ids, checkpoint_path=None, max_workers=10):
+  '''Re-tag the resources of provisioned product stacks in many accounts and
+  regions. The stacks are found in every target concurrently, then the owner
+  of each stack is resolved and the synapse tags of each distinct owner are
+  derived once, whichever targets their stacks are in. Each stack is tagged
+  with clients for its own target, see retag_stacks.
+  :param target_list: the targets.Targets to re-tag stacks in
+  :param get_stack_ids: a function that returns the IDs of the stacks to
+         re-tag in the current target
+  :param checkpoint_path: the checkpoint file, None for no checkpoint
+  :param max_workers: the max number of targets or stacks handled concurrently
+  :return a dict of stack ID, or target name, to error message for the
+          stacks and targets that failed
+  '''
+  stack_targets, failures = find_target_stacks(target_list, get_stack_ids, max_workers)
+  failures.update(retag_stacks(list(stack_targets), checkpoint_path, max_workers, stack_targets))
+  return failures
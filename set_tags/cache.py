@@ -0,0 +1,142 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache:
+  '''A thread safe in-memory cache whose entries expire after a time to live.
+
+  The cache lives as long as the lambda container so it is shared across
+  warm invocations. When a maxsize is given the least recently used entries
+  are evicted to stay within it. It counts hits, misses and refreshes (an
+  entry replaced with a different value) so the calls it saves can be logged.
+  '''
+
+  def __init__(self, maxsize=None, clock=time.monotonic):
+    self.maxsize = maxsize
+    self._clock = clock
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.refreshes = 0
+
+  def get(self, key, default=None):
+    '''Get an unexpired value from the cache
+    :param key: the cache key
+    :param default: the value to return when the key is missing or expired
+    :returns: the cached value
+    '''
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry and entry[1] > self._clock():
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+      self.misses += 1
+      return default
+
+  def get_stale(self, key, default=None):
+    '''Get a value from the cache even if it has expired, the value can
+    be used to revalidate an expired entry
+    :param key: the cache key
+    :param default: the value to return when the key is missing
+    :returns: the cached value
+    '''
+    with self._lock:
+      entry = self._entries.get(key)
+      return entry[0] if entry else default
+
+  def put(self, key, value, ttl):
+    '''Put a value in the cache
+    :param key: the cache key
+    :param value: the value to cache
+    :param ttl: the number of seconds before the value expires
+    '''
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry and entry[0] != value:
+        self.refreshes += 1
+      self._entries[key] = (value, self._clock() + ttl)
+      self._entries.move_to_end(key)
+      if self.maxsize is not None:
+        while len(self._entries) > self.maxsize:
+          self._entries.popitem(last=False)
+
+  def invalidate(self, key):
+    '''Remove a value from the cache'''
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def clear(self):
+    '''Remove all values from the cache and reset the counters'''
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
+      self.refreshes = 0
+
+  def stats(self):
+    '''Get the cache counters'''
+    with self._lock:
+      return {
+        'size': len(self._entries),
+        'hits': self.hits,
+        'misses': self.misses,
+        'refreshes': self.refreshes,
+      }
+
+
+class SingleFlight:
+  '''Make sure that only one lookup of a key is in flight at a time.
+
+  A thread that asks for a key while another thread is looking it up waits
+  for that lookup and gets its result, or its error, rather than repeating
+  it. This lets a request join a lookup that the pre-warmer has started.
+  It counts the lookups that were joined.
+  '''
+
+  def __init__(self):
+    self._flights = {}
+    self._lock = threading.Lock()
+    self.joined = 0
+
+  def do(self, key, fn):
+    '''Look up a key, or wait for the lookup of it that is in flight
+    :param key: the lookup key
+    :param fn: the function that looks up the key
+    :returns: the result of fn
+    '''
+    with self._lock:
+      flight = self._flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self._flights[key] = _Flight()
+      else:
+        self.joined += 1
+
+    if not leader:
+      flight.done.wait()
+      if flight.error is not None:
+        raise flight.error
+      return flight.result
+
+    try:
+      flight.result = fn()
+      return flight.result
+    except BaseException as e:
+      flight.error = e
+      raise
+    finally:
+      with self._lock:
+        del self._flights[key]
+      flight.done.set()
+
+
+class _Flight:
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
@@ -0,0 +1,37 @@
+import logging
+import os
+import set_tags.logs as logs
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+
+def get_env_var_int(env_var, default):
+  '''Get the integer value of an optional environment variable
+  :param env_var: the environment variable
+  :param default: the value to use when the env var is not set or not an integer
+  :returns: the environment variable's value as an int
+  '''
+  value = os.getenv(env_var)
+  if not value:
+    return default
+  try:
+    return int(value)
+  except ValueError:
+    log.warning(f'environment variable {env_var} is not an integer: {value}')
+    return default
+
+def get_env_var_float(env_var, default):
+  '''Get the float value of an optional environment variable
+  :param env_var: the environment variable
+  :param default: the value to use when the env var is not set or not a number
+  :returns: the environment variable's value as a float
+  '''
+  value = os.getenv(env_var)
+  if not value:
+    return default
+  try:
+    return float(value)
+  except ValueError:
+    log.warning(f'environment variable {env_var} is not a number: {value}')
+    return default
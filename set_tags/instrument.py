@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from set_tags import retry
+
+# Timing spans of the current invocation, the time of a span that runs in
+# several threads at once is summed across the threads
+_spans = {}
+_spans_lock = threading.Lock()
+
+
+def is_enabled():
+  '''Whether timing spans are recorded, turn off with METRICS_ENABLED=false'''
+  return os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+
+def record(name, seconds):
+  '''Add the time of a span
+  :param name: the span name, i.e. 'synapse_profile'
+  :param seconds: the time spent in the span
+  '''
+  with _spans_lock:
+    total, count = _spans.get(name, (0, 0))
+    _spans[name] = (total + seconds, count + 1)
+
+@contextmanager
+def span(name):
+  '''Time a block of code'''
+  if not is_enabled():
+    yield
+    return
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    record(name, time.perf_counter() - start)
+
+def get_spans():
+  '''Get the spans of the current invocation
+  :return a dict of span name to (total seconds, count)
+  '''
+  with _spans_lock:
+    return dict(_spans)
+
+def reset():
+  with _spans_lock:
+    _spans.clear()
+
+
+def get_emf_record(handler_name, seconds, properties=None):
+  '''Build a CloudWatch embedded metric format record of the spans
+  :param handler_name: the name of the lambda handler, used as a dimension
+  :param seconds: the duration of the invocation
+  :param properties: extra properties to add to the record
+  :return the record as a dict
+  '''
+  spans = get_spans()
+  record = {
+    '_aws': {
+      'Timestamp': int(time.time() * 1000),
+      'CloudWatchMetrics': [{
+        'Namespace': os.getenv('METRICS_NAMESPACE', 'SynapseTagger'),
+        'Dimensions': [['Handler']],
+        'Metrics': [{'Name': 'invocation', 'Unit': 'Milliseconds'}] + [
+          {'Name': name, 'Unit': 'Milliseconds'} for name in sorted(spans)
+        ],
+      }],
+    },
+    'Handler': handler_name,
+    'invocation': round(seconds * 1000, 3),
+    'SpanCounts': {name: count for name, (_, count) in spans.items()},
+  }
+  for name, (total, _) in spans.items():
+    record[name] = round(total * 1000, 3)
+  record.update(properties or {})
+  return record
+
+@contextmanager
+def invocation(handler_name, **properties):
+  '''Time a lambda invocation and print its spans, along with the retry
+  metrics, as one embedded metric format record that CloudWatch turns into
+  metrics
+  :param handler_name: the name of the lambda handler
+  :param properties: extra properties to add to the record, i.e. RequestType
+  :return the properties dict, more properties can be added to it
+  '''
+  if not is_enabled():
+    yield properties
+    return
+  reset()
+  start = time.perf_counter()
+  try:
+    yield properties
+  finally:
+    properties['RetryMetrics'] = retry.get_metrics()
+    print(json.dumps(get_emf_record(handler_name, time.perf_counter() - start, properties)))
+
+
+class BotocoreInstrument:
+  '''Record a span named aws.<service>.<operation> for every call made by an
+  AWS client, retries included. A call that fails without a response, i.e.
+  on a connection error, is recorded too.'''
+
+  def register(self, events):
+    events.register('before-parameter-build', self.before_call)
+    events.register('after-call', self.after_call)
+    # botocore only sends the exception and the context with this event
+    events.register('after-call-error', self.after_call_error)
+
+  def before_call(self, model, context, **kwargs):
+    context['instrument_span'] = (
+      f'aws.{model.service_model.service_name}.{model.name}', time.perf_counter())
+
+  def after_call(self, context, **kwargs):
+    self.end_call(context)
+
+  def after_call_error(self, context, exception=None, **kwargs):
+    self.end_call(context)
+
+  def end_call(self, context):
+    name, start = context.pop('instrument_span', (None, None))
+    if name is not None and is_enabled():
+      record(name, time.perf_counter() - start)
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import time
+import uuid
+import set_tags.logs as logs
+import set_tags.utils as utils
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+# The kinds of tagging jobs
+BUCKET = 'bucket'
+INSTANCE = 'instance'
+BATCH = 'batch'
+
+
+class FileQueue:
+  '''A queue of jobs kept as files in a directory, a local stand-in for SQS.
+  Each job is a JSON file whose name sorts in the order it was sent.
+  '''
+
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+  def send(self, job):
+    '''Add a job to the queue
+    :param job: a json serializable dict
+    :return the job's message ID
+    '''
+    message_id = f'{time.time_ns():020d}-{uuid.uuid4().hex}'
+    path = os.path.join(self.directory, f'{message_id}.json')
+    # write to a temporary file first so a partial job is never received
+    with open(f'{path}.tmp', 'w') as f:
+      json.dump(job, f)
+    os.replace(f'{path}.tmp', path)
+    return message_id
+
+  def receive(self, max_messages=10):
+    '''Get the oldest jobs from the queue, they stay in the queue until deleted
+    :param max_messages: the max number of jobs to get, None for all jobs
+    :return a list of (message ID, job) tuples
+    '''
+    names = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+    messages = []
+    for name in names[:max_messages]:
+      with open(os.path.join(self.directory, name)) as f:
+        messages.append((name[:-len('.json')], json.load(f)))
+    return messages
+
+  def delete(self, message_id):
+    '''Remove a job from the queue'''
+    os.remove(os.path.join(self.directory, f'{message_id}.json'))
+
+
+def get_queue_url():
+  '''The SQS queue for tagging jobs, set with TAG_JOB_QUEUE_URL'''
+  return os.getenv('TAG_JOB_QUEUE_URL')
+
+def get_queue_dir():
+  '''The directory of a local file queue for tagging jobs, set with TAG_JOB_QUEUE_DIR'''
+  return os.getenv('TAG_JOB_QUEUE_DIR')
+
+def is_async():
+  '''Whether tagging is done in the background by the tag worker'''
+  return bool(get_queue_url() or get_queue_dir())
+
+def enqueue(kind, resource, stack_id=None):
+  '''Send a tagging job to the tag worker
+  :param kind: the kind of job, i.e. BUCKET
+  :param resource: the resource to tag, a bucket name, an instance ID or a
+         list of batch resource ARNs
+  :param stack_id: the cloudformation stack ID of the resource
+  :return the job's message ID
+  '''
+  job = {'Kind': kind, 'Resource': resource, 'StackId': stack_id}
+  if get_queue_url():
+    client = utils.get_client('sqs')
+    response = client.send_message(QueueUrl=get_queue_url(), MessageBody=json.dumps(job))
+    message_id = response['MessageId']
+  else:
+    message_id = FileQueue(get_queue_dir()).send(job)
+  log.info(f'Enqueued tagging job {message_id}: {job}')
+  return message_id
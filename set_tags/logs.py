@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+
+# The default max number of characters of a value, i.e. an AWS response, that
+# is written to a log message
+DEFAULT_MAX_VALUE_LENGTH = 2000
+
+
+def get_log_level():
+  '''The level of the set_tags loggers, set with the LOG_LEVEL environment
+  variable (default INFO)
+  :return a logging level name, i.e. 'DEBUG'
+  '''
+  level = os.getenv('LOG_LEVEL', 'INFO').upper()
+  if not isinstance(logging.getLevelName(level), int):
+    logging.getLogger(__name__).warning(f'LOG_LEVEL is not a log level: {level}')
+    return 'INFO'
+  return level
+
+def get_max_value_length():
+  '''The max number of characters of a logged value, set with
+  LOG_MAX_VALUE_LENGTH, 0 to never truncate'''
+  # set_tags.env logs at the level set here, so it is imported on first use
+  from set_tags.env import get_env_var_int
+  return get_env_var_int('LOG_MAX_VALUE_LENGTH', DEFAULT_MAX_VALUE_LENGTH)
+
+
+class Truncated:
+  '''A log message argument that is only formatted when the message is
+  emitted, and cut to LOG_MAX_VALUE_LENGTH characters.
+
+  i.e. log.debug('describe_tags response: %s', Truncated(response))
+  '''
+
+  def __init__(self, value, format=str):
+    self.value = value
+    self.format = format
+
+  def __str__(self):
+    text = self.format(self.value)
+    limit = get_max_value_length()
+    if limit and len(text) > limit:
+      return f'{text[:limit]}... [{len(text) - limit} more characters]'
+    return text
+
+
+def to_json(value):
+  return json.dumps(value, sort_keys=False, default=str)
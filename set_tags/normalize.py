@@ -0,0 +1,133 @@
+import logging
+import re
+import string
+
+from dataclasses import dataclass, field
+from set_tags import logs
+from set_tags.tagset import TagSet
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+# Characters allowed in tag keys and values, every other character is
+# replaced with a space.
+# https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/Using_Tags.html#tag-restrictions
+VALID_TAG_CHARS = string.ascii_letters + string.digits + '.+=_:@/-'
+REPLACEMENT_CHAR = ' '
+# Joins the texts of a tag list so they are translated in one pass, it is
+# kept by the batch table and split on afterwards
+SEPARATOR = '\x00'
+
+
+class Translator:
+  '''Replace the characters that are not in a charset using tables that are
+  built once. ASCII text, by far the most common, goes through a bytes
+  translation table in a single C pass, other text through a precompiled
+  pattern. A list of ASCII texts is joined and translated at once.
+  '''
+
+  def __init__(self, valid_chars, replacement=REPLACEMENT_CHAR):
+    self.replacement = replacement
+    valid = frozenset(valid_chars)
+    self.ascii_table = bytes(
+      i if chr(i) in valid else ord(replacement) for i in range(256))
+    self.pattern = re.compile(f'[^{re.escape(valid_chars)}]')
+    # the same table that keeps the separator of joined texts
+    self.batch_table = SEPARATOR.encode('ascii') + self.ascii_table[1:]
+
+  def translate(self, text):
+    if text.isascii():
+      return text.encode('ascii').translate(self.ascii_table).decode('ascii')
+    return self.pattern.sub(self.replacement, text)
+
+  def translate_many(self, texts):
+    '''Translate a list of texts in a single pass'''
+    joined = SEPARATOR.join(texts)
+    if not joined.isascii() or joined.count(SEPARATOR) != len(texts) - 1:
+      # translate each text so that a few non ASCII texts do not widen the
+      # whole list, or a text contains the separator
+      return [self.translate(text) for text in texts]
+    joined = joined.encode('ascii').translate(self.batch_table).decode('ascii')
+    return joined.split(SEPARATOR) if texts else []
+
+
+@dataclass(frozen=True)
+class TagRules:
+  '''Tag restrictions, the defaults are the published limits of EC2, S3
+  buckets and Batch'''
+  max_key_length: int = 128
+  max_value_length: int = 256
+  max_tags: int = 50
+  # keys with this prefix, in any case, are reserved for AWS
+  reserved_prefix: str = 'aws:'
+  valid_chars: str = VALID_TAG_CHARS
+
+  translator: Translator = field(init=False, repr=False, compare=False)
+
+  def __post_init__(self):
+    object.__setattr__(self, 'translator', Translator(self.valid_chars))
+
+
+# EC2, S3 and Batch publish the same tag restrictions, one set of rules
+# serves them all
+DEFAULT = TagRules()
+
+
+def sanitize(text, rules=DEFAULT):
+  '''Replace the characters that are not allowed in a tag with spaces
+  :param text: a tag key or value
+  :param rules: the TagRules
+  :return the sanitized text
+  '''
+  return rules.translator.translate(text)
+
+def normalize_kp(tags, rules=DEFAULT):
+  '''Make tags acceptable to a service in one pass. Invalid characters are
+  replaced with spaces, keys and values are cut to the max length and tags
+  with a reserved key prefix are dropped.
+  :param tags: a dictionary of key pairs, i.e. {'string':'string'}, or a TagSet
+  :param rules: the TagRules
+  :return the normalized dictionary of key pairs, keys that become the same
+          keep the last value
+  :raise ValueError when there are more tags than allowed
+  '''
+  # each step works on all the tags at once, the common case of valid,
+  # short, unreserved tags never loops over the tags in python
+  keys = rules.translator.translate_many(list(tags))
+  values = rules.translator.translate_many(list(tags.values()))
+  if max(map(len, keys), default=0) > rules.max_key_length:
+    keys = [key[:rules.max_key_length] for key in keys]
+  if max(map(len, values), default=0) > rules.max_value_length:
+    values = [value[:rules.max_value_length] for value in values]
+  normalized = dict(zip(keys, values))
+
+  reserved = SEPARATOR + rules.reserved_prefix
+  if reserved in (SEPARATOR + SEPARATOR.join(normalized)).lower():
+    for key in list(normalized):
+      if key.lower().startswith(rules.reserved_prefix):
+        log.warning(f'Skip tag {key}, the {rules.reserved_prefix} prefix is reserved')
+        del normalized[key]
+
+  if len(normalized) > rules.max_tags:
+    raise ValueError(f'{len(normalized)} tags is more than the {rules.max_tags} allowed')
+
+  return normalized
+
+def check_count(tags, rules=DEFAULT):
+  '''Make sure that all the tags of a resource fit within the max number of
+  tags. Tags with a reserved key prefix are set by AWS and do not count.
+  :param tags: a dictionary of key pairs or a TagSet
+  :param rules: the TagRules
+  :raise ValueError when there are more tags than allowed
+  '''
+  count = sum(1 for key in tags if not key.lower().startswith(rules.reserved_prefix))
+  if count > rules.max_tags:
+    raise ValueError(f'{count} tags is more than the {rules.max_tags} allowed')
+
+def normalize_tags(tags, rules=DEFAULT):
+  '''Make tags acceptable to a service, see normalize_kp
+  :param tags: tags in any form accepted by TagSet
+  :param rules: the TagRules
+  :return the normalized TagSet, a duplicated key keeps its last value
+  '''
+  return TagSet.wrap(normalize_kp(TagSet.of(tags), rules))
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+import time
+import set_tags.logs as logs
+import set_tags.utils as utils
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+_thread = None
+_lock = threading.Lock()
+_last_saved = None
+
+
+def is_enabled():
+  '''Whether to pre-warm, only in lambda containers and unless
+  PREWARM_ENABLED is false'''
+  return (bool(os.getenv('AWS_LAMBDA_FUNCTION_NAME')) and
+          os.getenv('PREWARM_ENABLED', 'true').lower() != 'false')
+
+def is_provisioned():
+  '''Whether the container is initialized ahead of requests by provisioned concurrency'''
+  return os.getenv('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency'
+
+def get_role_names():
+  '''The IAM roles to look up, set with PREWARM_ROLE_NAMES (comma separated)'''
+  return [name.strip() for name in os.getenv('PREWARM_ROLE_NAMES', '').split(',') if name.strip()]
+
+def get_recent_owners_param_name():
+  '''The SSM parameter of recently seen synapse owners, set with RECENT_OWNERS_PARAM_NAME'''
+  return os.getenv('RECENT_OWNERS_PARAM_NAME')
+
+
+def load_recent_owner_ids():
+  '''Get the recently seen synapse owners saved by any container
+  :return a list of synapse user ids, the most recent first
+  '''
+  name = get_recent_owners_param_name()
+  if not name:
+    return []
+  parameter = utils.get_ssm_parameter(name)
+  if not parameter:
+    return []
+  return json.loads(parameter['Parameter']['Value'])
+
+def save_recent_owner_ids():
+  '''Add the synapse owners seen by this container to the saved owners. It
+  is saved at most every PREWARM_SAVE_INTERVAL seconds (default 900) by each
+  container to stay well within the SSM write rate.
+  '''
+  global _last_saved
+  name = get_recent_owners_param_name()
+  owner_ids = utils.get_recent_owner_ids()
+  if not name or not owner_ids:
+    return
+
+  now = time.monotonic()
+  with _lock:
+    if _last_saved is not None and now - _last_saved < utils.get_env_var_int('PREWARM_SAVE_INTERVAL', 900):
+      return
+    _last_saved = now
+
+  try:
+    saved = load_recent_owner_ids()
+    merged = list(dict.fromkeys(owner_ids + saved))[:utils.RECENT_OWNER_IDS_MAX]
+    if merged != saved:
+      utils.get_ssm_client().put_parameter(
+        Name=name, Value=json.dumps(merged), Type='String', Overwrite=True)
+      log.info(f'Saved {len(merged)} recent synapse owners to {name}')
+  except Exception as e:
+    log.warning(f'Failed to save the recent synapse owners to {name}: {e}')
+
+
+def warm_owners(owner_ids, team_ids):
+  '''Look up the profiles and teams of synapse owners concurrently'''
+  def warm_owner(owner_id):
+    utils.get_synapse_user_profile(owner_id)
+    utils.get_synapse_user_team_id(owner_id, team_ids)
+
+  with ThreadPoolExecutor(max_workers=min(len(owner_ids), 4)) as executor:
+    futures = {executor.submit(warm_owner, owner_id): owner_id for owner_id in owner_ids}
+    for future in as_completed(futures):
+      try:
+        future.result()
+      except Exception as e:
+        log.warning(f'Failed to pre-warm synapse owner {futures[future]}: {e}')
+
+def warm():
+  '''Do the lookups that the first request of a container would otherwise
+  wait on: the TeamToRoleArnMap parameter, the synapse client and its
+  connection, the IAM roles in PREWARM_ROLE_NAMES and the profiles and teams
+  of the PREWARM_OWNER_COUNT (default 10) most recently seen owners. The
+  lookups are cached as if a request had made them. A failed step is
+  logged and skipped, the request will make the lookup again.
+  '''
+  start = time.perf_counter()
+  team_ids = []
+  try:
+    team_ids = utils.get_synapse_team_ids()
+  except Exception as e:
+    log.warning(f'Failed to pre-warm the synapse team IDs: {e}')
+  try:
+    utils.get_synapse_client()
+  except Exception as e:
+    log.warning(f'Failed to pre-warm the synapse client: {e}')
+  for role_name in get_role_names():
+    try:
+      utils.get_role_id(role_name)
+    except Exception as e:
+      log.warning(f'Failed to pre-warm IAM role {role_name}: {e}')
+
+  owner_ids = []
+  try:
+    owner_ids = load_recent_owner_ids()[:utils.get_env_var_int('PREWARM_OWNER_COUNT', 10)]
+  except Exception as e:
+    log.warning(f'Failed to load the recent synapse owners: {e}')
+  if owner_ids:
+    warm_owners(owner_ids, team_ids)
+
+  log.info(f'Pre-warmed {len(team_ids)} team IDs, {len(get_role_names())} IAM roles and '
+           f'{len(owner_ids)} synapse owners in {time.perf_counter() - start:.2f}s')
+
+def start():
+  '''Start pre-warming during the container's init phase, once per container.
+  With provisioned concurrency init runs ahead of any request so the lookups
+  are done before it ends. Otherwise they are done in the background while
+  the first request starts, a request that needs a lookup that is still in
+  flight waits for it rather than repeating it.
+  '''
+  global _thread
+  if not is_enabled():
+    return
+  with _lock:
+    if _thread is not None:
+      return
+    _thread = threading.Thread(target=warm, name='prewarm', daemon=True)
+    _thread.start()
+  if is_provisioned():
+    _thread.join()
+
+def wait(timeout=None):
+  '''Wait for pre-warming to finish, mostly useful for testing'''
+  thread = _thread
+  if thread is not None:
+    thread.join(timeout)
+
+def reset():
+  '''Forget that pre-warming was started, mostly useful for testing'''
+  global _thread, _last_saved
+  wait()
+  with _lock:
+    _thread = None
+    _last_saved = None
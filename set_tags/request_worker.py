@@ -0,0 +1,247 @@
+import json
+import logging
+import random
+import string
+import urllib.request
+import set_tags.bulk as bulk
+import set_tags.instrument as instrument
+import set_tags.jobs as jobs
+import set_tags.logs as logs
+import set_tags.prewarm as prewarm
+import set_tags.retry as retry
+import set_tags.set_batch_tags as set_batch_tags
+import set_tags.set_bucket_tags as set_bucket_tags
+import set_tags.set_instance_tags as set_instance_tags
+import set_tags.targets as targets
+import set_tags.utils as utils
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'
+# The max length of the reason sent to cloudformation
+MAX_REASON_LENGTH = 256
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+
+@dataclass
+class Request:
+  '''A custom resource request received from SQS'''
+  message_id: str
+  attempt: int
+  event: dict
+  kind: str = None
+  resource: object = None
+  owner_id: str = None
+  # the InstanceContext of an instance request, looked up with its owner
+  instance: object = None
+  error: Exception = None
+  # invalid requests fail right away, they would fail again
+  retryable: bool = True
+
+  def should_retry(self, max_attempts):
+    '''Whether SQS should deliver a failed request again. Only throttled and
+    transient errors are retried, any other error, i.e. a missing synapse
+    owner or an AWS 4xx error, would fail again.'''
+    return (self.retryable and self.attempt < max_attempts and
+            retry.classify_exception(self.error) is not None)
+
+
+def get_event(record):
+  '''Get the custom resource event of an SQS record, the event is either the
+  message body or, when the queue is subscribed to the custom resource's SNS
+  topic without raw message delivery, wrapped in an SNS notification
+  '''
+  body = json.loads(record['body'])
+  if body.get('Type') == 'Notification' and 'Message' in body:
+    return json.loads(body['Message'])
+  return body
+
+def get_job(event):
+  '''Get the kind of tagging and the resource to tag from the properties of a
+  custom resource event
+  :return a (kind, resource) tuple, i.e. ('bucket', 'my-bucket')
+  '''
+  resource_properties = event.get('ResourceProperties', {})
+  if 'BucketName' in resource_properties:
+    return jobs.BUCKET, set_bucket_tags.get_bucket_name(event)
+  if 'InstanceId' in resource_properties:
+    return jobs.INSTANCE, set_instance_tags.get_instance_id(event)
+  if 'BatchResources' in resource_properties:
+    batch_resources = utils.get_property_value(event, 'BatchResources')
+    return jobs.BATCH, list(batch_resources.values())
+  raise ValueError('Expected a BucketName, InstanceId or BatchResources property')
+
+def get_owner_id(request):
+  '''Look up the synapse owner of the resource of a request'''
+  if request.kind == jobs.BUCKET:
+    tags = set_bucket_tags.get_bucket_tags(request.resource)
+    owner_id = utils.get_synapse_owner_id(tags)
+  elif request.kind == jobs.INSTANCE:
+    request.instance = set_instance_tags.get_instance_context(request.resource)
+    owner_id = utils.get_synapse_owner_id(request.instance.tags)
+  else:
+    # workaround for AWS bug in issue SC-379 (AWS case 9477374541)
+    return bulk.get_stack_owner_id(utils.get_stack_id(request.event))
+  if not owner_id:
+    raise ValueError(f'No synapse owner found in the tags of {request.resource}')
+  return owner_id
+
+def tag(request, synapse_tags):
+  '''Apply synapse tags to the resource of a request'''
+  if request.kind == jobs.BUCKET:
+    set_bucket_tags.tag_bucket(request.resource, synapse_tags)
+  elif request.kind == jobs.INSTANCE:
+    set_instance_tags.tag_instance(request.resource, synapse_tags, request.instance)
+  else:
+    set_batch_tags.tag_batch_resources(request.resource, synapse_tags)
+
+
+def run_all(executor, fn, items):
+  '''Call fn on each item concurrently
+  :return a list of (item, result, error) tuples in the order of the items
+  '''
+  futures = [targets.submit(executor, fn, item) for item in items]
+  results = []
+  for item, future in zip(items, futures):
+    try:
+      results.append((item, future.result(), None))
+    except Exception as e:
+      results.append((item, None, e))
+  return results
+
+def tag_requests(requests):
+  '''Apply synapse tags to the resources of many requests. The owner of each
+  resource is looked up first, then the synapse tags are derived once for
+  each distinct owner and the resources are tagged. Each step is concurrent,
+  the number of concurrent lookups can be tuned with the
+  REQUEST_WORKER_MAX_WORKERS environment variable. A request that fails has
+  its error set.
+  :param requests: the create and update Requests
+  '''
+  if not requests:
+    return
+
+  max_workers = min(len(requests), utils.get_env_var_int('REQUEST_WORKER_MAX_WORKERS', 10))
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    with instrument.span('owner_resolution'):
+      for request, owner_id, error in run_all(executor, get_owner_id, requests):
+        request.owner_id, request.error = owner_id, error
+    pending = [request for request in requests if request.error is None]
+
+    owner_ids = list(dict.fromkeys(request.owner_id for request in pending))
+    log.info(f'Derive synapse tags of {len(owner_ids)} owners for {len(pending)} requests')
+    owner_tags = {
+      owner_id: (synapse_tags, error)
+      for owner_id, synapse_tags, error in run_all(executor, utils.get_synapse_tags, owner_ids)
+    }
+
+    def tag_request(request):
+      synapse_tags, error = owner_tags[request.owner_id]
+      if error:
+        raise error
+      tag(request, synapse_tags)
+
+    for request, _, error in run_all(executor, tag_request, pending):
+      request.error = error
+
+
+def get_physical_resource_id(event):
+  '''Keep the physical ID of an existing resource, or make one the way
+  crhelper does so the custom resource can move between handlers'''
+  if event.get('PhysicalResourceId'):
+    return event['PhysicalResourceId']
+  suffix = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+  return '_'.join([event['StackId'].split('/')[1], event['LogicalResourceId'], suffix])
+
+def send_response(event, status, reason=''):
+  '''Send the result of a custom resource request to cloudformation
+  :param event: the custom resource event
+  :param status: SUCCESS or FAILED
+  :param reason: why the request failed
+  '''
+  if len(reason) > MAX_REASON_LENGTH:
+    reason = f'ERROR: (truncated) {reason[-(MAX_REASON_LENGTH - 20):]}'
+  body = json.dumps({
+    'Status': status,
+    'Reason': reason,
+    'PhysicalResourceId': get_physical_resource_id(event),
+    'StackId': event['StackId'],
+    'RequestId': event['RequestId'],
+    'LogicalResourceId': event['LogicalResourceId'],
+    'NoEcho': False,
+    'Data': {},
+  }).encode()
+  response_request = urllib.request.Request(
+    event['ResponseURL'], data=body, method='PUT',
+    headers={'Content-Type': '', 'Content-Length': str(len(body))})
+  with urllib.request.urlopen(response_request, timeout=30) as response:
+    log.info(f'Sent {status} for {event["LogicalResourceId"]} in {event["StackId"]}, '
+             f'cloudformation returned {response.status}')
+
+def respond(request, max_attempts):
+  '''Send the result of a request to cloudformation, unless it failed with a
+  throttled or transient error and SQS will deliver it again
+  :return True when the request is done, False when SQS should retry it
+  '''
+  if request.error is not None:
+    log.error(f'Request {request.message_id} (attempt {request.attempt}) failed: {request.error}')
+    if request.should_retry(max_attempts):
+      return False
+  try:
+    if request.error is None:
+      send_response(request.event, SUCCESS)
+    else:
+      send_response(request.event, FAILED, str(request.error))
+  except Exception as e:
+    log.error(f'Failed to respond to request {request.message_id}: {e}')
+    return False
+  return True
+
+
+def handler(event, context):
+  '''Lambda handler for SQS batches of custom resource requests. All of the
+  requests in a batch are tagged together, each request gets its own
+  response. A request that failed with a throttled or transient error is
+  retried by SQS and fails in cloudformation on its last attempt,
+  CFN_REQUEST_MAX_ATTEMPTS (default 3) which must not be more than the
+  queue's max receive count. Any other error fails in cloudformation right
+  away.
+  '''
+  retry.start_invocation()
+  failures = []
+  requests = []
+  records = event.get('Records', [])
+  max_attempts = utils.get_env_var_int('CFN_REQUEST_MAX_ATTEMPTS', 3)
+  with instrument.invocation('request_worker', Requests=len(records)) as properties:
+    for record in records:
+      message_id = record['messageId']
+      attempt = int(record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
+      try:
+        request = Request(message_id, attempt, get_event(record))
+      except Exception as e:
+        # there is no request to respond to, the message goes to the dead letter queue
+        log.error(f'Message {message_id} is not a custom resource request: {e}')
+        failures.append({'itemIdentifier': message_id})
+        continue
+      log.debug('Received event: %s', logs.Truncated(request.event, logs.to_json))
+      log.info(f'{request.event.get("RequestType")} request {message_id} (attempt {attempt})')
+      if request.event.get('RequestType') in ('Create', 'Update'):
+        try:
+          request.kind, request.resource = get_job(request.event)
+        except Exception as e:
+          request.error = e
+          request.retryable = False
+      requests.append(request)
+
+    tag_requests([request for request in requests if request.kind and request.error is None])
+    for request in requests:
+      if not respond(request, max_attempts):
+        failures.append({'itemIdentifier': request.message_id})
+    properties['FailedRequests'] = len(failures)
+
+  prewarm.save_recent_owner_ids()
+  return {'batchItemFailures': failures}
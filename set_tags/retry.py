@@ -0,0 +1,335 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from set_tags import logs
+from set_tags.env import get_env_var_float, get_env_var_int
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+# Error codes that AWS services return when a caller is throttled
+THROTTLE_ERROR_CODES = {
+  'Throttling',
+  'ThrottlingException',
+  'ThrottledException',
+  'RequestThrottledException',
+  'TooManyRequestsException',
+  'ProvisionedThroughputExceededException',
+  'RequestLimitExceeded',
+  'RequestThrottled',
+  'SlowDown',
+  'EC2ThrottledException',
+  'PriorRequestNotComplete',
+}
+# Error codes and HTTP status codes of errors that are worth retrying
+TRANSIENT_ERROR_CODES = {
+  'InternalError',
+  'InternalFailure',
+  'ServiceUnavailable',
+  'RequestTimeout',
+  'RequestTimeoutException',
+}
+THROTTLE_STATUS_CODES = {429}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+
+THROTTLE = 'throttle'
+TRANSIENT = 'transient'
+
+
+class AdaptiveRateLimiter:
+  '''Limit the rate of requests to a service once it starts throttling.
+
+  Requests are not limited until the first throttle. Then the allowed rate is
+  cut to a little less than the rate of requests that succeeded in the last
+  second, and it grows back by about one request per second every second.
+  The limit is lifted once the rate has doubled without another throttle.
+  Throttles within a second of a cut are not counted again, they are from
+  requests that were sent before the cut.
+  '''
+
+  def __init__(self, min_rate=1, clock=time.monotonic, sleep=None):
+    self.min_rate = min_rate
+    self.rate = None
+    self._ceiling = None
+    self._next_send = 0
+    self._last_cut = None
+    self._succeeded = deque()
+    self._clock = clock
+    self._sleep = sleep
+    self._lock = threading.Lock()
+
+  def acquire(self):
+    '''Wait until a request can be sent
+    :return the number of seconds waited
+    '''
+    with self._lock:
+      if self.rate is None:
+        return 0
+      now = self._clock()
+      send_at = max(now, self._next_send)
+      self._next_send = send_at + 1 / self.rate
+    wait = send_at - now
+    if wait > 0:
+      (self._sleep or time.sleep)(wait)
+    return wait
+
+  def on_throttle(self):
+    '''Slow down after a request was throttled'''
+    with self._lock:
+      now = self._clock()
+      if self._last_cut is not None and now - self._last_cut < 1:
+        return
+      self._last_cut = now
+      self._expire(now)
+      accepted = len(self._succeeded) * 0.9
+      self.rate = max(self.min_rate, min(self.rate or accepted, accepted))
+      self._ceiling = self.rate * 2
+      self._next_send = now
+
+  def on_success(self):
+    '''Speed up after a request succeeded'''
+    with self._lock:
+      now = self._clock()
+      self._succeeded.append(now)
+      self._expire(now)
+      if self.rate is None:
+        return
+      self.rate += 1 / self.rate
+      if self.rate >= self._ceiling:
+        self.rate = None
+        self._ceiling = None
+
+  def _expire(self, now):
+    while self._succeeded and self._succeeded[0] < now - 1:
+      self._succeeded.popleft()
+
+
+class RetryBudget:
+  '''A number of retries shared by all the calls of a unit of work, i.e. a
+  lambda invocation or one stack of a bulk run, so that a struggling service
+  can not hold it until it times out.
+  '''
+
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.remaining = capacity
+    self._lock = threading.Lock()
+
+  def take(self):
+    '''Take a retry from the budget
+    :return False when the budget is used up
+    '''
+    with self._lock:
+      if self.remaining <= 0:
+        return False
+      self.remaining -= 1
+      return True
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+# The retry budget of the unit of work in progress, see use(). It is a
+# context variable so that concurrent units, i.e. the stacks of a bulk run,
+# each spend their own budget. Calls outside of any unit share the budget of
+# the invocation.
+_budget = contextvars.ContextVar('retry_budget', default=None)
+_invocation_budget = None
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def get_limiter(service):
+  '''Get the shared rate limiter of a service'''
+  with _limiters_lock:
+    if service not in _limiters:
+      _limiters[service] = AdaptiveRateLimiter(
+        min_rate=get_env_var_float('RETRY_MIN_RATE', 1))
+    return _limiters[service]
+
+def new_budget():
+  '''Get a full retry budget, its size is set with the RETRY_BUDGET
+  environment variable'''
+  return RetryBudget(get_env_var_int('RETRY_BUDGET', 20))
+
+def get_budget():
+  '''Get the retry budget of the current unit of work, or of the current
+  invocation outside of any unit'''
+  budget = _budget.get()
+  if budget is not None:
+    return budget
+  global _invocation_budget
+  with _limiters_lock:
+    if _invocation_budget is None:
+      _invocation_budget = new_budget()
+    return _invocation_budget
+
+@contextmanager
+def use(budget=None):
+  '''Spend the retries of the calls, within the block, from a budget
+  :param budget: the RetryBudget of a unit of work, None for a new one
+  '''
+  token = _budget.set(budget or new_budget())
+  try:
+    yield
+  finally:
+    _budget.reset(token)
+
+def run(fn, *args, **kwargs):
+  '''Call fn with its own retry budget'''
+  with use():
+    return fn(*args, **kwargs)
+
+def start_invocation():
+  '''Reset the retry budget and metrics at the start of a lambda invocation,
+  rate limits are kept for as long as the container lives'''
+  global _invocation_budget
+  with _limiters_lock:
+    _invocation_budget = None
+  with _metrics_lock:
+    _metrics.clear()
+
+def reset():
+  '''Reset all retry state, mostly useful for testing'''
+  start_invocation()
+  with _limiters_lock:
+    _limiters.clear()
+
+def count(service, metric, value=1):
+  with _metrics_lock:
+    _metrics[(service, metric)] += value
+
+def get_metrics():
+  '''Get the retry metrics of the current invocation
+  :return a dict of service to a dict of metric to value,
+          i.e. {'ec2': {'calls': 3, 'retries': 1, 'throttles': 1}}
+  '''
+  with _metrics_lock:
+    metrics = {}
+    for (service, metric), value in _metrics.items():
+      metrics.setdefault(service, {})[metric] = value
+    return metrics
+
+
+def classify(error_code=None, status_code=None, exception=None):
+  '''Classify a failed call
+  :return THROTTLE, TRANSIENT or None when the call should not be retried
+  '''
+  if error_code in THROTTLE_ERROR_CODES or status_code in THROTTLE_STATUS_CODES:
+    return THROTTLE
+  if error_code in TRANSIENT_ERROR_CODES or status_code in TRANSIENT_STATUS_CODES:
+    return TRANSIENT
+  if exception is not None and is_connection_error(exception):
+    return TRANSIENT
+  return None
+
+def classify_exception(e):
+  '''Classify an exception raised by an AWS or Synapse call'''
+  response = getattr(e, 'response', None)
+  if isinstance(response, dict):
+    # botocore ClientError
+    error_code = response.get('Error', {}).get('Code')
+    status_code = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return classify(error_code, status_code, e)
+  # requests HTTPError, i.e. SynapseHTTPError
+  status_code = getattr(response, 'status_code', None)
+  return classify(status_code=status_code, exception=e)
+
+def is_connection_error(e):
+  '''Whether an exception is a broken or timed out connection'''
+  names = {cls.__name__ for cls in type(e).__mro__}
+  return bool(names & {
+    'ConnectionError', 'ConnectionClosedError', 'EndpointConnectionError',
+    'ReadTimeoutError', 'ConnectTimeoutError', 'Timeout',
+  })
+
+def get_backoff(attempt):
+  '''Get a full jitter exponential backoff delay in seconds
+  :param attempt: the number of attempts made so far
+  '''
+  base = get_env_var_float('RETRY_BASE_DELAY', 0.1)
+  cap = get_env_var_float('RETRY_MAX_DELAY', 5)
+  return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+def should_retry(service, kind, attempt, max_attempts):
+  '''Record a failed attempt and decide whether to retry it
+  :param service: the service name, i.e. 'ec2'
+  :param kind: the kind of failure, THROTTLE, TRANSIENT or None
+  :param attempt: the number of attempts made so far
+  :param max_attempts: the max number of attempts
+  :return the number of seconds to wait before retrying, None to not retry
+  '''
+  if kind == THROTTLE:
+    count(service, 'throttles')
+    get_limiter(service).on_throttle()
+  if kind is None or attempt >= max_attempts:
+    return None
+  if not get_budget().take():
+    count(service, 'budget_exhausted')
+    log.warning(f'Retry budget exhausted, not retrying {service} call')
+    return None
+  delay = get_backoff(attempt)
+  count(service, 'retries')
+  log.debug('Retry %s call after %s in %.2fs (attempt %s)', service, kind, delay, attempt)
+  return delay
+
+
+def call(service, fn, *args, max_attempts=None, **kwargs):
+  '''Call a function with rate limiting and retries of throttled and transient
+  errors, i.e. a Synapse REST call
+  :param service: the service name used for rate limits and metrics
+  :param fn: the function to call
+  :param max_attempts: the max number of attempts, defaults to RETRY_MAX_ATTEMPTS
+  :return the function's return value
+  '''
+  max_attempts = max_attempts or get_env_var_int('RETRY_MAX_ATTEMPTS', 3)
+  limiter = get_limiter(service)
+  attempt = 0
+  while True:
+    attempt += 1
+    limiter.acquire()
+    count(service, 'calls')
+    try:
+      result = fn(*args, **kwargs)
+    except Exception as e:
+      delay = should_retry(service, classify_exception(e), attempt, max_attempts)
+      if delay is None:
+        raise
+      time.sleep(delay)
+      continue
+    limiter.on_success()
+    return result
+
+
+class BotocoreRetryHandler:
+  '''Apply the rate limits, retries and metrics to every request of an AWS
+  client by hooking into botocore's request events. It replaces botocore's
+  own retries, so clients should be configured with a single attempt.
+  '''
+
+  def __init__(self, service, max_attempts):
+    self.service = service
+    self.max_attempts = max_attempts
+
+  def register(self, events):
+    events.register('before-send', self.before_send)
+    events.register('needs-retry', self.needs_retry)
+
+  def before_send(self, **kwargs):
+    get_limiter(self.service).acquire()
+    count(self.service, 'calls')
+
+  def needs_retry(self, response=None, attempts=None, caught_exception=None, **kwargs):
+    if caught_exception is not None:
+      kind = classify(exception=caught_exception)
+    else:
+      http_response, parsed = response
+      kind = classify(parsed.get('Error', {}).get('Code'), http_response.status_code)
+      if kind is None and http_response.status_code < 400:
+        get_limiter(self.service).on_success()
+        return None
+    return should_retry(self.service, kind, attempts, self.max_attempts)
@@ -1,14 +1,22 @@
-import json
 import logging
+import set_tags.instrument as instrument
+import set_tags.jobs as jobs
+import set_tags.logs as logs
+import set_tags.normalize as normalize
+import set_tags.prewarm as prewarm
+import set_tags.retry as retry
+import set_tags.targets as targets
 import set_tags.utils as utils
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from crhelper import CfnResource
+from set_tags.tagset import TagSet
 
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+log.setLevel(logs.get_log_level())
 
 helper = CfnResource(
-  json_logging=False, log_level='DEBUG', boto_level='CRITICAL')
+  json_logging=False, log_level=logs.get_log_level(), boto_level='CRITICAL')
 
 
 def get_batch_tags(resource_arn):
@@ -20,7 +28,7 @@ def get_batch_tags(resource_arn):
   response = client.list_tags_for_resource(
     resourceArn=resource_arn
   )
-  log.debug(f'batch list_tags_for_resouce response: {response}')
+  log.debug('batch list_tags_for_resouce response: %s', logs.Truncated(response))
   tags = response.get('tags')
   if not tags or len(tags) == 0:
     raise Exception(f'No tags returned, received: {response}')
@@ -39,36 +47,105 @@ def apply_tags(resource_arn, tags):
     resourceArn=resource_arn,
     tags=tags
   )
-  log.debug(f'Apply tags response: {response}')
+  log.debug('Apply tags response: %s', logs.Truncated(response))
+
+def update_tags(resource_arn, tags):
+  '''Apply only the tags that a batch resource is missing
+
+  resource_arn: the ARN of the AWS resource
+  tags: A dictionary of key pairs or a TagSet
+      i.e. tags:{'string':'string'}
+  '''
+  client = utils.get_batch_client()
+  response = client.list_tags_for_resource(
+    resourceArn=resource_arn
+  )
+  missing_tags = TagSet.wrap(response.get('tags', {})).diff(tags)
+  if not missing_tags:
+    log.debug('Resource %s is already tagged, skip apply tags', resource_arn)
+    return
+
+  apply_tags(resource_arn, missing_tags.as_dict())
+
+def apply_tags_to_resources(resource_arns, tags):
+  '''Apply tags to batch resources concurrently, only the missing tags are
+  applied to each resource. The number of concurrent requests can be tuned
+  with the BATCH_TAG_MAX_WORKERS environment variable.
+
+  resource_arns: the ARNs of the AWS resources
+  tags: A dictionary of key pairs or a TagSet
+      i.e. tags:{'string':'string'}
+  '''
+  if not resource_arns:
+    return
+
+  failures = {}
+  max_workers = min(len(resource_arns), utils.get_env_var_int('BATCH_TAG_MAX_WORKERS', 10))
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {
+      targets.submit(executor, update_tags, resource_arn, tags): resource_arn
+      for resource_arn in resource_arns
+    }
+    for future in as_completed(futures):
+      resource_arn = futures[future]
+      try:
+        future.result()
+      except Exception as e:
+        log.error(f'Failed to apply tags to resource {resource_arn}: {e}')
+        failures[resource_arn] = str(e)
+
+  if failures:
+    raise Exception(f'Failed to apply tags to batch resources: {failures}')
+
+def tag_batch_resources(resource_arns, synapse_tags):
+  '''Apply synapse tags to batch resources
+
+  resource_arns: the ARNs of the AWS resources
+  synapse_tags: the synapse tags in any form accepted by TagSet
+      i.e. tags:[{'Key':'string', 'Value':'string'}]
+  '''
+  with instrument.span('tag_merge'):
+    synapse_tags = normalize.normalize_tags(synapse_tags)
+  log.debug('Apply tags: %s to resources %s', logs.Truncated(synapse_tags), logs.Truncated(resource_arns))
+  with instrument.span('apply'):
+    apply_tags_to_resources(resource_arns, synapse_tags)
+
+def tag_stack_batch_resources(stack_id, resource_arns):
+  '''Apply the synapse tags of a stack's owner to batch resources
+
+  stack_id: the cloudformation stack ID
+  resource_arns: the ARNs of the AWS resources
+  '''
+  # workaround for AWS bug in issue SC-379 (AWS case 9477374541)
+  # get synapse owner id from cloudformation stack
+  with instrument.span('owner_resolution'):
+    stack_tags = utils.get_cfn_stack_tags(stack_id)
+    synapse_owner_id = utils.get_synapse_owner_id(stack_tags)
+  synapse_tags = utils.get_synapse_tags(synapse_owner_id)
+  tag_batch_resources(resource_arns, synapse_tags)
 
 @helper.create
 @helper.update
 def create_or_update(event, context):
   '''Handles customm resource create and update events'''
-  log.debug('Received event: ' + json.dumps(event, sort_keys=False))
+  log.debug('Received event: %s', logs.Truncated(event, logs.to_json))
   log.info('Start Lambda processing')
 
-  # workaround for AWS bug in issue SC-379 (AWS case 9477374541)
-  # get synapse owner id from cloudformation stack
   stack_id = utils.get_stack_id(event)
-  stack_tags = utils.get_cfn_stack_tags(stack_id)
-  synapse_owner_id = utils.get_synapse_owner_id(stack_tags)
-
-  # get synapse tags and format it into dict key/pair
-  synapse_tags_kv = utils.get_synapse_tags(synapse_owner_id)
-  synapse_tags_kp = utils.format_tags_kv_kp(synapse_tags_kv)
 
   # get passed in batch resource ARNs
   batch_resources = utils.get_property_value(event, "BatchResources")
-  log.debug(f'batch_resources from template: {batch_resources}')
+  log.debug('batch_resources from template: %s', logs.Truncated(batch_resources))
   if not batch_resources:
     raise Exception(f'No batch resources passed in, received: {batch_resources}')
 
-  # apply tags to each batch resource
-  for key, value in batch_resources.items():
-    resource_arn = value
-    log.debug(f'Apply tags: {synapse_tags_kp} to resource {resource_arn}')
-    apply_tags(resource_arn, synapse_tags_kp)
+  if jobs.is_async():
+    with instrument.span('enqueue'):
+      jobs.enqueue(jobs.BATCH, list(batch_resources.values()), stack_id)
+    return
+
+  # apply tags to all batch resources at once
+  tag_stack_batch_resources(stack_id, list(batch_resources.values()))
 
 @helper.delete
 def delete(event, context):
@@ -78,4 +155,11 @@ def delete(event, context):
 
 def handler(event, context):
   '''Lambda handler, invokes custom resource helper'''
-  helper(event, context)
+  retry.start_invocation()
+  with instrument.invocation('set_batch_tags', RequestType=event.get('RequestType')):
+    helper(event, context)
+  prewarm.save_recent_owner_ids()
+
+
+# warm the lookups of the first request while the container initializes
+prewarm.start()
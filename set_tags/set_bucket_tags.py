@@ -1,16 +1,22 @@
-import json
 import logging
+import set_tags.instrument as instrument
+import set_tags.jobs as jobs
+import set_tags.logs as logs
+import set_tags.normalize as normalize
+import set_tags.prewarm as prewarm
+import set_tags.retry as retry
 import set_tags.utils as utils
 
 from crhelper import CfnResource
+from set_tags.tagset import TagSet
 
 MISSING_BUCKET_NAME_ERROR_MESSAGE = 'BucketName parameter is required'
 
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+log.setLevel(logs.get_log_level())
 
 helper = CfnResource(
-  json_logging=False, log_level='DEBUG', boto_level='CRITICAL')
+  json_logging=False, log_level=logs.get_log_level(), boto_level='CRITICAL')
 
 
 def get_bucket_name(event):
@@ -23,10 +29,12 @@ def get_bucket_name(event):
 
 
 def get_bucket_tags(bucket_name):
-  '''Look up the bucket tags'''
+  '''Look up the bucket tags
+  :return a list of dictionary of key/value pairs
+  '''
   client = utils.get_s3_client()
   response = client.get_bucket_tagging(Bucket=bucket_name)
-  log.debug(f'S3 bucket tags response: {response}')
+  log.debug('S3 bucket tags response: %s', logs.Truncated(response))
   tags = response.get('TagSet')
   if not tags or len(tags) == 0:
     raise Exception(f'No tags returned, received: {response}')
@@ -43,28 +51,54 @@ def apply_tags(name, tags):
       'TagSet': tags
     }
   )
-  log.debug(f'Apply tags response: {response}')
+  log.debug('Apply tags response: %s', logs.Truncated(response))
+
+
+def tag_bucket(bucket_name, synapse_tags=None):
+  '''Apply synapse tags to a bucket
+  :param bucket_name: the bucket name
+  :param synapse_tags: the synapse tags to apply, None to derive them from
+         the synapse owner found in the bucket tags
+  '''
+  with instrument.span('owner_resolution'):
+    bucket_tags = TagSet(get_bucket_tags(bucket_name))
+    if synapse_tags is None:
+      synapse_owner_id = utils.get_synapse_owner_id(bucket_tags)
+  if synapse_tags is None:
+    synapse_tags = utils.get_synapse_tags(synapse_owner_id)
+  # put_bucket_tagging is a replace operation.  need to give it all
+  # tags otherwise it will remove existing tags not in the list
+  #
+  # In case of duplication, Synapse tags should replace existing
+  # bucket tags.
+  with instrument.span('tag_merge'):
+    synapse_tags = normalize.normalize_tags(synapse_tags)
+    all_tags = bucket_tags.override(synapse_tags)
+    # the bucket's own tags count towards the limit too
+    normalize.check_count(all_tags)
+    missing_tags = bucket_tags.diff(all_tags)
+  if not missing_tags:
+    log.info(f'Bucket {bucket_name} is already tagged, skip apply tags')
+    return
+
+  log.debug('Apply tags: %s to bucket %s', logs.Truncated(all_tags), bucket_name)
+  with instrument.span('apply'):
+    apply_tags(bucket_name, all_tags.as_list())
 
 
 @helper.create
 @helper.update
 def create_or_update(event, context):
   '''Handles custom resource create and update events'''
-  log.debug('Received event: ' + json.dumps(event, sort_keys=False))
+  log.debug('Received event: %s', logs.Truncated(event, logs.to_json))
   log.info('Start Lambda processing')
   bucket_name = get_bucket_name(event)
-  bucket_tags = get_bucket_tags(bucket_name)
-  synapse_owner_id = utils.get_synapse_owner_id(bucket_tags)
-  synapse_tags = utils.get_synapse_tags(synapse_owner_id)
-  # put_bucket_tagging is a replace operation.  need to give it all
-  # tags otherwise it will remove existing tags not in the list
-  #
-  # In case of duplication, Synapse tags should replace existing
-  # bucket tags.
-  all_tags = utils.merge_tags(bucket_tags, synapse_tags)
+  if jobs.is_async():
+    with instrument.span('enqueue'):
+      jobs.enqueue(jobs.BUCKET, bucket_name)
+    return
 
-  log.debug(f'Apply tags: {all_tags} to bucket {bucket_name}')
-  apply_tags(bucket_name, all_tags)
+  tag_bucket(bucket_name)
 
 
 @helper.delete
@@ -75,4 +109,11 @@ def delete(event, context):
 
 def handler(event, context):
   '''Lambda handler, invokes custom resource helper'''
-  helper(event, context)
+  retry.start_invocation()
+  with instrument.invocation('set_bucket_tags', RequestType=event.get('RequestType')):
+    helper(event, context)
+  prewarm.save_recent_owner_ids()
+
+
+# warm the lookups of the first request while the container initializes
+prewarm.start()
@@ -1,16 +1,41 @@
-import json
 import logging
+import set_tags.instrument as instrument
+import set_tags.jobs as jobs
+import set_tags.logs as logs
+import set_tags.normalize as normalize
+import set_tags.prewarm as prewarm
+import set_tags.retry as retry
 import set_tags.utils as utils
 
+from botocore.exceptions import ClientError
 from crhelper import CfnResource
+from dataclasses import dataclass
+from set_tags.tagset import TagSet
 
 MISSING_INSTANCE_ID_ERROR_MESSAGE = 'InstanceId parameter is required'
+# The max number of resource IDs accepted by a single EC2 create_tags request
+CREATE_TAGS_MAX_RESOURCES = 1000
+# The max number of values accepted by a single EC2 describe filter
+DESCRIBE_FILTER_MAX_VALUES = 200
 
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+log.setLevel(logs.get_log_level())
 
 helper = CfnResource(
-  json_logging=False, log_level='DEBUG', boto_level='CRITICAL')
+  json_logging=False, log_level=logs.get_log_level(), boto_level='CRITICAL')
+
+
+@dataclass(frozen=True)
+class InstanceContext:
+  '''The state of an instance that is needed to tag it and its attachments'''
+  instance_id: str
+  tags: TagSet
+  volume_ids: list
+  network_interface_ids: list
+
+  @property
+  def attachment_ids(self):
+    return self.volume_ids + self.network_interface_ids
 
 
 def get_instance_id(event):
@@ -22,81 +47,187 @@ def get_instance_id(event):
   return instance_id
 
 
-def get_volume_ids(instance_id):
-  '''Get the IDs of the volumes that are attached to the instance
-  :param id: the instance ID
-  :return a list of volume IDs
+def get_instance_context(instance_id):
+  '''Look up the instance tags along with the IDs of its attached volumes and
+  network interfaces with a single describe_instances call
+  :param instance_id: the instance ID
+  :return an InstanceContext
   '''
   client = utils.get_ec2_client()
-  response = client.describe_volumes(
-    Filters=[
-      {
-        'Name': 'attachment.instance-id',
-        'Values': [instance_id]
-      },
-    ]
-  )
-  volume_ids = []
-  volumes = response['Volumes']
-  for volume in volumes:
-    volume_ids.append(volume['VolumeId'])
-
-  return volume_ids
-
-
-def get_instance_tags(instance_id):
-  '''Look up the instance tags'''
+  response = client.describe_instances(InstanceIds=[instance_id])
+  log.debug('EC2 describe instances response: %s', logs.Truncated(response))
+  instance = response['Reservations'][0]['Instances'][0]
+  tags = instance.get('Tags')
+  if not tags:
+    raise Exception(f'No tags returned for instance {instance_id}')
+
+  volume_ids = [
+    mapping['Ebs']['VolumeId']
+    for mapping in instance.get('BlockDeviceMappings', []) if 'Ebs' in mapping
+  ]
+  network_interface_ids = [
+    network_interface['NetworkInterfaceId']
+    for network_interface in instance.get('NetworkInterfaces', [])
+  ]
+  return InstanceContext(instance_id, TagSet(tags), volume_ids, network_interface_ids)
+
+
+def iter_tags(resource_ids, keys=None):
+  '''Stream the tags of EC2 resources, fetching pages only as they are read
+  :param resource_ids: the IDs of the EC2 resources
+  :param keys: only get the tags with these keys, None for all tags
+  :return a generator of describe_tags tags
+      i.e. {'Key':'string', 'Value':'string', 'ResourceId':'string', 'ResourceType':'string'}
+  '''
+  if not resource_ids:
+    return
+
   client = utils.get_ec2_client()
-  response = client.describe_tags(
-    Filters = [{'Name': 'resource-id', 'Values': [instance_id]}]
-  )
-  log.debug(f'EC2 describe tags response: {response}')
-  tags = response.get('Tags')
-  if not tags or len(tags) == 0:
-    raise Exception(f'No tags returned, received: {response}')
+  paginator = client.get_paginator('describe_tags')
+  for i in range(0, len(resource_ids), DESCRIBE_FILTER_MAX_VALUES):
+    filters = [{'Name': 'resource-id', 'Values': resource_ids[i:i + DESCRIBE_FILTER_MAX_VALUES]}]
+    if keys:
+      filters.append({'Name': 'key', 'Values': list(keys)})
+    for page in paginator.paginate(Filters=filters):
+      log.debug('EC2 describe tags page: %s', logs.Truncated(page['Tags']))
+      yield from page['Tags']
+
+
+def get_resources_tags(resource_ids, keys=None):
+  '''Look up the tags of many EC2 resources
+  :param resource_ids: the IDs of the EC2 resources
+  :param keys: only get the tags with these keys, None for all tags
+  :return a dict of resource ID to a TagSet of the resource's tags
+  '''
+  resources_tags = {resource_id: {} for resource_id in resource_ids}
+  for tag in iter_tags(list(resource_ids), keys):
+    resources_tags[tag['ResourceId']][tag['Key']] = tag['Value']
 
-  return tags
+  return {resource_id: TagSet.wrap(tags) for resource_id, tags in resources_tags.items()}
 
 
-def apply_tags(id, tags):
-  '''Apply tags to an EC2 resource'''
+def group_missing_tags(resources_tags, tags):
+  '''Group EC2 resources by the tags that they are missing
+  :param resources_tags: a dict of resource ID to the resource's current tags
+  :param tags: the tags that every resource should have
+  :return a list of (missing TagSet, resource IDs) tuples, empty when every
+          resource already has all of the tags
+  '''
+  tags = TagSet.of(tags)
+  groups = {}
+  for resource_id, current_tags in resources_tags.items():
+    missing_tags = TagSet.of(current_tags).diff(tags)
+    if missing_tags:
+      groups.setdefault(missing_tags, (missing_tags, []))[1].append(resource_id)
+
+  return list(groups.values())
+
+
+def apply_tags(resource_ids, tags):
+  '''Apply tags to EC2 resources using as few create_tags requests as possible.
+  When a request fails each resource in it is tagged on its own so that one
+  bad resource does not stop the others from being tagged.
+  :param resource_ids: the IDs of the EC2 resources
+  :param tags: A list of dictionary of key/value pairs
+  '''
   client = utils.get_ec2_client()
-  response = client.create_tags(
-    Resources=[id],
-    Tags=tags
-  )
-  log.debug(f'Apply tags response: {response}')
+  failures = {}
+  for i in range(0, len(resource_ids), CREATE_TAGS_MAX_RESOURCES):
+    chunk = resource_ids[i:i + CREATE_TAGS_MAX_RESOURCES]
+    try:
+      response = client.create_tags(
+        Resources=chunk,
+        Tags=tags
+      )
+      log.debug('Apply tags response: %s', logs.Truncated(response))
+    except ClientError as e:
+      if len(chunk) == 1:
+        failures[chunk[0]] = str(e)
+        continue
+      log.warning(f'Failed to apply tags to {chunk}, retrying each resource: {e}')
+      for resource_id in chunk:
+        try:
+          response = client.create_tags(
+            Resources=[resource_id],
+            Tags=tags
+          )
+          log.debug('Apply tags response: %s', logs.Truncated(response))
+        except ClientError as resource_error:
+          failures[resource_id] = str(resource_error)
+
+  if failures:
+    raise Exception(f'Failed to apply tags to resources: {failures}')
+
+
+def tag_volumes(volume_ids, synapse_tags):
+  '''Apply synapse tags to volumes, only the missing tags are applied
+  :param volume_ids: the volume IDs
+  :param synapse_tags: the synapse tags to apply
+  '''
+  synapse_tags = TagSet.of(synapse_tags)
+  resources_tags = get_resources_tags(volume_ids, list(synapse_tags))
+  for missing_tags, resource_ids in group_missing_tags(resources_tags, synapse_tags):
+    log.debug('Apply tags: %s to resources %s', logs.Truncated(missing_tags), logs.Truncated(resource_ids))
+    apply_tags(resource_ids, missing_tags.as_list())
+
+def tag_instance(instance_id, synapse_tags=None, instance=None):
+  '''Apply synapse tags to an instance and the resources attached to it
+  :param instance_id: the instance ID
+  :param synapse_tags: the synapse tags to apply, None to derive them from
+         the synapse owner found in the instance tags
+  :param instance: the InstanceContext when the caller already looked it up,
+         None to look it up
+  '''
+  with instrument.span('owner_resolution'):
+    if instance is None:
+      instance = get_instance_context(instance_id)
+    instance_tags = instance.tags
+    if synapse_tags is None:
+      synapse_owner_id = utils.get_synapse_owner_id(instance_tags)
+  if synapse_tags is None:
+    synapse_tags = utils.get_synapse_tags(synapse_owner_id)
+  extra_tags = TagSet([
+    utils.get_provisioned_product_name_tag(instance_tags),
+    utils.get_access_approved_role_tag(instance_tags),
+  ])
+  #
+  # In case of duplication, Synapse tags should replace existing
+  # bucket tags.
+  #
+  with instrument.span('tag_merge'):
+    all_tags = normalize.normalize_tags(extra_tags.override(synapse_tags))
+
+  # tag the instance and everything attached to it together, only sending
+  # the tags that each resource is missing. The attachments only need to be
+  # checked for the keys that are applied.
+  with instrument.span('describe'):
+    attachments_tags = get_resources_tags(instance.attachment_ids, list(all_tags))
+  with instrument.span('tag_merge'):
+    resources_tags = {instance_id: instance_tags, **attachments_tags}
+    missing_tag_groups = group_missing_tags(resources_tags, all_tags)
+  if not missing_tag_groups:
+    log.info(f'Instance {instance_id} is already tagged, skip apply tags')
+    return
+
+  with instrument.span('apply'):
+    for missing_tags, resource_ids in missing_tag_groups:
+      log.debug('Apply tags: %s to resources %s', logs.Truncated(missing_tags), logs.Truncated(resource_ids))
+      apply_tags(resource_ids, missing_tags.as_list())
 
 
 @helper.create
 @helper.update
 def create_or_update(event, context):
   '''Handles customm resource create and update events'''
-  log.debug('Received event: ' + json.dumps(event, sort_keys=False))
+  log.debug('Received event: %s', logs.Truncated(event, logs.to_json))
   log.info('Start Lambda processing')
   instance_id = get_instance_id(event)
-  instance_tags = get_instance_tags(instance_id)
-  synapse_owner_id = utils.get_synapse_owner_id(instance_tags)
-  synapse_tags = utils.get_synapse_tags(synapse_owner_id)
-  extra_tags = []
-  provisioned_product_name_tag = utils.get_provisioned_product_name_tag(instance_tags)
-  extra_tags.append(provisioned_product_name_tag)
-  access_approved_role_tag = utils.get_access_approved_role_tag(instance_tags)
-  extra_tags.append(access_approved_role_tag)
-  #
-  # In case of duplication, Synapse tags should replace existing
-  # bucket tags.
-  #
-  all_tags = utils.merge_tags(extra_tags, synapse_tags)
-
-
-  volume_ids = get_volume_ids(instance_id)
-  log.debug(f'Apply tags: {all_tags} to volume {volume_ids}')
-  for volume_id in volume_ids:
-    apply_tags(volume_id, all_tags)
+  if jobs.is_async():
+    with instrument.span('enqueue'):
+      jobs.enqueue(jobs.INSTANCE, instance_id)
+    return
 
-  log.debug(f'Apply tags: {all_tags} to instance {instance_id}')
-  apply_tags(instance_id, all_tags)
+  tag_instance(instance_id)
 
 @helper.delete
 def delete(event, context):
@@ -106,4 +237,11 @@ def delete(event, context):
 
 def handler(event, context):
   '''Lambda handler, invokes custom resource helper'''
-  helper(event, context)
+  retry.start_invocation()
+  with instrument.invocation('set_instance_tags', RequestType=event.get('RequestType')):
+    helper(event, context)
+  prewarm.save_recent_owner_ids()
+
+
+# warm the lookups of the first request while the container initializes
+prewarm.start()
@@ -0,0 +1,79 @@
+import json
+import logging
+import set_tags.instrument as instrument
+import set_tags.jobs as jobs
+import set_tags.logs as logs
+import set_tags.prewarm as prewarm
+import set_tags.retry as retry
+import set_tags.set_batch_tags as set_batch_tags
+import set_tags.set_bucket_tags as set_bucket_tags
+import set_tags.set_instance_tags as set_instance_tags
+
+log = logging.getLogger(__name__)
+log.setLevel(logs.get_log_level())
+
+
+def run_job(job):
+  '''Run a tagging job sent by a custom resource in async mode
+  :param job: the job, i.e. {'Kind': 'bucket', 'Resource': 'my-bucket', 'StackId': None}
+  '''
+  kind = job.get('Kind')
+  if kind == jobs.BUCKET:
+    set_bucket_tags.tag_bucket(job['Resource'])
+  elif kind == jobs.INSTANCE:
+    set_instance_tags.tag_instance(job['Resource'])
+  elif kind == jobs.BATCH:
+    set_batch_tags.tag_stack_batch_resources(job['StackId'], job['Resource'])
+  else:
+    raise ValueError(f'Unknown tagging job kind: {kind}')
+
+
+def handler(event, context):
+  '''Lambda handler for SQS events of tagging jobs. Failed jobs are reported
+  back to SQS which retries them until they are sent to the dead letter queue.
+  '''
+  retry.start_invocation()
+  failures = []
+  records = event.get('Records', [])
+  with instrument.invocation('tag_worker', Jobs=len(records)) as properties:
+    for record in records:
+      message_id = record['messageId']
+      attempt = record.get('attributes', {}).get('ApproximateReceiveCount', '1')
+      try:
+        job = json.loads(record['body'])
+        log.info(f'Run tagging job {message_id} (attempt {attempt}): {job}')
+        run_job(job)
+      except Exception as e:
+        log.error(f'Tagging job {message_id} failed: {e}')
+        failures.append({'itemIdentifier': message_id})
+    properties['FailedJobs'] = len(failures)
+
+  prewarm.save_recent_owner_ids()
+  return {'batchItemFailures': failures}
+
+
+def process_file_queue(directory, max_attempts=3):
+  '''Run the jobs in a local file queue the same way SQS would invoke the
+  lambda handler, failed jobs are retried and left in the queue after
+  max_attempts.
+  :param directory: the file queue directory
+  :param max_attempts: the max number of times to run each job
+  :return the number of jobs left in the queue
+  '''
+  queue = jobs.FileQueue(directory)
+  for attempt in range(1, max_attempts + 1):
+    messages = queue.receive(max_messages=None)
+    if not messages:
+      break
+    event = {'Records': [{
+      'messageId': message_id,
+      'body': json.dumps(job),
+      'attributes': {'ApproximateReceiveCount': str(attempt)},
+    } for message_id, job in messages]}
+    response = handler(event, None)
+    failed = {failure['itemIdentifier'] for failure in response['batchItemFailures']}
+    for message_id, _ in messages:
+      if message_id not in failed:
+        queue.delete(message_id)
+
+  return len(queue.receive(max_messages=None))
@@ -0,0 +1,122 @@
+from collections.abc import Mapping
+
+
+class TagSet(Mapping):
+  '''An ordered, immutable set of tags with O(1) lookup by key.
+
+  A TagSet is built once from either form that AWS uses for tags and is then
+  read as a mapping of key to value, i.e. tags['synapse:ownerId'], or viewed
+  in each service's wire format:
+    * as_list(), a list of Key/Value dicts for EC2, S3 and cloudformation
+      i.e. [{'Key':'string', 'Value':'string'}]
+    * as_dict(), a dictionary of key pairs for batch
+      i.e. {'string':'string'}
+  A TagSet also compares equal to the same tags in either form.
+  '''
+  __slots__ = ('_tags', '_list')
+
+  def __init__(self, tags=()):
+    '''
+    :param tags: a TagSet, a dictionary of key pairs or a list of dictionary
+           of key/value pairs, a duplicated key keeps its last value
+    '''
+    if isinstance(tags, TagSet):
+      self._tags = tags._tags
+    elif isinstance(tags, Mapping):
+      self._tags = dict(tags)
+    elif isinstance(tags, (list, tuple)):
+      self._tags = {tag['Key']: tag['Value'] for tag in tags}
+    else:
+      raise TypeError("Tags must be either a dict or a list of {'Key':..., 'Value':...} dicts.")
+    self._list = None
+
+  @classmethod
+  def of(cls, tags):
+    '''Get tags as a TagSet, a TagSet is returned as is'''
+    return tags if isinstance(tags, TagSet) else cls(tags)
+
+  @classmethod
+  def wrap(cls, tags_kp):
+    '''Build a TagSet around a dictionary of key pairs without copying it, the
+    dictionary must not be changed afterwards'''
+    tag_set = cls.__new__(cls)
+    tag_set._tags = tags_kp
+    tag_set._list = None
+    return tag_set
+
+  def __getitem__(self, key):
+    return self._tags[key]
+
+  def __contains__(self, key):
+    return key in self._tags
+
+  def __iter__(self):
+    return iter(self._tags)
+
+  def __len__(self):
+    return len(self._tags)
+
+  def get(self, key, default=None):
+    return self._tags.get(key, default)
+
+  def __eq__(self, other):
+    if isinstance(other, Mapping):
+      return self._tags == dict(other.items())
+    if isinstance(other, list):
+      return self.as_list() == other
+    return NotImplemented
+
+  def __hash__(self):
+    return hash(frozenset(self._tags.items()))
+
+  def __repr__(self):
+    return f'TagSet({self._tags!r})'
+
+  def __or__(self, other):
+    return self.override(other)
+
+  def as_list(self):
+    '''The tags as a list of dictionary of key/value pairs. The list is built
+    once and shared by every caller, it must not be changed.'''
+    if self._list is None:
+      self._list = [{'Key': key, 'Value': value} for key, value in self._tags.items()]
+    return self._list
+
+  def as_dict(self):
+    '''The tags as a new dictionary of key pairs'''
+    return dict(self._tags)
+
+  def override(self, other):
+    '''Add other tags, other tags replace these tags on key collisions
+    :param other: tags in any form accepted by TagSet
+    :return a new TagSet
+    '''
+    other = TagSet.of(other)
+    if not other:
+      return self
+    return TagSet.wrap({**self._tags, **other._tags})
+
+  def merge(self, other):
+    '''Add the other tags whose keys are not in these tags
+    :param other: tags in any form accepted by TagSet
+    :return a new TagSet
+    '''
+    other = TagSet.of(other)
+    missing = {key: value for key, value in other._tags.items() if key not in self._tags}
+    if not missing:
+      return self
+    return TagSet.wrap({**self._tags, **missing})
+
+  def diff(self, desired):
+    '''Find the desired tags that are missing from, or different in, these tags
+    :param desired: tags in any form accepted by TagSet
+    :return a TagSet of the tags that need to be applied, empty if these
+            tags already contain all of the desired tags
+    '''
+    return TagSet.wrap({
+      key: value for key, value in TagSet.of(desired)._tags.items()
+      if self._tags.get(key, _MISSING) != value
+    })
+
+
+_MISSING = object()
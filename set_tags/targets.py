@@ -0,0 +1,79 @@
+import contextvars
+import os
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Target:
+  '''An AWS account and region to tag resources in'''
+  # None for the region of the lambda, or of the script's AWS profile
+  region: str = None
+  # the role to assume in the target account, None for the credentials of
+  # the lambda, or of the script's AWS profile
+  role_arn: str = None
+
+  @property
+  def account_id(self):
+    return self.role_arn.split(':')[4] if self.role_arn else None
+
+  def get_region(self):
+    return self.region or os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION')
+
+  def owns(self, arn):
+    '''Whether a resource ARN is in this target's account and region, an
+    unknown account or region matches any'''
+    parts = arn.split(':')
+    if len(parts) < 6:
+      return False
+    region = self.get_region()
+    return ((region is None or parts[3] == region) and
+            (self.account_id is None or parts[4] == self.account_id))
+
+  def __str__(self):
+    return f'{self.account_id or "default"}/{self.get_region() or "default"}'
+
+
+DEFAULT = Target()
+
+# The target that AWS clients are built for, see use(). It is a context
+# variable so that concurrent taggers can each work in their own target.
+_current = contextvars.ContextVar('target', default=DEFAULT)
+
+
+def get_current():
+  return _current.get()
+
+@contextmanager
+def use(target):
+  '''Build the AWS clients, within the block, for a target'''
+  token = _current.set(target)
+  try:
+    yield target
+  finally:
+    _current.reset(token)
+
+def run(target, fn, *args, **kwargs):
+  '''Call fn in a target'''
+  with use(target):
+    return fn(*args, **kwargs)
+
+def submit(executor, fn, *args, **kwargs):
+  '''Submit fn to an executor to run in the current target. Thread pool
+  workers do not inherit context variables, each task gets a copy of the
+  submitter's.'''
+  return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def get_targets(regions=None, role_arns=None):
+  '''Get the targets for every account in every region
+  :param regions: the regions, None or empty for the default region
+  :param role_arns: a role to assume in each account, None or empty for the
+         default credentials
+  :return a list of Targets
+  '''
+  return [
+    Target(region, role_arn)
+    for role_arn in (role_arns or [None])
+    for region in (regions or [None])
+  ]
@@ -1,41 +1,290 @@
 import json
 import logging
-import synapseclient
 import boto3
-import botocore
+import botocore.session
 import os
-import re
+import threading
 
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
+from set_tags import instrument, logs, normalize, retry, targets
+from set_tags.cache import SingleFlight, TTLCache
+from set_tags.env import get_env_var_int
+from set_tags.tagset import TagSet
 
 SYNAPSE_TAG_PREFIX = 'synapse'
 SYNAPSE_USER_PROFILE_INCLUDES = [
   "ownerId", "firstName", "lastName", "userName", "company", "teamName",
 ]
 
+SYNAPSE_CACHE_ROOT_DIR = '/tmp/.synapseCache'
+
+ROLE_SESSION_NAME = 'synapse-tagger'
+
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+log.setLevel(logs.get_log_level())
+
+
+# AWS clients are expensive to build (endpoint resolution, credential chain,
+# service model loading) so one client per service, region and credentials
+# is kept for the life of the lambda container.
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Sessions with the credentials of a role assumed in another account, keyed
+# by role ARN, botocore assumes the role again before the credentials expire.
+_role_sessions = {}
+_role_sessions_lock = threading.Lock()
+
+# Building a synapse client parses its config, sets up the file cache and
+# checks every endpoint over HTTP so a single client, and its keep-alive
+# HTTP session, is shared across lambda invocations. synapseclient is slow
+# to import so it is only imported when the client is first built, delete
+# events and invalid requests never pay for it.
+_synapse_client = None
+_synapse_client_lock = threading.Lock()
+
+# The TeamToRoleArnMap parameter rarely changes, keep its parsed team IDs
+# keyed by parameter name along with the parameter version.
+_team_ids_cache = TTLCache()
+
+# A synapse owner often provisions several products in a burst, keep their
+# user profile and team lookups keyed by owner id.
+_user_profile_cache = TTLCache(maxsize=get_env_var_int('SYNAPSE_USER_CACHE_SIZE', 256))
+_user_team_cache = TTLCache(maxsize=get_env_var_int('SYNAPSE_USER_CACHE_SIZE', 256))
+
+# IAM is a global, rate limited API and nearly every instance asks for the
+# same role, keep role ids (and roles that do not exist) by account and role
+# name.
+_role_id_cache = TTLCache()
+_NOT_CACHED = object()
+
+# The lookups above that are in flight, a concurrent request for the same
+# key, i.e. while the pre-warmer is fetching it, waits for it instead.
+_lookups = SingleFlight()
+
+# The synapse owners whose tags were derived most recently, the pre-warmer
+# can save them for new containers.
+_recent_owner_ids = OrderedDict()
+_recent_owner_ids_lock = threading.Lock()
+RECENT_OWNER_IDS_MAX = 100
+
+
+def get_client_config():
+  '''Get the botocore config shared by all AWS clients
+  Connection pooling can be tuned with the AWS_MAX_POOL_CONNECTIONS environment
+  variable. Retries are made by the retry module rather than botocore.
+  '''
+  return Config(
+    max_pool_connections=get_env_var_int('AWS_MAX_POOL_CONNECTIONS', 10),
+    retries={
+      'total_max_attempts': 1,
+      'mode': 'standard'
+    }
+  )
 
-synapseclient.core.cache.CACHE_ROOT_DIR = '/tmp/.synapseCache'
+def get_client(service, region_name=None, credentials=None, target=None):
+  '''Get a shared AWS client, the client is built on first use
+  :param service: the AWS service name, i.e. 'ec2'
+  :param region_name: the AWS region, None for the region of the target
+  :param credentials: a dict with aws_access_key_id, aws_secret_access_key and
+         aws_session_token, None for the credentials of the target
+  :param target: the targets.Target to get a client for, None for the
+         current target (see targets.use)
+  :returns: a boto3 client that is reused across lambda invocations
+  '''
+  target = target or targets.get_current()
+  region_name = region_name or target.get_region()
+  role_arn = target.role_arn if credentials is None else None
+  credentials = credentials or {}
+  key = (service, region_name, role_arn, tuple(sorted(credentials.items())))
+  client = _clients.get(key)
+  if client is None:
+    # assume the role before taking the lock, it needs an STS client
+    session = get_role_session(role_arn) if role_arn else boto3
+    with _clients_lock:
+      client = _clients.get(key)
+      if client is None:
+        client = session.client(
+          service,
+          region_name=region_name,
+          config=get_client_config(),
+          **credentials
+        )
+        max_attempts = get_env_var_int('AWS_MAX_ATTEMPTS', 3)
+        retry.BotocoreRetryHandler(service, max_attempts).register(client.meta.events)
+        instrument.BotocoreInstrument().register(client.meta.events)
+        _clients[key] = client
+
+  return client
+
+def assume_role(role_arn):
+  '''Assume a role with the default credentials. The session duration can be
+  tuned with the ASSUME_ROLE_DURATION_SECONDS environment variable.
+  :param role_arn: the ARN of the role
+  :returns: the credentials in the form botocore refreshes them in
+  '''
+  response = get_client('sts', target=targets.DEFAULT).assume_role(
+    RoleArn=role_arn,
+    RoleSessionName=ROLE_SESSION_NAME,
+    DurationSeconds=get_env_var_int('ASSUME_ROLE_DURATION_SECONDS', 3600)
+  )
+  credentials = response['Credentials']
+  log.info(f'Assumed role {role_arn} until {credentials["Expiration"]}')
+  return {
+    'access_key': credentials['AccessKeyId'],
+    'secret_key': credentials['SecretAccessKey'],
+    'token': credentials['SessionToken'],
+    'expiry_time': credentials['Expiration'].isoformat(),
+  }
+
+def get_role_session(role_arn):
+  '''Get a shared boto3 session with the credentials of an assumed role, the
+  role is assumed on first use and again shortly before the credentials expire
+  :param role_arn: the ARN of the role
+  '''
+  session = _role_sessions.get(role_arn)
+  if session is None:
+    with _role_sessions_lock:
+      session = _role_sessions.get(role_arn)
+      if session is None:
+        credentials = RefreshableCredentials.create_from_metadata(
+          metadata=assume_role(role_arn),
+          refresh_using=lambda: assume_role(role_arn),
+          method='sts-assume-role'
+        )
+        botocore_session = botocore.session.get_session()
+        # botocore has no public way to give a session refreshable credentials
+        botocore_session._credentials = credentials
+        session = boto3.Session(botocore_session=botocore_session)
+        _role_sessions[role_arn] = session
+
+  return session
+
+def reset_clients():
+  '''Drop all shared AWS clients, mostly useful for testing'''
+  with _clients_lock:
+    _clients.clear()
+  with _role_sessions_lock:
+    _role_sessions.clear()
+
+def clear_caches():
+  '''Clear all the lookups cached across invocations, mostly useful for testing'''
+  _team_ids_cache.clear()
+  _user_profile_cache.clear()
+  _user_team_cache.clear()
+  _role_id_cache.clear()
+  with _recent_owner_ids_lock:
+    _recent_owner_ids.clear()
+
+def invalidate_synapse_user(synapse_id):
+  '''Remove the cached synapse lookups of a user, i.e. after an owner change
+  :param synapse_id: synapse user id
+  '''
+  _user_profile_cache.invalidate(str(synapse_id))
+  _user_team_cache.invalidate(str(synapse_id))
 
+def get_synapse_user_cache_ttl():
+  '''Seconds to cache synapse user lookups, set with SYNAPSE_USER_CACHE_TTL'''
+  return get_env_var_int('SYNAPSE_USER_CACHE_TTL', 300)
 
 def get_s3_client():
-  return boto3.client('s3')
+  return get_client('s3')
 
 def get_ec2_client():
-  return boto3.client('ec2')
+  return get_client('ec2')
 
 def get_batch_client():
-  return boto3.client('batch')
+  return get_client('batch')
 
 def get_iam_client():
-  return boto3.client('iam')
+  return get_client('iam')
+
+def get_ssm_client():
+  return get_client('ssm')
+
+def get_synapse_requests_session():
+  '''Get an HTTP session that keeps connections to synapse alive
+  The connection pool size can be tuned with the SYNAPSE_MAX_POOL_CONNECTIONS
+  environment variable.
+  '''
+  import requests
+
+  pool_size = get_env_var_int('SYNAPSE_MAX_POOL_CONNECTIONS', 32)
+  adapter = requests.adapters.HTTPAdapter(
+    pool_connections=pool_size, pool_maxsize=pool_size)
+  session = requests.Session()
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return session
 
 def get_synapse_client():
-  return synapseclient.Synapse()
+  '''Get the shared synapse client, the client is built on first use'''
+  global _synapse_client
+  syn = _synapse_client
+  if syn is None:
+    with _synapse_client_lock:
+      syn = _synapse_client
+      if syn is None:
+        import synapseclient
+
+        syn = synapseclient.Synapse(
+          requests_session=get_synapse_requests_session(),
+          cache_root_dir=SYNAPSE_CACHE_ROOT_DIR
+        )
+        disable_synapse_retries(syn)
+        _synapse_client = syn
+
+  return syn
+
+def disable_synapse_retries(syn):
+  '''Turn off the retries of a synapse client's REST calls. By default
+  synapseclient retries throttled and failed calls for up to about 30
+  minutes, call_synapse retries them through the retry layer instead so that
+  its rate limits, budget and SYNAPSE_MAX_ATTEMPTS apply.
+  :param syn: the synapse client
+  '''
+  build_retry_policy = syn._build_retry_policy
+  syn._build_retry_policy = lambda retryPolicy={}: {**build_retry_policy(retryPolicy), 'retries': 0}
+
+def reset_synapse_client(syn=None):
+  '''Drop the shared synapse client so the next call builds a new one
+  :param syn: only drop the shared client if it is this client, None to
+         always drop it
+  '''
+  global _synapse_client
+  with _synapse_client_lock:
+    if syn is None or syn is _synapse_client:
+      _synapse_client = None
+
+def call_synapse(method, *args):
+  '''Call a method on the shared synapse client through the retry layer.
+  Throttled and failed calls are retried up to SYNAPSE_MAX_ATTEMPTS times
+  (default 2), the client is rebuilt when the connection to synapse is broken.
+  :param method: the name of the synapse client method, i.e. 'getUserProfile'
+  :param args: the arguments to the method
+  :returns: the method's return value
+  '''
+  def call():
+    syn = get_synapse_client()
+    try:
+      return getattr(syn, method)(*args)
+    except Exception as e:
+      if retry.is_connection_error(e):
+        log.warning(f'Synapse connection error, rebuilding the synapse client: {e}')
+        reset_synapse_client(syn)
+      raise
+
+  with instrument.span(f'synapse.{method}'):
+    return retry.call('synapse', call,
+                      max_attempts=get_env_var_int('SYNAPSE_MAX_ATTEMPTS', 2))
 
 def get_cfn_client():
-  return boto3.client('cloudformation')
+  return get_client('cloudformation')
 
 def get_stack_id(event):
   '''Get the stack id from the event
@@ -63,20 +312,6 @@ def get_property_value(event, property):
 
   return property_value
 
-def format_tags_kv_kp(tags):
-  '''Format tags from a list of Key/Value pairs to a dict of key pairs
-
-  tags: A list of dictionary of key/value pairs
-      i.e. tags:[{'Key':'string', 'Value':'string'}]
-  returns:  A dictionary of key pairs
-      i.e. tags:{'string':'string'}
-  '''
-  kp = {}
-  for tag in tags:
-    kp[tag['Key']] = tag['Value']
-
-  return kp
-
 def get_cfn_stack_tags(stack_id):
   '''Look up tags from a cloudformation stack
 
@@ -87,7 +322,7 @@ def get_cfn_stack_tags(stack_id):
   response = client.describe_stacks(
     StackName=stack_id
   )
-  log.debug(f'cloudformation describe_stacks response: {response}')
+  log.debug('cloudformation describe_stacks response: %s', logs.Truncated(response))
   stack = response.get('Stacks')[0]
   tags = stack.get('Tags')
   if not tags or len(tags) == 0:
@@ -116,47 +351,33 @@ def get_synapse_owner_id(tags):
   :param tags: resource tags can take two forms
     * A list of dictionary of key/value pairs
       i.e. tags = [{'Key':'key1', 'Value':'value1'}, {'Key':'key2', 'Value':'value2'}]
-    * A dictionary of key value pairs
+    * A dictionary of key value pairs, or a TagSet
       i.e. tags = {'key1':'value1', 'key2':'value2'}
   returns: the synapse user id (i.e. 378505)
   '''
   synapse_owner_id_tag = 'synapse:ownerId'
   principal_arn_tag = 'aws:servicecatalog:provisioningPrincipalArn'
 
-  # Case 1: list of dicts with "Key"/"Value"
-  # tags = [{'Key':'key1', 'Value':'value1'}, {'Key':'key2', 'Value':'value2'}]
-  if isinstance(tags, list):
-    for item in tags:  # Look for synapse:ownerId first
-      if item.get("Key") == synapse_owner_id_tag:
-        synapse_owner_id = item.get('Value')
-        return synapse_owner_id
-    for item in tags:  # Fallback to aws:servicecatalog:provisioningPrincipalArn
-      if item.get("Key") == principal_arn_tag:
-        principal_arn_value = item.get('Value')
-        synapse_owner_id = principal_arn_value.split('/')[-1]
-        return synapse_owner_id
-    return None
-
-  # Case 2: dictionary of key-value pairs
-  # tags = {'key1':'value1', 'key2':'value2'}
-  elif isinstance(tags, dict):
-    if synapse_owner_id_tag in tags:  # Look for synapse:ownerId first
-      synapse_owner_id = tags[synapse_owner_id_tag]
-      return synapse_owner_id
-    elif principal_arn_tag in tags:  # Fallback to aws:servicecatalog:provisioningPrincipalArn
-      principal_arn_value = tags[principal_arn_tag]
-      synapse_owner_id = principal_arn_value.split('/')[-1]
-      return synapse_owner_id
-    return None
-
-  else:
+  if not isinstance(tags, (list, Mapping)):
     raise TypeError("Input must be either a dict or a list of {'Key':..., 'Value':...} dicts.")
 
+  tags = TagSet.of(tags)
+  if synapse_owner_id_tag in tags:  # Look for synapse:ownerId first
+    return tags[synapse_owner_id_tag]
+  if principal_arn_tag in tags:  # Fallback to aws:servicecatalog:provisioningPrincipalArn
+    return tags[principal_arn_tag].split('/')[-1]
+  return None
+
 def get_synapse_user_profile(synapse_id):
-  '''Get synapse user profile data'''
-  syn = get_synapse_client()
-  user_profile = syn.getUserProfile(synapse_id)
-  log.debug(f'Synapse user profile: {user_profile}')
+  '''Get synapse user profile data, profiles are cached by user id'''
+  user_profile = _user_profile_cache.get(str(synapse_id))
+  if user_profile is None:
+    def load():
+      user_profile = call_synapse('getUserProfile', synapse_id)
+      _user_profile_cache.put(str(synapse_id), user_profile, get_synapse_user_cache_ttl())
+      return user_profile
+    user_profile = _lookups.do(('user_profile', str(synapse_id)), load)
+  log.debug('Synapse user profile: %s', logs.Truncated(user_profile))
   return user_profile
 
 def get_ssm_parameter(name):
@@ -165,11 +386,11 @@ def get_ssm_parameter(name):
   :param name: the parameter name
   :return: a parameter dict, None if the parameter name is not found
   '''
-  client = boto3.client('ssm')
+  client = get_ssm_client()
   parameter = None
   try:
     parameter = client.get_parameter(Name=name)
-    log.debug(f'SSM parameter value: {parameter}')
+    log.debug('SSM parameter value: %s', logs.Truncated(parameter))
   except ClientError as e:
     if e.response['Error']['Code'] == "ParameterNotFound":
       log.warning(f'Could not find SSM parameter {name}')
@@ -179,33 +400,92 @@ def get_ssm_parameter(name):
   return parameter
 
 def get_synapse_team_ids():
-  '''Return the list of IDs of teams through which a user can access service catalog'''
+  '''Return the list of IDs of teams through which a user can access service catalog.
+  The parsed team IDs are cached for TEAM_TO_ROLE_ARN_MAP_CACHE_TTL seconds. Once
+  expired the SSM parameter version is checked and the team IDs are only re-parsed
+  when the parameter has changed.
+  '''
   team_ids = []
   TeamToRoleArnMap = get_env_var_value('TEAM_TO_ROLE_ARN_MAP_PARAM_NAME')
   if TeamToRoleArnMap:
-    ssm_param = get_ssm_parameter(TeamToRoleArnMap)
-    if ssm_param:
+    # the parameter is looked up in the current target
+    cache_key = (targets.get_current(), TeamToRoleArnMap)
+    cached = _team_ids_cache.get(cache_key)
+    if cached:
+      team_ids = cached[1]
+    else:
+      team_ids = _lookups.do(('team_ids',) + cache_key,
+                             lambda: load_synapse_team_ids(TeamToRoleArnMap, cache_key))
+    log.info(f'TeamToRoleArnMap cache: {_team_ids_cache.stats()}')
+
+  log.debug('Synapse team IDs: %s', logs.Truncated(team_ids))
+  return team_ids
+
+def load_synapse_team_ids(TeamToRoleArnMap, cache_key):
+  '''Get the team IDs from the TeamToRoleArnMap parameter and cache them'''
+  team_ids = []
+  ssm_param = get_ssm_parameter(TeamToRoleArnMap)
+  if ssm_param:
+    version = ssm_param["Parameter"].get("Version")
+    stale = _team_ids_cache.get_stale(cache_key)
+    if stale and stale[0] == version:
+      team_ids = stale[1]
+    else:
       team_to_role_arn_map = json.loads(ssm_param["Parameter"]["Value"])
-      log.debug(f'ssm param: {TeamToRoleArnMap} = {team_to_role_arn_map}')
+      log.debug('ssm param: %s = %s', TeamToRoleArnMap, logs.Truncated(team_to_role_arn_map))
       for item in team_to_role_arn_map:
         team_ids.append(item["teamId"])
+    ttl = get_env_var_int('TEAM_TO_ROLE_ARN_MAP_CACHE_TTL', 300)
+    _team_ids_cache.put(cache_key, (version, team_ids), ttl)
 
-  log.debug(f'Synapse team IDs: {team_ids}')
   return team_ids
 
 def get_synapse_user_team_id(synapse_id, team_ids):
-  '''Get the first Synapse team in the given list that the user is in
+  '''Get the first Synapse team in the given list that the user is in.
+  Membership is checked concurrently, the number of concurrent checks can be
+  tuned with the SYNAPSE_TEAM_LOOKUP_WORKERS environment variable. The result
+  is cached by user id.
+  :param synapse_id: synapse user id
+  :param team_ids: the synapse team ids
+  :returns: the id of the first synapse team in the given list that the user is in,
+            None if user is not in any teams
+  '''
+  if not team_ids:
+    return None
+
+  # cached as (team_ids, team_id) so a changed team list is looked up again
+  cached = _user_team_cache.get(str(synapse_id))
+  if cached and cached[0] == tuple(team_ids):
+    return cached[1]
+
+  def load():
+    team_id = find_synapse_user_team_id(synapse_id, team_ids)
+    _user_team_cache.put(str(synapse_id), (tuple(team_ids), team_id), get_synapse_user_cache_ttl())
+    return team_id
+  return _lookups.do(('user_team', str(synapse_id), tuple(team_ids)), load)
+
+def find_synapse_user_team_id(synapse_id, team_ids):
+  '''Look up the first Synapse team in the given list that the user is in.
   :param synapse_id: synapse user id
   :param team_ids: the synapse team ids
   :returns: the id of the first synapse team in the given list that the user is in,
             None if user is not in any teams
   '''
-  syn = get_synapse_client()
-  for team_id in team_ids:
-    membership_status = syn.get_membership_status(synapse_id, team_id)
-    if membership_status["isMember"]:
-      log.debug(f'Synapse user team ID: {team_id}')
-      return team_id
+  max_workers = min(len(team_ids), get_env_var_int('SYNAPSE_TEAM_LOOKUP_WORKERS', 32))
+  executor = ThreadPoolExecutor(max_workers=max_workers)
+  try:
+    futures = [
+      targets.submit(executor, call_synapse, 'get_membership_status', synapse_id, team_id)
+      for team_id in team_ids
+    ]
+    # check results in list order so the first matching team wins
+    for team_id, future in zip(team_ids, futures):
+      membership_status = future.result()
+      if membership_status["isMember"]:
+        log.debug('Synapse user team ID: %s', team_id)
+        return team_id
+  finally:
+    executor.shutdown(wait=False, cancel_futures=True)
 
   return None
 
@@ -214,113 +494,146 @@ def get_synapse_user_profile_tags(user_profile, includes=SYNAPSE_USER_PROFILE_IN
   :param user_profile: the synapse user profile info
   :param includes: list of Synapse userProfile data to create tags
          Note - no email tags are returned if userName is not in the list
-  :return a list containing a dictionary of tags
+  :return a TagSet of the tags
          Note - AWS tag restrictions only allow a subset of characters for tag values.
-         The returned list will contain sanitized tag values.
+         The returned tags will contain sanitized tag values.
          https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/Using_Tags.html#tag-restrictions
   '''
-  VALID_TAG_CHARS = r'[^a-zA-Z0-9.+=_:@/\-]'
-
-  tags = []
+  tags_kp = {}
   for key, value in user_profile.items():
     if key not in includes:
       continue
 
-    # replace invalid characters with a space
-    value = re.sub(VALID_TAG_CHARS, ' ', value)
-
     # derive synapse email tag based on userName
     if key == "userName":
       synapse_email = f'{value}@synapse.org'
-      tags.append({'Key': f'{SYNAPSE_TAG_PREFIX}:email', 'Value': synapse_email})
-      tags.append({'Key': 'OwnerEmail', 'Value': synapse_email})  # legacy
+      tags_kp[f'{SYNAPSE_TAG_PREFIX}:email'] = synapse_email
+      tags_kp['OwnerEmail'] = synapse_email  # legacy
 
-    tag = {'Key': f'{SYNAPSE_TAG_PREFIX}:{key}', 'Value': value}
-    tags.append(tag)
+    tags_kp[f'{SYNAPSE_TAG_PREFIX}:{key}'] = value
 
-  log.debug(f'Synapse user profile tags: {tags}')
+  # replace invalid characters with a space
+  tags = normalize.normalize_tags(tags_kp)
+  log.debug('Synapse user profile tags: %s', logs.Truncated(tags))
   return tags
 
 def get_synapse_user_team_tags(synapse_id, synapse_team_ids):
-  '''Derive team tags from synapse team data'''
-  tags = []
+  '''Derive team tags from synapse team data
+  :return a TagSet of the team tags, empty if the user is not in any teams
+  '''
+  tags = TagSet()
   user_team_id = get_synapse_user_team_id(synapse_id, synapse_team_ids)
   if user_team_id:
-    tags.append({'Key': f'{SYNAPSE_TAG_PREFIX}:teamId', 'Value': user_team_id})
+    tags = TagSet.wrap({f'{SYNAPSE_TAG_PREFIX}:teamId': user_team_id})
 
-  log.debug(f'Synapse user team tags: {tags}')
+  log.debug('Synapse user team tags: %s', logs.Truncated(tags))
   return tags
 
 def get_synapse_tags(synapse_id):
   '''
   Derive synapse tags to apply to SC resources
-  Returns a list of key/value pairs of tags
   :param synapse_id: the synapse user id
-  :return A list containing a dictionary of key/value pairs representing tags
+  :return a TagSet of the user profile and team tags
   '''
 
-  user_profile = get_synapse_user_profile(synapse_id)
-  synapse_user_tags = get_synapse_user_profile_tags(user_profile)
-  synapse_team_ids = get_synapse_team_ids()
-  synapse_team_tags = get_synapse_user_team_tags(synapse_id, synapse_team_ids)
-  tags = list(synapse_user_tags + synapse_team_tags)
-  log.debug(f'Synapse tags: {tags}')
+  with instrument.span('synapse_profile'):
+    user_profile = get_synapse_user_profile(synapse_id)
+    synapse_user_tags = get_synapse_user_profile_tags(user_profile)
+  with instrument.span('team_resolution'):
+    synapse_team_ids = get_synapse_team_ids()
+    synapse_team_tags = get_synapse_user_team_tags(synapse_id, synapse_team_ids)
+  tags = TagSet.of(synapse_user_tags).override(synapse_team_tags)
+  remember_owner_id(synapse_id)
+  log.debug('Synapse tags: %s', logs.Truncated(tags))
   return tags
 
+def remember_owner_id(synapse_id):
+  '''Record that the tags of a synapse owner were derived'''
+  with _recent_owner_ids_lock:
+    _recent_owner_ids.pop(str(synapse_id), None)
+    _recent_owner_ids[str(synapse_id)] = True
+    while len(_recent_owner_ids) > RECENT_OWNER_IDS_MAX:
+      _recent_owner_ids.popitem(last=False)
+
+def get_recent_owner_ids():
+  '''Get the synapse owners whose tags were derived most recently
+  :return a list of synapse user ids, the most recent first
+  '''
+  with _recent_owner_ids_lock:
+    return list(reversed(_recent_owner_ids))
+
 def get_provisioned_product_name_tag(tags):
   '''Get provisioned product name among the resource tags.
-  :param tags: the list of tags on the instance, assume to contain a provisioned product
+  :param tags: the tags on the instance in any form accepted by TagSet, assume to contain a provisioned product
          ARN tag that is applied by AWS and its value should be in the following format
          'arn:aws:servicecatalog:us-east-1:123456712:stack/my-product/pp-mycpuogt2i45s'
   :return a dict containing the the product name tag
   '''
   PRODUCT_ARN_TAG_KEY = 'aws:servicecatalog:provisionedProductArn'
-  for tag in tags:
-    if tag.get('Key') == PRODUCT_ARN_TAG_KEY:
-      provisioned_product_arn_value = tag.get('Value')
-      provisioned_product_arn_name = provisioned_product_arn_value.split('/')[-2]
-      provisioned_product_arn_tag = {
-        'Key': 'Name',
-        'Value': provisioned_product_arn_name
-      }
-      log.debug(f'provisioned product arn tag: {provisioned_product_arn_tag}')
-      return provisioned_product_arn_tag
-  else:
+  provisioned_product_arn_value = TagSet.of(tags).get(PRODUCT_ARN_TAG_KEY)
+  if provisioned_product_arn_value is None:
     raise ValueError(f'Expected to find {PRODUCT_ARN_TAG_KEY} in {tags}')
 
+  provisioned_product_arn_name = provisioned_product_arn_value.split('/')[-2]
+  provisioned_product_arn_tag = {
+    'Key': 'Name',
+    'Value': provisioned_product_arn_name
+  }
+  log.debug('provisioned product arn tag: %s', provisioned_product_arn_tag)
+  return provisioned_product_arn_tag
+
+def get_role_id(role_name):
+  '''Get the ID of an IAM role. Role IDs are cached for IAM_ROLE_CACHE_TTL
+  seconds (default 3600) and roles that do not exist are remembered for
+  IAM_ROLE_MISSING_CACHE_TTL seconds (default 60).
+  :param role_name: the IAM role name
+  :return the role ID, i.e. AROAEXAMPLE
+  '''
+  with instrument.span('iam_lookup'):
+    cache_key = (targets.get_current().account_id, role_name)
+    role_id = _role_id_cache.get(cache_key, _NOT_CACHED)
+    if role_id is _NOT_CACHED:
+      role_id = _lookups.do(('role_id',) + cache_key, lambda: load_role_id(role_name, cache_key))
+  stats = _role_id_cache.stats()
+  log.info(f'IAM role cache: {stats}, get_role calls avoided: {stats["hits"]}')
+
+  if role_id is None:
+    raise ValueError(f'IAM role {role_name} does not exist')
+  return role_id
+
+def load_role_id(role_name, cache_key):
+  '''Get the ID of an IAM role and cache it
+  :return the role ID, None if the role does not exist
+  '''
+  try:
+    response = get_iam_client().get_role(RoleName=role_name)
+    role_id = response['Role']['RoleId']
+    _role_id_cache.put(cache_key, role_id, get_env_var_int('IAM_ROLE_CACHE_TTL', 3600))
+  except ClientError as e:
+    if e.response['Error']['Code'] != 'NoSuchEntity':
+      raise
+    role_id = None
+    _role_id_cache.put(cache_key, role_id, get_env_var_int('IAM_ROLE_MISSING_CACHE_TTL', 60))
+  return role_id
+
 def get_access_approved_role_tag(tags):
   '''Get the access approve role tag from among the resource tags.
-  :param tags: the list of tags on the instance, assume to contain a principal
+  :param tags: the tags on the instance in any form accepted by TagSet, assume to contain a principal
          ARN tag that is applied by AWS and its value should be in the following format
          'arn:aws:sts::111111111:assumed-role/ServiceCatalogEndusers/1234567'
   :return a dict containing the access approved role tag
   '''
   PRINCIPAL_ARN_TAG_KEY = 'aws:servicecatalog:provisioningPrincipalArn'
-  for tag in tags:
-    if tag.get('Key') == PRINCIPAL_ARN_TAG_KEY:
-      principal_arn_value = tag.get('Value')
-      synapse_owner_id = principal_arn_value.split('/')[-1]
-      assumed_role_name = principal_arn_value.split('/')[-2]
-      client = get_iam_client()
-      response = client.get_role(
-        RoleName=assumed_role_name
-      )
-      access_approved_role = response['Role']['RoleId']
-      access_approved_role_tag = {
-        'Key': 'Protected/AccessApprovedCaller',
-        'Value': f'{access_approved_role}:{synapse_owner_id}'
-      }
-      log.debug(f'access approved role tag: {access_approved_role_tag}')
-      return access_approved_role_tag
-  else:
+  principal_arn_value = TagSet.of(tags).get(PRINCIPAL_ARN_TAG_KEY)
+  if principal_arn_value is None:
     raise ValueError(f'Expected to find {PRINCIPAL_ARN_TAG_KEY} in {tags}')
 
-def merge_tags(list1, list2):
-  '''Merge two lists of tags, the second overriding the first on key collisions
-  '''
-  unique_tags = format_tags_kv_kp(list1)
-  unique_tags.update(format_tags_kv_kp(list2))
-  result=[]
-  for entry in unique_tags:
-      result.append({'Key':entry,'Value':unique_tags[entry]})
-  return result
+  synapse_owner_id = principal_arn_value.split('/')[-1]
+  assumed_role_name = principal_arn_value.split('/')[-2]
+  access_approved_role = get_role_id(assumed_role_name)
+  access_approved_role_tag = {
+    'Key': 'Protected/AccessApprovedCaller',
+    'Value': f'{access_approved_role}:{synapse_owner_id}'
+  }
+  log.debug('access approved role tag: %s', access_approved_role_tag)
+  return access_approved_role_tag
@@ -0,0 +1,44 @@
+import unittest
+
+import boto3
+from botocore.stub import Stubber
+from unittest.mock import patch
+
+from set_tags import bulk
+
+
+class TestGetStackResources(unittest.TestCase):
+
+  STACK_ID = 'arn:aws:cloudformation:us-east-1:1111111111:stack/SC-1111111111-pp-mycpuogt2i45s/abc'
+
+  def test_resources_by_kind(self):
+    cfn = boto3.client('cloudformation', region_name='us-east-1')
+    with Stubber(cfn) as stubber, \
+      patch('set_tags.utils.get_cfn_client', return_value=cfn):
+      stubber.add_response('list_stack_resources', {
+        'StackResourceSummaries': [
+          {'LogicalResourceId': 'Bucket', 'PhysicalResourceId': 'my-bucket',
+           'ResourceType': 'AWS::S3::Bucket', 'LastUpdatedTimestamp': '2020-01-01',
+           'ResourceStatus': 'CREATE_COMPLETE'},
+          {'LogicalResourceId': 'Role', 'PhysicalResourceId': 'my-role',
+           'ResourceType': 'AWS::IAM::Role', 'LastUpdatedTimestamp': '2020-01-01',
+           'ResourceStatus': 'CREATE_COMPLETE'},
+        ],
+        'NextToken': 'page2'
+      }, {'StackName': self.STACK_ID})
+      stubber.add_response('list_stack_resources', {
+        'StackResourceSummaries': [
+          {'LogicalResourceId': 'Instance', 'PhysicalResourceId': 'i-0123456789',
+           'ResourceType': 'AWS::EC2::Instance', 'LastUpdatedTimestamp': '2020-01-01',
+           'ResourceStatus': 'CREATE_COMPLETE'},
+          {'LogicalResourceId': 'JobQueue', 'PhysicalResourceId': 'arn:aws:batch:job-queue/q',
+           'ResourceType': 'AWS::Batch::JobQueue', 'LastUpdatedTimestamp': '2020-01-01',
+           'ResourceStatus': 'CREATE_COMPLETE'},
+        ]
+      }, {'StackName': self.STACK_ID, 'NextToken': 'page2'})
+      result = bulk.get_stack_resources(self.STACK_ID)
+      self.assertEqual(result, {
+        'bucket': ['my-bucket'],
+        'instance': ['i-0123456789'],
+        'batch': ['arn:aws:batch:job-queue/q'],
+      })
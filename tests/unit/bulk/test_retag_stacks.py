@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+from botocore.exceptions import ClientError
+from unittest.mock import MagicMock, patch
+
+from set_tags import bulk
+from set_tags import retry
+
+
+class TestRetagStacks(unittest.TestCase):
+
+  STACK_OWNERS = {
+    'stack-1': '1111111',
+    'stack-2': '1111111',
+    'stack-3': '2222222',
+  }
+
+  def setUp(self):
+    patches = {
+      'get_stack_owner_id': patch('set_tags.bulk.get_stack_owner_id',
+                                  side_effect=self.STACK_OWNERS.get),
+      'get_synapse_tags': patch('set_tags.utils.get_synapse_tags',
+                                side_effect=lambda owner_id: [{'Key': 'synapse:ownerId',
+                                                               'Value': owner_id}]),
+      'tag_stack_resources': patch('set_tags.bulk.tag_stack_resources',
+                                   return_value={'bucket': 1}),
+    }
+    self.mocks = {}
+    for name, p in patches.items():
+      self.mocks[name] = p.start()
+      self.addCleanup(p.stop)
+
+  def test_tags_once_per_owner(self):
+    failures = bulk.retag_stacks(list(self.STACK_OWNERS))
+    self.assertEqual(failures, {})
+    self.assertEqual(sorted(c.args[0] for c in self.mocks['get_synapse_tags'].call_args_list),
+                     ['1111111', '2222222'])
+    tagged = {c.args[0]: c.args[1] for c in self.mocks['tag_stack_resources'].call_args_list}
+    self.assertEqual(tagged['stack-2'], [{'Key': 'synapse:ownerId', 'Value': '1111111'}])
+    self.assertEqual(tagged['stack-3'], [{'Key': 'synapse:ownerId', 'Value': '2222222'}])
+
+  def test_failures(self):
+    def tag_stack_resources(stack_id, synapse_tags):
+      if stack_id == 'stack-1':
+        raise Exception('AccessDenied')
+      return {}
+
+    def get_synapse_tags(owner_id):
+      if owner_id == '2222222':
+        raise Exception('Not found')
+      return []
+
+    self.mocks['get_synapse_tags'].side_effect = get_synapse_tags
+    self.mocks['tag_stack_resources'].side_effect = tag_stack_resources
+    failures = bulk.retag_stacks(list(self.STACK_OWNERS))
+    self.assertEqual(failures, {'stack-1': 'AccessDenied', 'stack-3': 'Not found'})
+
+  def test_resume_from_checkpoint(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      checkpoint = os.path.join(tmp, 'checkpoint.jsonl')
+      with open(checkpoint, 'w') as f:
+        f.write(json.dumps({'StackId': 'stack-1', 'Tagged': {}}) + '\n')
+      bulk.retag_stacks(list(self.STACK_OWNERS), checkpoint_path=checkpoint)
+      tagged = sorted(c.args[0] for c in self.mocks['tag_stack_resources'].call_args_list)
+      self.assertEqual(tagged, ['stack-2', 'stack-3'])
+      self.assertEqual(bulk.load_checkpoint(checkpoint), {'stack-1', 'stack-2', 'stack-3'})
+
+  @patch('time.sleep')
+  @patch.dict('os.environ', {'RETRY_BUDGET': '2'})
+  def test_retry_budget_per_stack(self, sleep_mock):
+    throttle = ClientError({'Error': {'Code': 'Throttling', 'Message': ''},
+                            'ResponseMetadata': {'HTTPStatusCode': 400}}, 'CreateTags')
+    def tag_stack_resources(stack_id, synapse_tags):
+      # each stack's calls are throttled once, more retries in all than a budget
+      for _ in range(2):
+        retry.call('ec2', MagicMock(side_effect=[throttle, 'ok']))
+      return {}
+
+    stack_ids = [f'stack-{i}' for i in range(10)]
+    self.mocks['get_stack_owner_id'].side_effect = lambda stack_id: '1111111'
+    self.mocks['tag_stack_resources'].side_effect = tag_stack_resources
+    self.assertEqual(bulk.retag_stacks(stack_ids), {})
+    self.assertEqual(retry.get_metrics()['ec2']['retries'], 20)
+    self.assertNotIn('budget_exhausted', retry.get_metrics()['ec2'])
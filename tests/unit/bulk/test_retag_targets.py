@@ -0,0 +1,51 @@
+import unittest
+
+from unittest.mock import patch
+
+from set_tags import bulk
+from set_tags import targets
+
+
+class TestRetagTargets(unittest.TestCase):
+
+  EAST = targets.Target('us-east-1', 'arn:aws:iam::111111111111:role/SynapseTagger')
+  WEST = targets.Target('us-west-2', 'arn:aws:iam::222222222222:role/SynapseTagger')
+  FAILING = targets.Target('eu-west-1', 'arn:aws:iam::333333333333:role/SynapseTagger')
+  TARGET_STACKS = {
+    EAST: ['stack-east-1', 'stack-east-2'],
+    WEST: ['stack-west-1'],
+  }
+
+  def get_stack_ids(self):
+    target = targets.get_current()
+    if target == self.FAILING:
+      raise Exception('AccessDenied')
+    return self.TARGET_STACKS[target]
+
+  def test_each_stack_is_tagged_in_its_target(self):
+    owner_targets = []
+    tag_targets = {}
+
+    def get_stack_owner_id(stack_id):
+      owner_targets.append((stack_id, targets.get_current()))
+      return '1111111'
+
+    def tag_stack_resources(stack_id, synapse_tags):
+      tag_targets[stack_id] = targets.get_current()
+      return {}
+
+    with patch('set_tags.bulk.get_stack_owner_id', side_effect=get_stack_owner_id), \
+      patch('set_tags.utils.get_synapse_tags', return_value=[]) as synapse_tags_mock, \
+      patch('set_tags.bulk.tag_stack_resources', side_effect=tag_stack_resources):
+        failures = bulk.retag_targets([self.EAST, self.WEST, self.FAILING], self.get_stack_ids)
+
+    self.assertEqual(failures, {str(self.FAILING): 'AccessDenied'})
+    # the owner is resolved once for all of the targets
+    synapse_tags_mock.assert_called_once_with('1111111')
+    expected = {
+      'stack-east-1': self.EAST,
+      'stack-east-2': self.EAST,
+      'stack-west-1': self.WEST,
+    }
+    self.assertEqual(dict(owner_targets), expected)
+    self.assertEqual(tag_targets, expected)
@@ -0,0 +1,56 @@
+import threading
+import unittest
+
+from unittest.mock import patch
+
+from set_tags import bulk
+
+
+class TestTagResources(unittest.TestCase):
+
+  RESOURCES = {
+    'bucket': ['my-bucket'],
+    'instance': ['i-1', 'i-2'],
+    'volume': ['vol-1', 'vol-2'],
+    'batch': ['arn:aws:batch:job-queue/q'],
+  }
+  SYNAPSE_TAGS = [{'Key': 'synapse:ownerId', 'Value': '1111111'}]
+
+  def setUp(self):
+    patches = {
+      'bucket': patch('set_tags.set_bucket_tags.tag_bucket'),
+      'instance': patch('set_tags.set_instance_tags.tag_instance'),
+      'volume': patch('set_tags.set_instance_tags.tag_volumes'),
+      'batch': patch('set_tags.set_batch_tags.tag_batch_resources'),
+    }
+    self.mocks = {}
+    for kind, p in patches.items():
+      self.mocks[kind] = p.start()
+      self.addCleanup(p.stop)
+
+  def test_dispatch(self):
+    bulk.tag_resources(self.RESOURCES, self.SYNAPSE_TAGS)
+    self.mocks['bucket'].assert_called_once_with('my-bucket', self.SYNAPSE_TAGS)
+    self.assertEqual(sorted(c.args[0] for c in self.mocks['instance'].call_args_list),
+                     ['i-1', 'i-2'])
+    self.mocks['volume'].assert_called_once_with(['vol-1', 'vol-2'], self.SYNAPSE_TAGS)
+    self.mocks['batch'].assert_called_once_with(['arn:aws:batch:job-queue/q'], self.SYNAPSE_TAGS)
+
+  def test_concurrent(self):
+    # each tagger blocks until all taggers are running
+    barrier = threading.Barrier(5, timeout=5)
+    for mock in self.mocks.values():
+      mock.side_effect = lambda resource, tags: barrier.wait()
+    bulk.tag_resources(self.RESOURCES, self.SYNAPSE_TAGS)
+
+  def test_aggregated_error(self):
+    def tag_instance(instance_id, tags):
+      if instance_id == 'i-2':
+        raise Exception(f'Failed to tag {instance_id}')
+
+    self.mocks['instance'].side_effect = tag_instance
+    with self.assertRaises(Exception) as context:
+      bulk.tag_resources(self.RESOURCES, self.SYNAPSE_TAGS)
+    self.assertIn('i-2', str(context.exception))
+    self.assertNotIn('i-1', str(context.exception))
+    self.mocks['batch'].assert_called_once()
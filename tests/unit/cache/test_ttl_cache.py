@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from set_tags.cache import SingleFlight, TTLCache
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0
+
+  def __call__(self):
+    return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.cache = TTLCache(clock=self.clock)
+
+  def test_hit(self):
+    self.cache.put('foo', 'bar', 10)
+    self.assertEqual(self.cache.get('foo'), 'bar')
+    self.assertEqual(self.cache.stats()['hits'], 1)
+
+  def test_miss(self):
+    self.assertEqual(self.cache.get('foo', 'default'), 'default')
+    self.assertEqual(self.cache.stats()['misses'], 1)
+
+  def test_expired(self):
+    self.cache.put('foo', 'bar', 10)
+    self.clock.now = 10
+    self.assertIsNone(self.cache.get('foo'))
+    self.assertEqual(self.cache.get_stale('foo'), 'bar')
+    self.assertEqual(self.cache.stats()['misses'], 1)
+
+  def test_refresh(self):
+    self.cache.put('foo', 'bar', 10)
+    self.cache.put('foo', 'bar', 10)
+    self.assertEqual(self.cache.stats()['refreshes'], 0)
+    self.cache.put('foo', 'baz', 10)
+    self.assertEqual(self.cache.stats()['refreshes'], 1)
+    self.assertEqual(self.cache.get('foo'), 'baz')
+
+  def test_invalidate(self):
+    self.cache.put('foo', 'bar', 10)
+    self.cache.invalidate('foo')
+    self.assertIsNone(self.cache.get_stale('foo'))
+
+  def test_clear(self):
+    self.cache.put('foo', 'bar', 10)
+    self.cache.get('foo')
+    self.cache.clear()
+    self.assertEqual(self.cache.stats(), {'size': 0, 'hits': 0, 'misses': 0, 'refreshes': 0})
+
+  def test_lru_eviction(self):
+    cache = TTLCache(maxsize=2, clock=self.clock)
+    cache.put('foo', 1, 10)
+    cache.put('bar', 2, 10)
+    cache.get('foo')
+    cache.put('baz', 3, 10)
+    self.assertEqual(cache.get('foo'), 1)
+    self.assertIsNone(cache.get('bar'))
+    self.assertEqual(cache.get('baz'), 3)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+  def test_joins_lookup_in_flight(self):
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+      calls.append(1)
+      started.set()
+      release.wait()
+      return 'bar'
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+      leader = executor.submit(flights.do, 'foo', lookup)
+      started.wait()
+      follower = executor.submit(flights.do, 'foo', lookup)
+      while flights.joined == 0:
+        time.sleep(0.001)
+      release.set()
+      self.assertEqual(leader.result(), 'bar')
+      self.assertEqual(follower.result(), 'bar')
+    self.assertEqual(len(calls), 1)
+    # the next lookup is not joined once the flight has landed
+    self.assertEqual(flights.do('foo', lambda: 'new'), 'new')
+
+  def test_error_is_not_cached(self):
+    flights = SingleFlight()
+    def lookup():
+      raise ValueError('not found')
+    with self.assertRaises(ValueError):
+      flights.do('foo', lookup)
+    self.assertEqual(flights.do('foo', lambda: 'bar'), 'bar')
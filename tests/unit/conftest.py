@@ -0,0 +1,24 @@
+import pytest
+
+from set_tags import instrument
+from set_tags import prewarm
+from set_tags import retry
+from set_tags import utils
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+  '''Clients and caches are shared for the life of the process, isolate each test from them'''
+  utils.reset_clients()
+  utils.reset_synapse_client()
+  utils.clear_caches()
+  retry.reset()
+  instrument.reset()
+  prewarm.reset()
+  yield
+  utils.reset_clients()
+  utils.reset_synapse_client()
+  utils.clear_caches()
+  retry.reset()
+  instrument.reset()
+  prewarm.reset()
@@ -0,0 +1,174 @@
+import io
+import json
+import time
+import unittest
+
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import EndpointConnectionError
+
+from set_tags import instrument
+from set_tags import retry
+from set_tags import set_bucket_tags
+from set_tags import set_instance_tags
+from set_tags import utils
+from set_tags.tagset import TagSet
+
+
+class MockRaw:
+  def __init__(self, body):
+    self.body = body
+
+  def stream(self, **kwargs):
+    yield self.body
+
+
+class TestSpan(unittest.TestCase):
+
+  def test_span_recorded(self):
+    with instrument.span('tag_merge'):
+      pass
+    with instrument.span('tag_merge'):
+      pass
+    spans = instrument.get_spans()
+    self.assertEqual(spans['tag_merge'][1], 2)
+    self.assertGreaterEqual(spans['tag_merge'][0], 0)
+
+  def test_span_recorded_on_error(self):
+    with self.assertRaises(ValueError):
+      with instrument.span('apply'):
+        raise ValueError('boom')
+    self.assertEqual(instrument.get_spans()['apply'][1], 1)
+
+  @patch.dict('os.environ', {'METRICS_ENABLED': 'false'})
+  def test_span_disabled(self):
+    with instrument.span('tag_merge'):
+      pass
+    self.assertEqual(instrument.get_spans(), {})
+
+
+class TestInvocation(unittest.TestCase):
+
+  def invoke(self, **properties):
+    out = io.StringIO()
+    with redirect_stdout(out):
+      with instrument.invocation('set_bucket_tags', **properties) as extra:
+        with instrument.span('owner_resolution'):
+          pass
+        extra['Jobs'] = 1
+    return out.getvalue()
+
+  def test_emits_one_emf_record(self):
+    output = self.invoke(RequestType='Create')
+    lines = output.splitlines()
+    self.assertEqual(len(lines), 1)
+    record = json.loads(lines[0])
+    metrics = record['_aws']['CloudWatchMetrics'][0]
+    self.assertEqual(metrics['Dimensions'], [['Handler']])
+    self.assertEqual(
+      [metric['Name'] for metric in metrics['Metrics']],
+      ['invocation', 'owner_resolution'])
+    self.assertEqual(record['Handler'], 'set_bucket_tags')
+    self.assertEqual(record['RequestType'], 'Create')
+    self.assertEqual(record['Jobs'], 1)
+    self.assertEqual(record['SpanCounts'], {'owner_resolution': 1})
+    self.assertIn('owner_resolution', record)
+    self.assertEqual(record['RetryMetrics'], {})
+
+  def test_spans_reset_each_invocation(self):
+    with instrument.span('apply'):
+      pass
+    record = json.loads(self.invoke())
+    self.assertNotIn('apply', record)
+
+  @patch.dict('os.environ', {'METRICS_ENABLED': 'false'})
+  def test_disabled(self):
+    self.assertEqual(self.invoke(), '')
+
+
+class TestBotocoreInstrument(unittest.TestCase):
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                             'AWS_SECRET_ACCESS_KEY': 'testing'})
+  @patch('time.sleep')
+  def test_aws_calls_timed_once_with_retries(self, sleep_mock):
+    responses = [
+      (429, b'{"__type": "ThrottlingException", "message": "Rate exceeded"}'),
+      (200, b'{"tags": {"foo": "bar"}}'),
+    ]
+    def before_send(request, **kwargs):
+      status_code, body = responses.pop(0)
+      return AWSResponse(request.url, status_code, {}, MockRaw(body))
+
+    batch = utils.get_batch_client()
+    batch.meta.events.register('before-send', before_send)
+    batch.list_tags_for_resource(resourceArn='arn:aws:batch:job-queue/q')
+
+    spans = instrument.get_spans()
+    self.assertEqual(spans['aws.batch.ListTagsForResource'][1], 1)
+    self.assertEqual(retry.get_metrics()['batch']['retries'], 1)
+
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                             'AWS_SECRET_ACCESS_KEY': 'testing'})
+  @patch('time.sleep')
+  def test_connection_error_raised(self, sleep_mock):
+    def before_send(request, **kwargs):
+      raise EndpointConnectionError(endpoint_url=request.url)
+
+    batch = utils.get_batch_client()
+    batch.meta.events.register('before-send', before_send)
+    with self.assertRaises(EndpointConnectionError):
+      batch.list_tags_for_resource(resourceArn='arn:aws:batch:job-queue/q')
+
+    spans = instrument.get_spans()
+    self.assertEqual(spans['aws.batch.ListTagsForResource'][1], 1)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                             'AWS_SECRET_ACCESS_KEY': 'testing', 'METRICS_ENABLED': 'false'})
+  @patch('time.sleep')
+  def test_connection_error_raised_disabled(self, sleep_mock):
+    def before_send(request, **kwargs):
+      raise EndpointConnectionError(endpoint_url=request.url)
+
+    batch = utils.get_batch_client()
+    batch.meta.events.register('before-send', before_send)
+    with self.assertRaises(EndpointConnectionError):
+      batch.list_tags_for_resource(resourceArn='arn:aws:batch:job-queue/q')
+    self.assertEqual(instrument.get_spans(), {})
+
+
+class TestHandlerSpans(unittest.TestCase):
+
+  def test_bucket_phases(self):
+    bucket_tags = [{'Key': 'synapse:ownerId', 'Value': '1111111'}]
+    synapse_tags = [{'Key': 'synapse:userName', 'Value': 'jsmith'}]
+    with patch.object(set_bucket_tags, 'get_bucket_tags', return_value=bucket_tags), \
+         patch.object(set_bucket_tags, 'apply_tags'), \
+         patch.object(utils, 'get_synapse_tags', return_value=synapse_tags):
+      set_bucket_tags.tag_bucket('my-bucket')
+
+    self.assertEqual(
+      set(instrument.get_spans()),
+      {'owner_resolution', 'tag_merge', 'apply'})
+
+  def test_instance_describe_not_in_merge(self):
+    instance = set_instance_tags.InstanceContext(
+      'i-1234', TagSet({'synapse:ownerId': '1111111'}), ['vol-1'], [])
+    def get_resources_tags(resource_ids, keys=None):
+      time.sleep(0.05)
+      return {resource_id: TagSet() for resource_id in resource_ids}
+    with patch.object(set_instance_tags, 'get_instance_context', return_value=instance), \
+         patch.object(set_instance_tags, 'get_resources_tags', side_effect=get_resources_tags), \
+         patch.object(set_instance_tags, 'apply_tags'), \
+         patch.object(utils, 'get_provisioned_product_name_tag', return_value={'Key': 'Name', 'Value': 'p'}), \
+         patch.object(utils, 'get_access_approved_role_tag', return_value={'Key': 'a', 'Value': 'b'}), \
+         patch.object(utils, 'get_synapse_tags', return_value=[{'Key': 'synapse:userName', 'Value': 'jsmith'}]):
+      set_instance_tags.tag_instance('i-1234')
+
+    spans = instrument.get_spans()
+    self.assertEqual(set(spans), {'owner_resolution', 'describe', 'tag_merge', 'apply'})
+    self.assertGreaterEqual(spans['describe'][0], 0.05)
+    self.assertLess(spans['tag_merge'][0], 0.05)
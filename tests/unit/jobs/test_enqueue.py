@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from set_tags import jobs
+from set_tags import set_batch_tags
+from set_tags import set_bucket_tags
+from set_tags import set_instance_tags
+
+
+class TestEnqueue(unittest.TestCase):
+
+  STACK_ID = 'arn:aws:cloudformation:us-east-1:1111111111:stack/my-stack/abc'
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    env = patch.dict('os.environ', {'TAG_JOB_QUEUE_DIR': self.tmp.name})
+    env.start()
+    self.addCleanup(env.stop)
+
+  def received_jobs(self):
+    return [job for _, job in jobs.FileQueue(self.tmp.name).receive()]
+
+  def test_sync_by_default(self):
+    with patch.dict('os.environ', clear=True):
+      self.assertFalse(jobs.is_async())
+
+  def test_bucket(self):
+    event = {'ResourceProperties': {'BucketName': 'my-bucket'}}
+    with patch('set_tags.set_bucket_tags.tag_bucket') as tag_mock:
+      set_bucket_tags.create_or_update(event, None)
+      tag_mock.assert_not_called()
+    self.assertEqual(self.received_jobs(),
+                     [{'Kind': 'bucket', 'Resource': 'my-bucket', 'StackId': None}])
+
+  def test_instance(self):
+    event = {'ResourceProperties': {'InstanceId': 'i-1234'}}
+    with patch('set_tags.set_instance_tags.tag_instance') as tag_mock:
+      set_instance_tags.create_or_update(event, None)
+      tag_mock.assert_not_called()
+    self.assertEqual(self.received_jobs(),
+                     [{'Kind': 'instance', 'Resource': 'i-1234', 'StackId': None}])
+
+  def test_batch(self):
+    event = {
+      'StackId': self.STACK_ID,
+      'ResourceProperties': {'BatchResources': {'JobQueueArn': 'arn:aws:batch:job-queue/q'}}
+    }
+    with patch('set_tags.set_batch_tags.tag_stack_batch_resources') as tag_mock:
+      set_batch_tags.create_or_update(event, None)
+      tag_mock.assert_not_called()
+    self.assertEqual(self.received_jobs(), [
+      {'Kind': 'batch', 'Resource': ['arn:aws:batch:job-queue/q'], 'StackId': self.STACK_ID}])
+
+  def test_invalid_input_not_enqueued(self):
+    with self.assertRaises(ValueError):
+      set_bucket_tags.create_or_update({'ResourceProperties': {}}, None)
+    self.assertEqual(self.received_jobs(), [])
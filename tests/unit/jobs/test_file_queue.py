@@ -0,0 +1,27 @@
+import tempfile
+import unittest
+
+from set_tags import jobs
+
+
+class TestFileQueue(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    self.queue = jobs.FileQueue(self.tmp.name)
+
+  def test_send_receive_in_order(self):
+    first = self.queue.send({'Kind': 'bucket', 'Resource': 'bucket-1'})
+    second = self.queue.send({'Kind': 'bucket', 'Resource': 'bucket-2'})
+    messages = self.queue.receive()
+    self.assertEqual(messages, [
+      (first, {'Kind': 'bucket', 'Resource': 'bucket-1'}),
+      (second, {'Kind': 'bucket', 'Resource': 'bucket-2'}),
+    ])
+    self.assertEqual(self.queue.receive(max_messages=1), messages[:1])
+
+  def test_delete(self):
+    message_id = self.queue.send({'Kind': 'bucket', 'Resource': 'bucket-1'})
+    self.queue.delete(message_id)
+    self.assertEqual(self.queue.receive(), [])
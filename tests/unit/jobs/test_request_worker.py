@@ -0,0 +1,168 @@
+import json
+import unittest
+
+from botocore.exceptions import ClientError
+from unittest.mock import MagicMock, patch
+
+from set_tags import request_worker
+from set_tags import set_instance_tags
+from set_tags.tagset import TagSet
+
+STACK_ID = 'arn:aws:cloudformation:us-east-1:111111111111:stack/my-stack/abc'
+
+
+def client_error(code, status_code):
+  return ClientError({
+    'Error': {'Code': code, 'Message': ''},
+    'ResponseMetadata': {'HTTPStatusCode': status_code},
+  }, 'PutBucketTagging')
+
+def get_event(request_type, logical_id, properties):
+  return {
+    'RequestType': request_type,
+    'ResponseURL': f'https://cloudformation-custom-resource-response.example.com/{logical_id}',
+    'StackId': STACK_ID,
+    'RequestId': f'request-{logical_id}',
+    'LogicalResourceId': logical_id,
+    'ResourceProperties': properties,
+  }
+
+def get_record(message_id, event, attempt=1):
+  return {
+    'messageId': message_id,
+    'body': json.dumps(event),
+    'attributes': {'ApproximateReceiveCount': str(attempt)},
+  }
+
+
+class TestRequestWorker(unittest.TestCase):
+
+  BUCKET_OWNERS = {'bucket-1': '1111111', 'bucket-2': '1111111', 'bucket-3': '2222222'}
+
+  def setUp(self):
+    self.tag_bucket_errors = {}
+    self.responses = {}
+    patches = {
+      'get_bucket_tags': patch('set_tags.set_bucket_tags.get_bucket_tags', side_effect=lambda name: [
+        {'Key': 'synapse:ownerId', 'Value': self.BUCKET_OWNERS[name]}]),
+      'get_synapse_tags': patch('set_tags.utils.get_synapse_tags', side_effect=lambda owner_id: [
+        {'Key': 'synapse:ownerId', 'Value': owner_id}]),
+      'tag_bucket': patch('set_tags.set_bucket_tags.tag_bucket', side_effect=self.tag_bucket),
+      'send_response': patch('set_tags.request_worker.send_response', side_effect=self.send_response),
+    }
+    self.mocks = {}
+    for name, p in patches.items():
+      self.mocks[name] = p.start()
+      self.addCleanup(p.stop)
+
+  def tag_bucket(self, bucket_name, synapse_tags):
+    if bucket_name in self.tag_bucket_errors:
+      raise self.tag_bucket_errors[bucket_name]
+
+  def send_response(self, event, status, reason=''):
+    self.responses[event['LogicalResourceId']] = (status, reason)
+
+  def test_get_event(self):
+    event = get_event('Create', 'TagBucket', {'BucketName': 'bucket-1'})
+    self.assertEqual(request_worker.get_event({'body': json.dumps(event)}), event)
+    notification = {'Type': 'Notification', 'Message': json.dumps(event)}
+    self.assertEqual(request_worker.get_event({'body': json.dumps(notification)}), event)
+
+  def test_batch_of_requests(self):
+    event = {'Records': [
+      get_record('1', get_event('Create', 'Bucket1', {'BucketName': 'bucket-1'})),
+      get_record('2', get_event('Update', 'Bucket2', {'BucketName': 'bucket-2'})),
+      get_record('3', get_event('Create', 'Bucket3', {'BucketName': 'bucket-3'})),
+      get_record('4', get_event('Delete', 'Bucket4', {'BucketName': 'bucket-4'})),
+      get_record('5', get_event('Create', 'Invalid', {'Foo': 'bar'})),
+      {'messageId': '6', 'body': 'not json'},
+    ]}
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': '6'}]})
+    # the synapse tags are derived once for each owner
+    self.assertEqual(sorted(c.args[0] for c in self.mocks['get_synapse_tags'].call_args_list),
+                     ['1111111', '2222222'])
+    self.assertEqual(sorted(c.args[0] for c in self.mocks['tag_bucket'].call_args_list),
+                     ['bucket-1', 'bucket-2', 'bucket-3'])
+    self.assertEqual(self.responses['Bucket1'], ('SUCCESS', ''))
+    self.assertEqual(self.responses['Bucket2'], ('SUCCESS', ''))
+    self.assertEqual(self.responses['Bucket3'], ('SUCCESS', ''))
+    self.assertEqual(self.responses['Bucket4'], ('SUCCESS', ''))
+    self.assertEqual(self.responses['Invalid'][0], 'FAILED')
+
+  def test_instance_described_once(self):
+    instance = set_instance_tags.InstanceContext(
+      'i-1234', TagSet({'synapse:ownerId': '1111111'}), ['vol-1'], [])
+    event = {'Records': [get_record('1', get_event('Create', 'Instance', {'InstanceId': 'i-1234'}))]}
+    with patch('set_tags.set_instance_tags.get_instance_context', return_value=instance) as describe_mock, \
+         patch('set_tags.set_instance_tags.tag_instance') as tag_instance_mock:
+      response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': []})
+    describe_mock.assert_called_once_with('i-1234')
+    tag_instance_mock.assert_called_once_with(
+      'i-1234', [{'Key': 'synapse:ownerId', 'Value': '1111111'}], instance)
+
+  @patch.dict('os.environ', {'CFN_REQUEST_MAX_ATTEMPTS': '3'})
+  def test_throttled_request_is_retried(self):
+    self.tag_bucket_errors['bucket-2'] = client_error('SlowDown', 503)
+    event = {'Records': [
+      get_record('1', get_event('Create', 'Bucket1', {'BucketName': 'bucket-1'})),
+      get_record('2', get_event('Create', 'Bucket2', {'BucketName': 'bucket-2'}), attempt=2),
+    ]}
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': '2'}]})
+    self.assertEqual(self.responses, {'Bucket1': ('SUCCESS', '')})
+
+    event['Records'][1]['attributes']['ApproximateReceiveCount'] = '3'
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': []})
+    self.assertEqual(self.responses['Bucket2'][0], 'FAILED')
+
+  def test_transient_request_is_retried(self):
+    self.tag_bucket_errors['bucket-1'] = ConnectionError('Connection reset by peer')
+    event = {'Records': [get_record('1', get_event('Create', 'Bucket1', {'BucketName': 'bucket-1'}))]}
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': '1'}]})
+    self.assertEqual(self.responses, {})
+
+  def test_missing_owner_fails_right_away(self):
+    self.mocks['get_bucket_tags'].side_effect = lambda name: [{'Key': 'foo', 'Value': 'bar'}]
+    event = {'Records': [get_record('1', get_event('Create', 'Bucket1', {'BucketName': 'bucket-1'}))]}
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': []})
+    self.assertEqual(self.responses['Bucket1'][0], 'FAILED')
+
+  def test_client_error_fails_right_away(self):
+    self.tag_bucket_errors['bucket-1'] = client_error('AccessDenied', 403)
+    event = {'Records': [get_record('1', get_event('Create', 'Bucket1', {'BucketName': 'bucket-1'}))]}
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': []})
+    self.assertEqual(self.responses['Bucket1'][0], 'FAILED')
+
+  def test_failed_response_is_retried(self):
+    self.mocks['send_response'].side_effect = Exception('Connection reset')
+    event = {'Records': [get_record('1', get_event('Create', 'Bucket1', {'BucketName': 'bucket-1'}))]}
+    response = request_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': '1'}]})
+
+
+class TestSendResponse(unittest.TestCase):
+
+  def test_send_response(self):
+    event = get_event('Update', 'TagBucket', {'BucketName': 'bucket-1'})
+    event['PhysicalResourceId'] = 'my-stack_TagBucket_ABCDEFGH'
+    with patch('urllib.request.urlopen') as urlopen_mock:
+      urlopen_mock.return_value.__enter__.return_value = MagicMock(status=200)
+      request_worker.send_response(event, 'FAILED', 'x' * 300)
+    request = urlopen_mock.call_args.args[0]
+    self.assertEqual(request.method, 'PUT')
+    self.assertEqual(request.full_url, event['ResponseURL'])
+    body = json.loads(request.data)
+    self.assertEqual(body['Status'], 'FAILED')
+    self.assertEqual(body['PhysicalResourceId'], 'my-stack_TagBucket_ABCDEFGH')
+    self.assertEqual(body['RequestId'], 'request-TagBucket')
+    self.assertLessEqual(len(body['Reason']), 256)
+
+  def test_new_physical_resource_id(self):
+    event = get_event('Create', 'TagBucket', {'BucketName': 'bucket-1'})
+    self.assertRegex(request_worker.get_physical_resource_id(event), r'^my-stack_TagBucket_[A-Z0-9]{8}$')
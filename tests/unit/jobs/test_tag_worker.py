@@ -0,0 +1,62 @@
+import json
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from set_tags import jobs
+from set_tags import tag_worker
+
+
+class TestTagWorker(unittest.TestCase):
+
+  def test_run_jobs(self):
+    with patch('set_tags.set_bucket_tags.tag_bucket') as bucket_mock, \
+      patch('set_tags.set_instance_tags.tag_instance') as instance_mock, \
+      patch('set_tags.set_batch_tags.tag_stack_batch_resources') as batch_mock:
+      tag_worker.run_job({'Kind': 'bucket', 'Resource': 'my-bucket', 'StackId': None})
+      tag_worker.run_job({'Kind': 'instance', 'Resource': 'i-1234', 'StackId': None})
+      tag_worker.run_job({'Kind': 'batch', 'Resource': ['arn'], 'StackId': 'stack'})
+      bucket_mock.assert_called_once_with('my-bucket')
+      instance_mock.assert_called_once_with('i-1234')
+      batch_mock.assert_called_once_with('stack', ['arn'])
+
+  def test_unknown_job(self):
+    with self.assertRaises(ValueError):
+      tag_worker.run_job({'Kind': 'table', 'Resource': 'my-table'})
+
+  def test_handler_reports_failures(self):
+    event = {'Records': [
+      {'messageId': '1', 'body': json.dumps({'Kind': 'bucket', 'Resource': 'bucket-1'})},
+      {'messageId': '2', 'body': json.dumps({'Kind': 'bucket', 'Resource': 'bucket-2'})},
+      {'messageId': '3', 'body': 'not json'},
+    ]}
+    def tag_bucket(bucket_name):
+      if bucket_name == 'bucket-2':
+        raise Exception('Throttled')
+
+    with patch('set_tags.set_bucket_tags.tag_bucket', side_effect=tag_bucket):
+      response = tag_worker.handler(event, None)
+    self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': '2'},
+                                                      {'itemIdentifier': '3'}]})
+
+  def test_process_file_queue_retries(self):
+    attempts = []
+    def tag_bucket(bucket_name):
+      attempts.append(bucket_name)
+      if bucket_name == 'bucket-2' and attempts.count(bucket_name) < 2:
+        raise Exception('Throttled')
+      if bucket_name == 'bucket-3':
+        raise Exception('AccessDenied')
+
+    with tempfile.TemporaryDirectory() as tmp:
+      queue = jobs.FileQueue(tmp)
+      for bucket_name in ['bucket-1', 'bucket-2', 'bucket-3']:
+        queue.send({'Kind': 'bucket', 'Resource': bucket_name, 'StackId': None})
+      with patch('set_tags.set_bucket_tags.tag_bucket', side_effect=tag_bucket):
+        remaining = tag_worker.process_file_queue(tmp, max_attempts=3)
+      self.assertEqual(remaining, 1)
+      self.assertEqual(queue.receive()[0][1]['Resource'], 'bucket-3')
+      self.assertEqual(attempts.count('bucket-1'), 1)
+      self.assertEqual(attempts.count('bucket-2'), 2)
+      self.assertEqual(attempts.count('bucket-3'), 3)
@@ -0,0 +1,68 @@
+import logging
+import unittest
+
+from unittest.mock import patch
+
+from set_tags import logs
+
+
+class TestGetLogLevel(unittest.TestCase):
+
+  @patch.dict('os.environ', {}, clear=True)
+  def test_default(self):
+    self.assertEqual(logs.get_log_level(), 'INFO')
+
+  @patch.dict('os.environ', {'LOG_LEVEL': 'debug'})
+  def test_from_env(self):
+    self.assertEqual(logs.get_log_level(), 'DEBUG')
+
+  @patch.dict('os.environ', {'LOG_LEVEL': 'LOUD'})
+  def test_invalid(self):
+    self.assertEqual(logs.get_log_level(), 'INFO')
+
+
+class Formatted:
+  '''Counts how many times it is formatted'''
+
+  def __init__(self):
+    self.count = 0
+
+  def __str__(self):
+    self.count += 1
+    return 'formatted'
+
+
+class TestTruncated(unittest.TestCase):
+
+  def test_short_value(self):
+    self.assertEqual(str(logs.Truncated({'Key': 'a'})), "{'Key': 'a'}")
+
+  @patch.dict('os.environ', {'LOG_MAX_VALUE_LENGTH': '10'})
+  def test_long_value(self):
+    self.assertEqual(str(logs.Truncated('x' * 25)), 'xxxxxxxxxx... [15 more characters]')
+
+  @patch.dict('os.environ', {'LOG_MAX_VALUE_LENGTH': '0'})
+  def test_no_limit(self):
+    self.assertEqual(str(logs.Truncated('x' * 5000)), 'x' * 5000)
+
+  @patch.dict('os.environ', {'LOG_MAX_VALUE_LENGTH': 'short'})
+  def test_invalid_limit(self):
+    self.assertEqual(logs.get_max_value_length(), logs.DEFAULT_MAX_VALUE_LENGTH)
+    self.assertEqual(str(logs.Truncated('x' * 25)), 'x' * 25)
+
+  def test_json_format(self):
+    self.assertEqual(str(logs.Truncated({'a': 1}, logs.to_json)), '{"a": 1}')
+
+  def test_not_formatted_when_disabled(self):
+    value = Formatted()
+    log = logging.getLogger('test_logs')
+    log.setLevel(logging.INFO)
+    log.debug('value: %s', logs.Truncated(value))
+    self.assertEqual(value.count, 0)
+
+  def test_formatted_when_enabled(self):
+    value = Formatted()
+    log = logging.getLogger('test_logs')
+    with self.assertLogs(log, level='DEBUG') as captured:
+      log.debug('value: %s', logs.Truncated(value))
+    self.assertEqual(captured.records[0].getMessage(), 'value: formatted')
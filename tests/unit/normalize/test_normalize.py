@@ -0,0 +1,70 @@
+import random
+import re
+import unittest
+
+from set_tags import normalize
+
+
+class TestSanitize(unittest.TestCase):
+
+  def test_valid_unchanged(self):
+    self.assertEqual(normalize.sanitize('jsmith@synapse.org'), 'jsmith@synapse.org')
+
+  def test_invalid_replaced(self):
+    self.assertEqual(normalize.sanitize('Joe (Barry) Müller'), 'Joe  Barry  M ller')
+
+  def test_same_as_regex(self):
+    pattern = r'[^a-zA-Z0-9.+=_:@/\-]'
+    alphabet = [chr(c) for c in range(0, 0x250)] + ['😀', '中', '​']
+    rng = random.Random(0)
+    for _ in range(500):
+      text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+      self.assertEqual(normalize.sanitize(text), re.sub(pattern, ' ', text))
+
+
+class TestNormalizeTags(unittest.TestCase):
+
+  def test_truncated(self):
+    tags = [{'Key': 'k' * 200, 'Value': 'v' * 300}]
+    result = normalize.normalize_tags(tags)
+    self.assertEqual(result, [{'Key': 'k' * 128, 'Value': 'v' * 256}])
+
+  def test_reserved_prefix_dropped(self):
+    tags = [
+      {'Key': 'AWS:cloudformation:stack-id', 'Value': 'x'},
+      {'Key': 'synapse:ownerId', 'Value': '1111111'},
+    ]
+    result = normalize.normalize_tags(tags)
+    self.assertEqual(result, [{'Key': 'synapse:ownerId', 'Value': '1111111'}])
+
+  def test_duplicate_key_last_wins(self):
+    tags = [
+      {'Key': 'a', 'Value': '1'},
+      {'Key': 'b', 'Value': '2'},
+      {'Key': 'a', 'Value': '3'},
+    ]
+    result = normalize.normalize_tags(tags)
+    self.assertEqual(result, [{'Key': 'a', 'Value': '3'}, {'Key': 'b', 'Value': '2'}])
+
+  def test_too_many_tags(self):
+    tags = [{'Key': f'key{i}', 'Value': 'v'} for i in range(51)]
+    with self.assertRaises(ValueError):
+      normalize.normalize_tags(tags)
+
+  def test_custom_rules(self):
+    rules = normalize.TagRules(max_value_length=3, valid_chars='abc')
+    result = normalize.normalize_tags([{'Key': 'abd', 'Value': 'abcabc'}], rules)
+    self.assertEqual(result, [{'Key': 'ab ', 'Value': 'abc'}])
+
+
+class TestCheckCount(unittest.TestCase):
+
+  def test_reserved_not_counted(self):
+    tags = {f'key{i}': 'v' for i in range(50)}
+    tags['aws:cloudformation:stack-id'] = 'x'
+    normalize.check_count(tags)
+
+  def test_too_many_tags(self):
+    tags = {f'key{i}': 'v' for i in range(51)}
+    with self.assertRaises(ValueError):
+      normalize.check_count(tags)
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from set_tags import prewarm
+from set_tags import utils
+
+LAMBDA_ENV = {'AWS_LAMBDA_FUNCTION_NAME': 'set-instance-tags', 'RECENT_OWNERS_PARAM_NAME': '/tagger/RecentOwners'}
+
+
+def get_parameter(owner_ids):
+  return {'Parameter': {'Value': json.dumps(owner_ids)}}
+
+
+class TestWarm(unittest.TestCase):
+
+  @patch.dict('os.environ', {**LAMBDA_ENV, 'PREWARM_ROLE_NAMES': 'ServiceCatalogEndusers', 'PREWARM_OWNER_COUNT': '2'})
+  def test_warm(self):
+    with patch('set_tags.utils.get_synapse_team_ids', return_value=['3412821']) as get_team_ids, \
+         patch('set_tags.utils.get_synapse_client') as get_synapse_client, \
+         patch('set_tags.utils.get_role_id', return_value='AROAJSF3OGX4T2JZ2S7PA') as get_role_id, \
+         patch('set_tags.utils.get_ssm_parameter', return_value=get_parameter(['1', '2', '3'])), \
+         patch('set_tags.utils.get_synapse_user_profile') as get_profile, \
+         patch('set_tags.utils.get_synapse_user_team_id') as get_team_id:
+      prewarm.warm()
+      get_team_ids.assert_called_once()
+      get_synapse_client.assert_called_once()
+      get_role_id.assert_called_once_with('ServiceCatalogEndusers')
+      self.assertCountEqual([call.args[0] for call in get_profile.call_args_list], ['1', '2'])
+      get_team_id.assert_any_call('1', ['3412821'])
+
+  @patch.dict('os.environ', LAMBDA_ENV)
+  def test_warm_continues_after_failure(self):
+    with patch('set_tags.utils.get_synapse_team_ids', side_effect=Exception('ssm is down')), \
+         patch('set_tags.utils.get_synapse_client') as get_synapse_client, \
+         patch('set_tags.utils.get_ssm_parameter', return_value=get_parameter(['1'])), \
+         patch('set_tags.utils.get_synapse_user_profile', side_effect=Exception('synapse is down')), \
+         patch('set_tags.utils.get_synapse_user_team_id'):
+      prewarm.warm()
+      get_synapse_client.assert_called_once()
+
+
+class TestStart(unittest.TestCase):
+
+  @patch.dict('os.environ', {'AWS_LAMBDA_FUNCTION_NAME': ''})
+  def test_start_outside_lambda(self):
+    with patch('set_tags.prewarm.warm') as warm:
+      prewarm.start()
+      prewarm.wait()
+      warm.assert_not_called()
+
+  @patch.dict('os.environ', {**LAMBDA_ENV, 'PREWARM_ENABLED': 'false'})
+  def test_start_disabled(self):
+    with patch('set_tags.prewarm.warm') as warm:
+      prewarm.start()
+      prewarm.wait()
+      warm.assert_not_called()
+
+  @patch.dict('os.environ', {**LAMBDA_ENV, 'AWS_LAMBDA_INITIALIZATION_TYPE': 'provisioned-concurrency'})
+  def test_start_once_provisioned(self):
+    done = threading.Event()
+    with patch('set_tags.prewarm.warm', side_effect=lambda: (time.sleep(0.05), done.set())) as warm:
+      prewarm.start()
+      # the init phase waits for pre-warming with provisioned concurrency
+      self.assertTrue(done.is_set())
+      prewarm.start()
+      warm.assert_called_once()
+
+  @patch.dict('os.environ', {**LAMBDA_ENV, 'AWS_LAMBDA_INITIALIZATION_TYPE': 'on-demand'})
+  def test_request_joins_lookup_in_flight(self):
+    started = threading.Event()
+    synapse_client = MagicMock()
+    def get_user_profile(synapse_id):
+      started.set()
+      time.sleep(0.1)
+      return {'ownerId': synapse_id, 'userName': 'jsmith'}
+    synapse_client.getUserProfile.side_effect = get_user_profile
+    with patch('set_tags.utils.get_synapse_client', return_value=synapse_client), \
+         patch('set_tags.prewarm.warm', side_effect=lambda: utils.get_synapse_user_profile('1111111')):
+      prewarm.start()
+      self.assertTrue(started.wait(1))
+      user_profile = utils.get_synapse_user_profile('1111111')
+      prewarm.wait()
+    self.assertEqual(user_profile['userName'], 'jsmith')
+    synapse_client.getUserProfile.assert_called_once_with('1111111')
+
+
+class TestSaveRecentOwnerIds(unittest.TestCase):
+
+  @patch.dict('os.environ', {**LAMBDA_ENV, 'PREWARM_SAVE_INTERVAL': '900'})
+  def test_save_merges_and_throttles(self):
+    ssm_client = MagicMock()
+    utils.remember_owner_id('1')
+    utils.remember_owner_id('2')
+    with patch('set_tags.utils.get_ssm_client', return_value=ssm_client), \
+         patch('set_tags.utils.get_ssm_parameter', return_value=get_parameter(['3', '1'])):
+      prewarm.save_recent_owner_ids()
+      prewarm.save_recent_owner_ids()
+    ssm_client.put_parameter.assert_called_once_with(
+      Name='/tagger/RecentOwners', Value=json.dumps(['2', '1', '3']), Type='String', Overwrite=True)
+
+  @patch.dict('os.environ', LAMBDA_ENV)
+  def test_save_nothing_seen(self):
+    with patch('set_tags.utils.get_ssm_client') as get_ssm_client:
+      prewarm.save_recent_owner_ids()
+    get_ssm_client.assert_not_called()
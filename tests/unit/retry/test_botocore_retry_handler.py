@@ -0,0 +1,67 @@
+import unittest
+
+from unittest.mock import patch
+
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+from set_tags import retry
+from set_tags import utils
+
+
+class TestBotocoreRetryHandler(unittest.TestCase):
+  '''Send batch requests through botocore with canned HTTP responses'''
+
+  THROTTLED = (429, b'{"__type": "ThrottlingException", "message": "Rate exceeded"}')
+  DENIED = (403, b'{"__type": "AccessDeniedException", "message": "Denied"}')
+  OK = (200, b'{"tags": {"foo": "bar"}}')
+
+  def send(self, responses):
+    sent = []
+    def before_send(request, **kwargs):
+      sent.append(request.url)
+      status_code, body = responses[len(sent) - 1]
+      return AWSResponse(request.url, status_code, {}, MockRaw(body))
+
+    batch = utils.get_batch_client()
+    batch.meta.events.register('before-send', before_send)
+    try:
+      return batch.list_tags_for_resource(resourceArn='arn:aws:batch:job-queue/q')
+    finally:
+      self.sent = len(sent)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                             'AWS_SECRET_ACCESS_KEY': 'testing'})
+  @patch('time.sleep')
+  def test_throttle_retried(self, sleep_mock):
+    response = self.send([self.THROTTLED, self.THROTTLED, self.OK])
+    self.assertEqual(response['tags'], {'foo': 'bar'})
+    self.assertEqual(self.sent, 3)
+    self.assertEqual(retry.get_metrics()['batch'],
+                     {'calls': 3, 'throttles': 2, 'retries': 2})
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                             'AWS_SECRET_ACCESS_KEY': 'testing', 'AWS_MAX_ATTEMPTS': '2'})
+  @patch('time.sleep')
+  def test_max_attempts(self, sleep_mock):
+    with self.assertRaises(ClientError):
+      self.send([self.THROTTLED, self.THROTTLED, self.OK])
+    self.assertEqual(self.sent, 2)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'testing',
+                             'AWS_SECRET_ACCESS_KEY': 'testing'})
+  @patch('time.sleep')
+  def test_not_retryable(self, sleep_mock):
+    with self.assertRaises(ClientError):
+      self.send([self.DENIED, self.OK])
+    self.assertEqual(self.sent, 1)
+
+
+class MockRaw:
+  '''The raw urllib3 response read by botocore'''
+
+  def __init__(self, body):
+    self.body = body
+
+  def stream(self, **kwargs):
+    yield self.body
@@ -0,0 +1,64 @@
+import unittest
+
+from set_tags import retry
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 100.0
+    self.slept = []
+
+  def __call__(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.slept.append(seconds)
+    self.now += seconds
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.limiter = retry.AdaptiveRateLimiter(min_rate=0.5, clock=self.clock,
+                                             sleep=self.clock.sleep)
+
+  def succeed(self, count):
+    for _ in range(count):
+      self.limiter.acquire()
+      self.limiter.on_success()
+
+  def test_unlimited_until_throttled(self):
+    for _ in range(100):
+      self.assertEqual(self.limiter.acquire(), 0)
+    self.assertIsNone(self.limiter.rate)
+
+  def test_throttle_limits_to_accepted_rate(self):
+    self.succeed(10)
+    self.limiter.on_throttle()
+    self.assertEqual(self.limiter.rate, 9)
+    # requests are now spaced 1 / 9 seconds apart
+    self.limiter.acquire()
+    self.limiter.acquire()
+    self.limiter.acquire()
+    self.assertAlmostEqual(sum(self.clock.slept), 2 / 9)
+
+  def test_throttles_after_cut_ignored(self):
+    self.succeed(10)
+    self.limiter.on_throttle()
+    self.clock.now += 0.5
+    self.limiter.on_throttle()
+    self.assertEqual(self.limiter.rate, 9)
+
+  def test_min_rate(self):
+    for _ in range(10):
+      self.limiter.on_throttle()
+      self.clock.now += 1
+    self.assertEqual(self.limiter.rate, 0.5)
+
+  def test_success_lifts_limit(self):
+    self.succeed(10)
+    self.limiter.on_throttle()
+    self.succeed(1000)
+    self.assertIsNone(self.limiter.rate)
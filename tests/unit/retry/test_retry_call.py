@@ -0,0 +1,100 @@
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+from set_tags import retry
+
+
+def client_error(code, status_code=400):
+  return ClientError({
+    'Error': {'Code': code, 'Message': ''},
+    'ResponseMetadata': {'HTTPStatusCode': status_code},
+  }, 'TagResource')
+
+
+class HTTPError(Exception):
+
+  def __init__(self, status_code):
+    super().__init__(f'HTTP {status_code}')
+    self.response = MagicMock(status_code=status_code)
+
+
+@patch('time.sleep')
+class TestRetryCall(unittest.TestCase):
+
+  def test_success(self, sleep_mock):
+    fn = MagicMock(return_value='ok')
+    self.assertEqual(retry.call('batch', fn, 'arn', tags={}), 'ok')
+    fn.assert_called_once_with('arn', tags={})
+    self.assertEqual(retry.get_metrics(), {'batch': {'calls': 1}})
+
+  def test_throttle_retried(self, sleep_mock):
+    fn = MagicMock(side_effect=[client_error('ThrottlingException'), 'ok'])
+    self.assertEqual(retry.call('batch', fn), 'ok')
+    self.assertEqual(retry.get_metrics(),
+                     {'batch': {'calls': 2, 'throttles': 1, 'retries': 1}})
+    sleep_mock.assert_called_once()
+
+  def test_synapse_throttle_retried(self, sleep_mock):
+    fn = MagicMock(side_effect=[HTTPError(429), HTTPError(503), 'ok'])
+    self.assertEqual(retry.call('synapse', fn), 'ok')
+    self.assertEqual(retry.get_metrics()['synapse']['retries'], 2)
+
+  def test_not_retryable(self, sleep_mock):
+    fn = MagicMock(side_effect=client_error('AccessDenied', 403))
+    with self.assertRaises(ClientError):
+      retry.call('batch', fn)
+    fn.assert_called_once()
+    sleep_mock.assert_not_called()
+
+  def test_max_attempts(self, sleep_mock):
+    fn = MagicMock(side_effect=client_error('ThrottlingException'))
+    with self.assertRaises(ClientError):
+      retry.call('batch', fn, max_attempts=4)
+    self.assertEqual(fn.call_count, 4)
+
+  @patch.dict('os.environ', {'RETRY_BUDGET': '2'})
+  def test_budget(self, sleep_mock):
+    fn = MagicMock(side_effect=client_error('ThrottlingException'))
+    with self.assertRaises(ClientError):
+      retry.call('batch', fn, max_attempts=10)
+    self.assertEqual(fn.call_count, 3)
+    self.assertEqual(retry.get_metrics()['batch']['budget_exhausted'], 1)
+    # the next invocation gets a new budget
+    retry.start_invocation()
+    fn.reset_mock()
+    with self.assertRaises(ClientError):
+      retry.call('batch', fn, max_attempts=10)
+    self.assertEqual(fn.call_count, 3)
+
+  @patch.dict('os.environ', {'RETRY_BUDGET': '2'})
+  def test_budget_per_unit(self, sleep_mock):
+    fn = MagicMock(side_effect=client_error('ThrottlingException'))
+    with self.assertRaises(ClientError):
+      retry.run(retry.call, 'batch', fn, max_attempts=10)
+    self.assertEqual(fn.call_count, 3)
+    # another unit of work gets its own budget, as does the invocation
+    for _ in range(2):
+      fn.reset_mock()
+      with self.assertRaises(ClientError):
+        retry.run(retry.call, 'batch', fn, max_attempts=10)
+      self.assertEqual(fn.call_count, 3)
+    fn.reset_mock()
+    with self.assertRaises(ClientError):
+      retry.call('batch', fn, max_attempts=10)
+    self.assertEqual(fn.call_count, 3)
+
+  @patch.dict('os.environ', {'RETRY_BUDGET': 'many', 'RETRY_BASE_DELAY': 'short'})
+  def test_invalid_env_vars(self, sleep_mock):
+    fn = MagicMock(side_effect=[client_error('ThrottlingException'), 'ok'])
+    self.assertEqual(retry.call('batch', fn), 'ok')
+    self.assertEqual(retry.get_budget().capacity, 20)
+
+  @patch.dict('os.environ', {'RETRY_BASE_DELAY': '1', 'RETRY_MAX_DELAY': '3'})
+  def test_backoff(self, sleep_mock):
+    for attempt in range(1, 10):
+      delay = retry.get_backoff(attempt)
+      self.assertGreaterEqual(delay, 0)
+      self.assertLessEqual(delay, min(3, 2 ** (attempt - 1)))
@@ -0,0 +1,36 @@
+import unittest
+
+from unittest.mock import patch
+
+import change_owner
+
+
+class TestChangeOwnerGetResources(unittest.TestCase):
+
+  STACK_ID = 'arn:aws:cloudformation:us-east-1:999999999999:stack/SC-999999999999-pp-1/abc'
+  STACK_RESOURCES = {
+    'bucket': ['my-bucket'],
+    'batch': ['arn:aws:batch:job-queue/q'],
+  }
+
+  def test_discover_from_product(self):
+    with patch('set_tags.bulk.get_product_stack_id', return_value=self.STACK_ID) as stack_mock, \
+      patch('set_tags.bulk.get_stack_resources', return_value=self.STACK_RESOURCES) as resources_mock:
+      result = change_owner.get_resources({'ProvisionedProductId': 'pp-1'})
+      stack_mock.assert_called_once_with('pp-1')
+      resources_mock.assert_called_once_with(self.STACK_ID)
+      self.assertEqual(result, self.STACK_RESOURCES)
+
+  def test_explicit_resources(self):
+    with patch('set_tags.bulk.get_stack_resources') as resources_mock:
+      result = change_owner.get_resources({'ProvisionedProductId': 'pp-1', 'InstanceId': 'i-1'})
+      resources_mock.assert_not_called()
+      self.assertEqual(result, {'instance': ['i-1']})
+
+  def test_explicit_stack(self):
+    with patch('set_tags.bulk.get_product_stack_id') as stack_mock, \
+      patch('set_tags.bulk.get_stack_resources', return_value=self.STACK_RESOURCES):
+      result = change_owner.get_resources({
+        'ProvisionedProductId': 'pp-1', 'StackId': self.STACK_ID, 'BucketName': 'my-bucket'})
+      stack_mock.assert_not_called()
+      self.assertEqual(result, self.STACK_RESOURCES)
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import change_owner
+
+
+class TestChangeOwnerManifest(unittest.TestCase):
+
+  OWNER_1 = 'arn:aws:sts::999999999999:assumed-role/ServiceCatalogEndusers/1111111'
+  OWNER_2 = 'arn:aws:sts::999999999999:assumed-role/ServiceCatalogEndusers/2222222'
+  ROWS = [
+    {'ProvisionedProductId': 'pp-1', 'NewOwnerArn': OWNER_1, 'BucketName': 'bucket-1'},
+    {'ProvisionedProductId': 'pp-2', 'NewOwnerArn': OWNER_2, 'InstanceId': 'i-2'},
+    {'ProvisionedProductId': 'pp-3', 'NewOwnerArn': OWNER_1, 'InstanceId': 'i-3'},
+  ]
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    self.result_file = os.path.join(self.tmp.name, 'results.jsonl')
+
+  def read_results(self):
+    with open(self.result_file) as f:
+      return sorted((json.loads(line) for line in f), key=lambda result: result['Row'])
+
+  def test_read_csv_and_jsonl(self):
+    csv_path = os.path.join(self.tmp.name, 'manifest.csv')
+    with open(csv_path, 'w') as f:
+      f.write('ProvisionedProductId,NewOwnerArn,BucketName\n')
+      f.write(f'pp-1,{self.OWNER_1},bucket-1\n')
+    jsonl_path = os.path.join(self.tmp.name, 'manifest.jsonl')
+    with open(jsonl_path, 'w') as f:
+      f.write(json.dumps(self.ROWS[0]) + '\n')
+    self.assertEqual(change_owner.read_manifest(csv_path), [self.ROWS[0]])
+    self.assertEqual(change_owner.read_manifest(jsonl_path), [self.ROWS[0]])
+
+  def test_read_invalid_row(self):
+    jsonl_path = os.path.join(self.tmp.name, 'manifest.jsonl')
+    with open(jsonl_path, 'w') as f:
+      f.write(json.dumps({'ProvisionedProductId': 'pp-1'}) + '\n')
+    with self.assertRaises(ValueError):
+      change_owner.read_manifest(jsonl_path)
+
+  def test_tags_derived_once_per_owner(self):
+    with patch('change_owner.get_new_owner_tags', side_effect=lambda arn: [arn]) as tags_mock, \
+      patch('change_owner.change_owner') as change_owner_mock:
+      failed = change_owner.run_manifest(self.ROWS, self.result_file)
+      self.assertEqual(failed, 0)
+      self.assertEqual(tags_mock.call_count, 2)
+      calls = {c.args[0]['ProvisionedProductId']: c.args[1] for c in change_owner_mock.call_args_list}
+      self.assertEqual(calls, {'pp-1': [self.OWNER_1], 'pp-2': [self.OWNER_2], 'pp-3': [self.OWNER_1]})
+    self.assertEqual([r['Status'] for r in self.read_results()], ['SUCCESS'] * 3)
+
+  def test_failed_rows(self):
+    def get_new_owner_tags(arn):
+      if arn == self.OWNER_2:
+        raise Exception('User not found')
+      return []
+
+    def change_owner_row(row, synapse_tags):
+      if row['ProvisionedProductId'] == 'pp-3':
+        raise Exception('AccessDenied')
+
+    with patch('change_owner.get_new_owner_tags', side_effect=get_new_owner_tags), \
+      patch('change_owner.change_owner', side_effect=change_owner_row):
+      failed = change_owner.run_manifest(self.ROWS, self.result_file)
+    self.assertEqual(failed, 2)
+    results = self.read_results()
+    self.assertEqual([r['Status'] for r in results], ['SUCCESS', 'FAILED', 'FAILED'])
+    self.assertEqual(results[1]['Error'], 'User not found')
+    self.assertEqual(results[2]['Error'], 'AccessDenied')
+    self.assertEqual(results[0]['BucketName'], 'bucket-1')
@@ -0,0 +1,40 @@
+import unittest
+
+from argparse import Namespace
+from unittest.mock import patch
+
+import retag
+from set_tags import targets
+
+EAST_STACK = 'arn:aws:cloudformation:us-east-1:111111111111:stack/SC-111111111111-pp-1/abc'
+WEST_STACK = 'arn:aws:cloudformation:us-west-2:111111111111:stack/SC-111111111111-pp-2/def'
+
+
+def get_args(stack_ids):
+  return Namespace(StackIds=stack_ids, ProvisionedProductIds=[], TagFilter=[])
+
+
+class TestRetagGetStackIds(unittest.TestCase):
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1'})
+  def test_single_target_keeps_every_stack(self):
+    result = retag.get_stack_ids(get_args([EAST_STACK, WEST_STACK]), False)
+    self.assertEqual(result, [EAST_STACK, WEST_STACK])
+
+  def test_multi_target_keeps_owned_stacks(self):
+    with targets.use(targets.Target('us-west-2')):
+      result = retag.get_stack_ids(get_args([EAST_STACK, WEST_STACK]), True)
+    self.assertEqual(result, [WEST_STACK])
+
+  def test_unowned_stacks(self):
+    target_list = targets.get_targets(
+      ['us-west-2', 'eu-west-1'], ['arn:aws:iam::111111111111:role/SynapseTagger'])
+    self.assertEqual(retag.get_unowned_stack_ids([EAST_STACK, WEST_STACK], target_list), [EAST_STACK])
+
+  @patch('sys.argv', ['retag', '--StackIds', EAST_STACK, WEST_STACK, '--Regions', 'us-west-2', 'eu-west-1'])
+  def test_unowned_stacks_fail_the_run(self):
+    with patch('set_tags.bulk.retag_targets', return_value={}) as retag_mock, \
+         self.assertRaises(SystemExit) as exit:
+      retag.main()
+    retag_mock.assert_called_once()
+    self.assertEqual(exit.exception.code, 1)
@@ -54,4 +54,4 @@ class TestGetBatchTags(unittest.TestCase):
       stubber.add_response('list_tags_for_resource', response)
       utils.get_batch_client = MagicMock(return_value=batch)
       valid_resource_id ='some_reasonable_instance_id'
-      result = set_instance_tags.get_instance_tags(valid_resource_id)
+      result = set_batch_tags.get_batch_tags(valid_resource_id)
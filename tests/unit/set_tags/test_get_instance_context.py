@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from botocore.stub import Stubber
+
+from set_tags import set_instance_tags
+from set_tags import utils
+
+
+class TestGetInstanceContext(unittest.TestCase):
+
+  TAGS = [{'Key': 'heresatag', 'Value': 'heresatagvalue'}]
+
+  def describe_instances(self, instance):
+    ec2 = utils.get_ec2_client()
+    with Stubber(ec2) as stubber, \
+      patch('set_tags.utils.get_ec2_client', return_value=ec2):
+      stubber.add_response('describe_instances', {
+        'Reservations': [{'Instances': [instance]}]
+      }, {'InstanceIds': ['i-1234']})
+      return set_instance_tags.get_instance_context('i-1234')
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_happy(self):
+    result = self.describe_instances({
+      'InstanceId': 'i-1234',
+      'Tags': self.TAGS,
+      'BlockDeviceMappings': [
+        {'DeviceName': '/dev/xvda', 'Ebs': {'VolumeId': 'vol-1'}},
+        {'DeviceName': '/dev/xvdb', 'Ebs': {'VolumeId': 'vol-2'}},
+      ],
+      'NetworkInterfaces': [{'NetworkInterfaceId': 'eni-1'}],
+    })
+    self.assertEqual(result, set_instance_tags.InstanceContext(
+      'i-1234', self.TAGS, ['vol-1', 'vol-2'], ['eni-1']))
+    self.assertEqual(result.attachment_ids, ['vol-1', 'vol-2', 'eni-1'])
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_no_attachments(self):
+    result = self.describe_instances({'InstanceId': 'i-1234', 'Tags': self.TAGS})
+    self.assertEqual(result.attachment_ids, [])
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_no_tags(self):
+    with self.assertRaises(Exception):
+      self.describe_instances({'InstanceId': 'i-1234'})
@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import patch
+
+from botocore.stub import Stubber
+
+from set_tags import set_instance_tags
+from set_tags import utils
+
+
+class TestGetResourcesTags(unittest.TestCase):
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_happy(self):
+    ec2 = utils.get_ec2_client()
+    with Stubber(ec2) as stubber, \
+      patch('set_tags.utils.get_ec2_client', return_value=ec2):
+        stubber.add_response('describe_tags', {
+          'Tags': [
+            {'Key': 'foo', 'ResourceId': 'vol-1', 'ResourceType': 'volume', 'Value': 'bar'},
+          ],
+          'NextToken': 'next'
+        }, {'Filters': [{'Name': 'resource-id', 'Values': ['vol-1', 'vol-2', 'eni-1']}]})
+        stubber.add_response('describe_tags', {
+          'Tags': [
+            {'Key': 'foo', 'ResourceId': 'eni-1', 'ResourceType': 'network-interface', 'Value': 'bar'},
+          ]
+        }, {'Filters': [{'Name': 'resource-id', 'Values': ['vol-1', 'vol-2', 'eni-1']}],
+            'NextToken': 'next'})
+        result = set_instance_tags.get_resources_tags(['vol-1', 'vol-2', 'eni-1'])
+        self.assertEqual(result, {
+          'vol-1': [{'Key': 'foo', 'Value': 'bar'}],
+          'vol-2': [],
+          'eni-1': [{'Key': 'foo', 'Value': 'bar'}],
+        })
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_keys_and_many_resources(self):
+    resource_ids = [f'vol-{i}' for i in range(250)]
+    ec2 = utils.get_ec2_client()
+    with Stubber(ec2) as stubber, \
+      patch('set_tags.utils.get_ec2_client', return_value=ec2):
+        stubber.add_response('describe_tags', {
+          'Tags': [{'Key': 'foo', 'ResourceId': 'vol-0', 'ResourceType': 'volume', 'Value': 'bar'}]
+        }, {'Filters': [{'Name': 'resource-id', 'Values': resource_ids[:200]},
+                        {'Name': 'key', 'Values': ['foo']}]})
+        stubber.add_response('describe_tags', {
+          'Tags': [{'Key': 'foo', 'ResourceId': 'vol-249', 'ResourceType': 'volume', 'Value': 'bar'}]
+        }, {'Filters': [{'Name': 'resource-id', 'Values': resource_ids[200:]},
+                        {'Name': 'key', 'Values': ['foo']}]})
+        result = set_instance_tags.get_resources_tags(resource_ids, ['foo'])
+        self.assertEqual(result['vol-0'], [{'Key': 'foo', 'Value': 'bar'}])
+        self.assertEqual(result['vol-249'], [{'Key': 'foo', 'Value': 'bar'}])
+        self.assertEqual(result['vol-1'], [])
+        stubber.assert_no_pending_responses()
+
+  def test_no_resources(self):
+    with patch('set_tags.utils.get_ec2_client') as ec2_mock:
+      self.assertEqual(set_instance_tags.get_resources_tags([]), {})
+      ec2_mock.assert_not_called()
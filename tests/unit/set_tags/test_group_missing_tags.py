@@ -0,0 +1,30 @@
+import unittest
+
+from set_tags import set_instance_tags
+
+
+class TestGroupMissingTags(unittest.TestCase):
+
+  TEST_TAGS = [
+    {'Key': 'foo', 'Value': 'bar'},
+    {'Key': 'foo2', 'Value': 'bar2'}
+  ]
+
+  def test_all_tagged(self):
+    result = set_instance_tags.group_missing_tags({
+      'i-123456789': self.TEST_TAGS,
+      'vol-1': self.TEST_TAGS + [{'Key': 'other', 'Value': 'tag'}],
+    }, self.TEST_TAGS)
+    self.assertEqual(result, [])
+
+  def test_grouped_by_missing_tags(self):
+    result = set_instance_tags.group_missing_tags({
+      'i-123456789': [{'Key': 'foo', 'Value': 'bar'}],
+      'vol-1': [],
+      'vol-2': [],
+      'eni-1': self.TEST_TAGS,
+    }, self.TEST_TAGS)
+    self.assertEqual(result, [
+      ([{'Key': 'foo2', 'Value': 'bar2'}], ['i-123456789']),
+      (self.TEST_TAGS, ['vol-1', 'vol-2']),
+    ])
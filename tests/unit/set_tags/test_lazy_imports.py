@@ -0,0 +1,17 @@
+import subprocess
+import sys
+import unittest
+
+
+class TestLazyImports(unittest.TestCase):
+
+  def test_synapseclient_not_imported_by_handlers(self):
+    # run in a fresh interpreter, the test process has already imported synapseclient
+    code = (
+      'import sys\n'
+      'import set_tags.set_bucket_tags, set_tags.set_instance_tags, set_tags.set_batch_tags\n'
+      'print("synapseclient" in sys.modules)\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env={'AWS_DEFAULT_REGION': 'test-region', 'PATH': ''}, check=True)
+    self.assertEqual(result.stdout.strip(), 'False')
@@ -0,0 +1,46 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from set_tags import set_batch_tags
+
+
+class TestSetBatchApplyTagsToResources(unittest.TestCase):
+
+  RESOURCE_ARNS = [
+    'arn:aws:batch:us-east-1:1111111111:job-definition/my-job:1',
+    'arn:aws:batch:us-east-1:1111111111:job-queue/my-queue',
+    'arn:aws:batch:us-east-1:1111111111:compute-environment/my-env',
+  ]
+  TEST_TAGS = {
+    'foo': 'bar'
+  }
+
+  def test_concurrent(self):
+    # each request blocks until all requests are in flight
+    barrier = threading.Barrier(len(self.RESOURCE_ARNS), timeout=5)
+    with patch('set_tags.set_batch_tags.update_tags') as update_tags_mock:
+      update_tags_mock.side_effect = lambda resource_arn, tags: barrier.wait()
+      set_batch_tags.apply_tags_to_resources(self.RESOURCE_ARNS, self.TEST_TAGS)
+      self.assertEqual(update_tags_mock.call_count, 3)
+
+  @patch.dict('os.environ', {'BATCH_TAG_MAX_WORKERS': '1'})
+  def test_worker_limit(self):
+    with patch('set_tags.set_batch_tags.update_tags') as update_tags_mock:
+      set_batch_tags.apply_tags_to_resources(self.RESOURCE_ARNS, self.TEST_TAGS)
+      tagged = [call.args[0] for call in update_tags_mock.call_args_list]
+      self.assertEqual(tagged, self.RESOURCE_ARNS)
+
+  def test_aggregated_error(self):
+    def update_tags(resource_arn, tags):
+      if 'job-queue' in resource_arn or 'compute-environment' in resource_arn:
+        raise Exception('Throttled')
+
+    with patch('set_tags.set_batch_tags.update_tags') as update_tags_mock:
+      update_tags_mock.side_effect = update_tags
+      with self.assertRaises(Exception) as context:
+        set_batch_tags.apply_tags_to_resources(self.RESOURCE_ARNS, self.TEST_TAGS)
+      self.assertIn(self.RESOURCE_ARNS[1], str(context.exception))
+      self.assertIn(self.RESOURCE_ARNS[2], str(context.exception))
+      self.assertNotIn(self.RESOURCE_ARNS[0], str(context.exception))
+      self.assertEqual(update_tags_mock.call_count, 3)
@@ -0,0 +1,34 @@
+import unittest
+from unittest.mock import patch
+
+from botocore.stub import Stubber
+
+from set_tags import set_batch_tags
+from set_tags import utils
+
+
+class TestSetBatchUpdateTags(unittest.TestCase):
+
+  RESOURCE_ARN = 'arn:aws:batch:us-east-1:1111111111:job-queue/my-queue'
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_missing_tags(self):
+    batch = utils.get_batch_client()
+    with Stubber(batch) as stubber, \
+      patch('set_tags.utils.get_batch_client', return_value=batch):
+        stubber.add_response('list_tags_for_resource', {'tags': {'foo': 'bar'}},
+                             {'resourceArn': self.RESOURCE_ARN})
+        stubber.add_response('tag_resource', {},
+                             {'resourceArn': self.RESOURCE_ARN, 'tags': {'foo2': 'bar2'}})
+        set_batch_tags.update_tags(self.RESOURCE_ARN, {'foo': 'bar', 'foo2': 'bar2'})
+        stubber.assert_no_pending_responses()
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_already_tagged(self):
+    batch = utils.get_batch_client()
+    with Stubber(batch) as stubber, \
+      patch('set_tags.utils.get_batch_client', return_value=batch):
+        stubber.add_response('list_tags_for_resource', {'tags': {'foo': 'bar', 'other': 'tag'}},
+                             {'resourceArn': self.RESOURCE_ARN})
+        set_batch_tags.update_tags(self.RESOURCE_ARN, {'foo': 'bar'})
+        stubber.assert_no_pending_responses()
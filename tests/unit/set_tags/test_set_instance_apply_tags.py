@@ -33,4 +33,37 @@ class TestSetInstanceTagsHandler(unittest.TestCase):
             'HTTPHeaders': {}
           }})
       utils.get_ec2_client = MagicMock(return_value=ec2)
-      result = set_instance_tags.apply_tags(self.TEST_INSTANCE_ID, self.TEST_TAGS)
+      result = set_instance_tags.apply_tags([self.TEST_INSTANCE_ID], self.TEST_TAGS)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_chunked_resources(self):
+    ec2 = utils.get_ec2_client()
+    with Stubber(ec2) as stubber, \
+      patch('set_tags.utils.get_ec2_client', return_value=ec2), \
+      patch('set_tags.set_instance_tags.CREATE_TAGS_MAX_RESOURCES', 2):
+        stubber.add_response('create_tags', {}, {
+          'Resources': ['i-123456789', 'vol-1'],
+          'Tags': self.TEST_TAGS
+        })
+        stubber.add_response('create_tags', {}, {
+          'Resources': ['eni-1'],
+          'Tags': self.TEST_TAGS
+        })
+        set_instance_tags.apply_tags(['i-123456789', 'vol-1', 'eni-1'], self.TEST_TAGS)
+        stubber.assert_no_pending_responses()
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_partial_failure(self):
+    ec2 = utils.get_ec2_client()
+    with Stubber(ec2) as stubber, \
+      patch('set_tags.utils.get_ec2_client', return_value=ec2):
+        stubber.add_client_error('create_tags', 'InvalidVolume.NotFound')
+        stubber.add_response('create_tags', {}, {
+          'Resources': ['i-123456789'],
+          'Tags': self.TEST_TAGS
+        })
+        stubber.add_client_error('create_tags', 'InvalidVolume.NotFound',
+          expected_params={'Resources': ['vol-1'], 'Tags': self.TEST_TAGS})
+        with self.assertRaisesRegex(Exception, 'vol-1'):
+          set_instance_tags.apply_tags(['i-123456789', 'vol-1'], self.TEST_TAGS)
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,26 @@
+import unittest
+from unittest.mock import patch
+
+from set_tags import set_bucket_tags
+
+
+class TestTagBucket(unittest.TestCase):
+
+  def test_too_many_tags(self):
+    bucket_tags = [{'Key': f'key{i}', 'Value': 'v'} for i in range(45)]
+    bucket_tags.append({'Key': 'aws:cloudformation:stack-id', 'Value': 'x'})
+    synapse_tags = [{'Key': f'synapse:key{i}', 'Value': 'v'} for i in range(10)]
+    with patch('set_tags.set_bucket_tags.get_bucket_tags', return_value=bucket_tags), \
+         patch('set_tags.set_bucket_tags.apply_tags') as apply_mock:
+      with self.assertRaises(ValueError):
+        set_bucket_tags.tag_bucket('my-bucket', synapse_tags)
+      apply_mock.assert_not_called()
+
+  def test_reserved_tags_not_counted(self):
+    bucket_tags = [{'Key': f'key{i}', 'Value': 'v'} for i in range(45)]
+    bucket_tags.append({'Key': 'aws:cloudformation:stack-id', 'Value': 'x'})
+    synapse_tags = [{'Key': f'synapse:key{i}', 'Value': 'v'} for i in range(5)]
+    with patch('set_tags.set_bucket_tags.get_bucket_tags', return_value=bucket_tags), \
+         patch('set_tags.set_bucket_tags.apply_tags') as apply_mock:
+      set_bucket_tags.tag_bucket('my-bucket', synapse_tags)
+      self.assertEqual(len(apply_mock.call_args.args[1]), 51)
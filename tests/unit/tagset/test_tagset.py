@@ -0,0 +1,64 @@
+import unittest
+
+from set_tags.tagset import TagSet
+
+
+class TestTagSet(unittest.TestCase):
+
+  def test_from_list(self):
+    tags = TagSet([{'Key': 'foo', 'Value': 'bar'}, {'Key': 'foo2', 'Value': 'bar2'}])
+    self.assertEqual(tags['foo'], 'bar')
+    self.assertIn('foo2', tags)
+    self.assertEqual(list(tags), ['foo', 'foo2'])
+    self.assertEqual(len(tags), 2)
+
+  def test_duplicate_key_keeps_last_value(self):
+    tags = TagSet([{'Key': 'foo', 'Value': 'bar'}, {'Key': 'foo', 'Value': 'bar2'}])
+    self.assertEqual(tags.as_dict(), {'foo': 'bar2'})
+
+  def test_invalid_input(self):
+    with self.assertRaises(TypeError):
+      TagSet('foo')
+
+  def test_of_returns_tag_set_as_is(self):
+    tags = TagSet({'foo': 'bar'})
+    self.assertIs(TagSet.of(tags), tags)
+
+  def test_wire_formats(self):
+    tags = TagSet({'foo': 'bar', 'foo2': 'bar2'})
+    self.assertEqual(tags.as_list(), [{'Key': 'foo', 'Value': 'bar'}, {'Key': 'foo2', 'Value': 'bar2'}])
+    self.assertIs(tags.as_list(), tags.as_list())
+    self.assertEqual(tags.as_dict(), {'foo': 'bar', 'foo2': 'bar2'})
+
+  def test_equal_to_either_form(self):
+    tags = TagSet({'foo': 'bar'})
+    self.assertEqual(tags, {'foo': 'bar'})
+    self.assertEqual(tags, [{'Key': 'foo', 'Value': 'bar'}])
+    self.assertEqual(tags, TagSet([{'Key': 'foo', 'Value': 'bar'}]))
+    self.assertNotEqual(tags, {'foo': 'bar2'})
+    self.assertEqual(hash(tags), hash(TagSet({'foo': 'bar'})))
+
+  def test_is_not_changed_by_its_source(self):
+    tags_kp = {'foo': 'bar'}
+    tags = TagSet(tags_kp)
+    tags_kp['foo'] = 'bar2'
+    self.assertEqual(tags['foo'], 'bar')
+
+  def test_override(self):
+    tags = TagSet({'foo': 'bar', 'foo2': 'bar2'})
+    result = tags.override([{'Key': 'foo', 'Value': 'new'}, {'Key': 'foo3', 'Value': 'bar3'}])
+    self.assertEqual(result.as_dict(), {'foo': 'new', 'foo2': 'bar2', 'foo3': 'bar3'})
+    self.assertEqual(tags, {'foo': 'bar', 'foo2': 'bar2'})
+    self.assertEqual(tags | {'foo': 'new'}, {'foo': 'new', 'foo2': 'bar2'})
+
+  def test_merge(self):
+    tags = TagSet({'foo': 'bar'})
+    result = tags.merge({'foo': 'new', 'foo2': 'bar2'})
+    self.assertEqual(result.as_dict(), {'foo': 'bar', 'foo2': 'bar2'})
+    self.assertIs(tags.merge({'foo': 'new'}), tags)
+
+  def test_diff(self):
+    tags = TagSet({'foo': 'bar', 'foo2': 'bar2'})
+    result = tags.diff({'foo': 'bar', 'foo2': 'new', 'foo3': 'bar3'})
+    self.assertEqual(result.as_dict(), {'foo2': 'new', 'foo3': 'bar3'})
+    self.assertFalse(tags.diff({'foo': 'bar'}))
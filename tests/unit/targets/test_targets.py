@@ -0,0 +1,48 @@
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from set_tags import targets
+
+
+class TestTargets(unittest.TestCase):
+
+  ROLE_ARN = 'arn:aws:iam::111111111111:role/SynapseTagger'
+
+  def test_account_id(self):
+    self.assertEqual(targets.Target('us-east-1', self.ROLE_ARN).account_id, '111111111111')
+    self.assertIsNone(targets.DEFAULT.account_id)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'us-east-1'}, clear=True)
+  def test_owns(self):
+    stack_id = 'arn:aws:cloudformation:us-west-2:111111111111:stack/my-stack/abc'
+    self.assertTrue(targets.Target('us-west-2', self.ROLE_ARN).owns(stack_id))
+    self.assertFalse(targets.Target('us-east-1', self.ROLE_ARN).owns(stack_id))
+    self.assertFalse(targets.Target('us-west-2', 'arn:aws:iam::222222222222:role/r').owns(stack_id))
+    self.assertTrue(targets.Target('us-west-2').owns(stack_id))
+    self.assertFalse(targets.DEFAULT.owns(stack_id))
+    self.assertFalse(targets.DEFAULT.owns('my-stack'))
+
+  def test_use(self):
+    target = targets.Target('us-west-2')
+    self.assertIs(targets.get_current(), targets.DEFAULT)
+    with targets.use(target):
+      self.assertIs(targets.get_current(), target)
+    self.assertIs(targets.get_current(), targets.DEFAULT)
+
+  def test_submit_runs_in_current_target(self):
+    target = targets.Target('us-west-2')
+    with ThreadPoolExecutor(max_workers=2) as executor:
+      with targets.use(target):
+        future = targets.submit(executor, targets.get_current)
+      self.assertIs(future.result(), target)
+      self.assertIs(executor.submit(targets.run, target, targets.get_current).result(), target)
+
+  def test_get_targets(self):
+    self.assertEqual(targets.get_targets(), [targets.DEFAULT])
+    result = targets.get_targets(['us-east-1', 'us-west-2'], [self.ROLE_ARN])
+    self.assertEqual(result, [
+      targets.Target('us-east-1', self.ROLE_ARN),
+      targets.Target('us-west-2', self.ROLE_ARN),
+    ])
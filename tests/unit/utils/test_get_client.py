@@ -0,0 +1,82 @@
+import unittest
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from set_tags import targets
+from set_tags import utils
+
+
+class TestGetClient(unittest.TestCase):
+
+  def setUp(self):
+    utils.reset_clients()
+
+  def tearDown(self):
+    utils.reset_clients()
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_client_is_reused(self):
+    client = utils.get_client('ec2')
+    self.assertIs(utils.get_client('ec2'), client)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_client_per_service_and_region(self):
+    client = utils.get_client('ec2')
+    self.assertIsNot(utils.get_client('s3'), client)
+    self.assertIsNot(utils.get_client('ec2', region_name='other-region'), client)
+    self.assertEqual(utils.get_client('ec2', region_name='other-region').meta.region_name,
+                     'other-region')
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_client_per_credentials(self):
+    credentials = {
+      'aws_access_key_id': 'AKIAEXAMPLE',
+      'aws_secret_access_key': 'secret',
+      'aws_session_token': 'token'
+    }
+    client = utils.get_client('ec2')
+    self.assertIsNot(utils.get_client('ec2', credentials=credentials), client)
+    self.assertIs(utils.get_client('ec2', credentials=dict(credentials)),
+                  utils.get_client('ec2', credentials=credentials))
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_reset_clients(self):
+    client = utils.get_client('ec2')
+    utils.reset_clients()
+    self.assertIsNot(utils.get_client('ec2'), client)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region',
+                             'AWS_MAX_POOL_CONNECTIONS': '25'})
+  def test_client_config(self):
+    config = utils.get_client('ec2').meta.config
+    self.assertEqual(config.max_pool_connections, 25)
+    # retries are made by the retry module
+    self.assertEqual(config.retries['total_max_attempts'], 1)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_client_per_target(self):
+    client = utils.get_client('ec2')
+    target = targets.Target('other-region')
+    with targets.use(target):
+      self.assertIsNot(utils.get_client('ec2'), client)
+      self.assertEqual(utils.get_client('ec2').meta.region_name, 'other-region')
+    self.assertIs(utils.get_client('ec2', target=target), utils.get_client('ec2', target=target))
+    self.assertIs(utils.get_client('ec2'), client)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_client_assumes_target_role(self):
+    role_arn = 'arn:aws:iam::111111111111:role/SynapseTagger'
+    credentials = {
+      'access_key': 'AKIAASSUMED',
+      'secret_key': 'secret',
+      'token': 'token',
+      'expiry_time': (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
+    }
+    with patch('set_tags.utils.assume_role', return_value=credentials) as assume_role_mock, \
+      targets.use(targets.Target(role_arn=role_arn)):
+        client = utils.get_client('ec2')
+        self.assertIs(utils.get_client('s3')._request_signer._credentials,
+                      client._request_signer._credentials)
+        assume_role_mock.assert_called_once_with(role_arn)
+    self.assertEqual(client._request_signer._credentials.get_frozen_credentials().access_key,
+                     'AKIAASSUMED')
@@ -0,0 +1,66 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from botocore.stub import Stubber
+
+from set_tags import utils
+
+
+class TestGetRoleId(unittest.TestCase):
+
+  ROLE_NAME = 'ServiceCatalogEndusers'
+  GET_ROLE_RESPONSE = {
+    'Role': {
+      'Path': '/',
+      'RoleName': ROLE_NAME,
+      'RoleId': 'AROAEXAMPLEROLEID',
+      'Arn': f'arn:aws:iam::111111111111:role/{ROLE_NAME}',
+      'CreateDate': datetime.datetime(2020, 1, 1),
+    }
+  }
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_cached(self):
+    iam = utils.get_iam_client()
+    with Stubber(iam) as stubber, \
+      patch('set_tags.utils.get_iam_client', return_value=iam):
+      stubber.add_response('get_role', self.GET_ROLE_RESPONSE, {'RoleName': self.ROLE_NAME})
+      self.assertEqual(utils.get_role_id(self.ROLE_NAME), 'AROAEXAMPLEROLEID')
+      self.assertEqual(utils.get_role_id(self.ROLE_NAME), 'AROAEXAMPLEROLEID')
+      stubber.assert_no_pending_responses()
+    self.assertEqual(utils._role_id_cache.stats()['hits'], 1)
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_missing_role_cached(self):
+    iam = utils.get_iam_client()
+    with Stubber(iam) as stubber, \
+      patch('set_tags.utils.get_iam_client', return_value=iam):
+      stubber.add_client_error('get_role', 'NoSuchEntity', http_status_code=404)
+      with self.assertRaises(ValueError):
+        utils.get_role_id('NoSuchRole')
+      with self.assertRaises(ValueError):
+        utils.get_role_id('NoSuchRole')
+      stubber.assert_no_pending_responses()
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region', 'IAM_ROLE_CACHE_TTL': '0'})
+  def test_refresh(self):
+    iam = utils.get_iam_client()
+    with Stubber(iam) as stubber, \
+      patch('set_tags.utils.get_iam_client', return_value=iam):
+      stubber.add_response('get_role', self.GET_ROLE_RESPONSE, {'RoleName': self.ROLE_NAME})
+      stubber.add_response('get_role', self.GET_ROLE_RESPONSE, {'RoleName': self.ROLE_NAME})
+      utils.get_role_id(self.ROLE_NAME)
+      utils.get_role_id(self.ROLE_NAME)
+      stubber.assert_no_pending_responses()
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_other_errors_not_cached(self):
+    iam = utils.get_iam_client()
+    with Stubber(iam) as stubber, \
+      patch('set_tags.utils.get_iam_client', return_value=iam):
+      stubber.add_client_error('get_role', 'Throttling', http_status_code=400)
+      stubber.add_response('get_role', self.GET_ROLE_RESPONSE, {'RoleName': self.ROLE_NAME})
+      with self.assertRaises(utils.ClientError):
+        utils.get_role_id(self.ROLE_NAME)
+      self.assertEqual(utils.get_role_id(self.ROLE_NAME), 'AROAEXAMPLEROLEID')
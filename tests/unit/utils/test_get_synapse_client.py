@@ -0,0 +1,89 @@
+import requests
+import unittest
+
+from requests.exceptions import ConnectionError
+from unittest.mock import MagicMock, patch
+from set_tags import retry
+from set_tags import utils
+from synapseclient.core.exceptions import SynapseHTTPError
+
+
+class TestGetSynapseClient(unittest.TestCase):
+
+  @patch('synapseclient.Synapse')
+  def test_client_is_reused(self, MockSynapse):
+    syn = utils.get_synapse_client()
+    self.assertIs(utils.get_synapse_client(), syn)
+    MockSynapse.assert_called_once()
+
+  @patch('synapseclient.Synapse')
+  def test_reset_client(self, MockSynapse):
+    utils.get_synapse_client()
+    utils.reset_synapse_client()
+    utils.get_synapse_client()
+    self.assertEqual(MockSynapse.call_count, 2)
+
+  @patch('synapseclient.Synapse')
+  def test_keep_alive_session(self, MockSynapse):
+    utils.get_synapse_client()
+    session = MockSynapse.call_args.kwargs['requests_session']
+    self.assertEqual(session.get_adapter('https://repo-prod.prod.sagebase.org')._pool_maxsize, 32)
+
+
+class TestCallSynapse(unittest.TestCase):
+
+  @patch('synapseclient.Synapse')
+  def test_call(self, MockSynapse):
+    MockSynapse.return_value.getUserProfile.return_value = {'ownerId': '1111111'}
+    result = utils.call_synapse('getUserProfile', '1111111')
+    self.assertEqual(result, {'ownerId': '1111111'})
+    MockSynapse.return_value.getUserProfile.assert_called_once_with('1111111')
+
+  @patch('synapseclient.Synapse')
+  def test_rebuild_unhealthy_client(self, MockSynapse):
+    broken = MockSynapse.return_value
+    broken.getUserProfile.side_effect = ConnectionError('connection reset')
+    utils.get_synapse_client()
+    healthy = MagicMock()
+    healthy.getUserProfile.return_value = {'ownerId': '1111111'}
+    MockSynapse.return_value = healthy
+    result = utils.call_synapse('getUserProfile', '1111111')
+    self.assertEqual(result, {'ownerId': '1111111'})
+    self.assertIs(utils.get_synapse_client(), healthy)
+
+  @patch('synapseclient.Synapse')
+  def test_unhealthy_client_retried_once(self, MockSynapse):
+    MockSynapse.return_value.getUserProfile.side_effect = ConnectionError('connection reset')
+    with self.assertRaises(ConnectionError):
+      utils.call_synapse('getUserProfile', '1111111')
+    self.assertEqual(MockSynapse.return_value.getUserProfile.call_count, 2)
+
+
+class StubSession:
+  '''A requests session that is always throttled'''
+
+  def __init__(self):
+    self.uris = []
+
+  def get(self, uri, **kwargs):
+    self.uris.append(uri)
+    response = requests.Response()
+    response.status_code = 429
+    response.url = uri
+    response._content = b'{"reason": "Too many requests"}'
+    response.headers['content-type'] = 'application/json'
+    return response
+
+
+@patch('time.sleep')
+class TestSynapseRetries(unittest.TestCase):
+
+  @patch.dict('os.environ', {'SYNAPSE_MAX_ATTEMPTS': '3'})
+  def test_only_retry_layer_retries(self, sleep_mock):
+    session = StubSession()
+    with patch('set_tags.utils.get_synapse_requests_session', return_value=session):
+      with self.assertRaises(SynapseHTTPError):
+        utils.call_synapse('getUserProfile', '1111111')
+    # the client first resolves its endpoints, once
+    self.assertEqual(len([uri for uri in session.uris if '/userProfile/' in uri]), 3)
+    self.assertEqual(retry.get_metrics()['synapse']['calls'], 3)
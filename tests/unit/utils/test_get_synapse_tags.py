@@ -36,4 +36,4 @@ class TestGetSynapseTags(unittest.TestCase):
           {'Key': 'synapse:userName', 'Value': 'jsmith'},
           {'Key': 'synapse:teamId', 'Value': '9999999'}
         ]
-        self.assertListEqual(result, expected)
+        self.assertListEqual(result.as_list(), expected)
@@ -1,3 +1,5 @@
+import copy
+import json
 import unittest
 import boto3
 
@@ -51,3 +53,38 @@ class TestGetSynapseTeamIds(unittest.TestCase):
         result = utils.get_synapse_team_ids()
         expected = []
         self.assertListEqual(result, expected)
+
+class TestGetSynapseTeamIdsCache(unittest.TestCase):
+
+  @patch.dict('os.environ', {'TEAM_TO_ROLE_ARN_MAP_PARAM_NAME': '/service-catalog/TeamToRoleArnMap'})
+  def test_cached(self):
+    with patch('set_tags.utils.get_ssm_parameter') as param_mock:
+      param_mock.return_value = MOCK_GET_PARAMETER_RESPONSE
+      utils.get_synapse_team_ids()
+      result = utils.get_synapse_team_ids()
+      self.assertListEqual(result, ["1111111","2222222"])
+      param_mock.assert_called_once()
+
+  @patch.dict('os.environ', {'TEAM_TO_ROLE_ARN_MAP_PARAM_NAME': '/service-catalog/TeamToRoleArnMap',
+                             'TEAM_TO_ROLE_ARN_MAP_CACHE_TTL': '0'})
+  def test_expired_same_version(self):
+    with patch('set_tags.utils.get_ssm_parameter') as param_mock, \
+      patch('set_tags.utils.json.loads', wraps=json.loads) as loads_mock:
+        param_mock.return_value = MOCK_GET_PARAMETER_RESPONSE
+        utils.get_synapse_team_ids()
+        result = utils.get_synapse_team_ids()
+        self.assertListEqual(result, ["1111111","2222222"])
+        self.assertEqual(param_mock.call_count, 2)
+        loads_mock.assert_called_once()
+
+  @patch.dict('os.environ', {'TEAM_TO_ROLE_ARN_MAP_PARAM_NAME': '/service-catalog/TeamToRoleArnMap',
+                             'TEAM_TO_ROLE_ARN_MAP_CACHE_TTL': '0'})
+  def test_expired_new_version(self):
+    new_response = copy.deepcopy(MOCK_GET_PARAMETER_RESPONSE)
+    new_response["Parameter"]["Version"] = 2
+    new_response["Parameter"]["Value"] = "[ {\"teamId\":\"3333333\",\"roleArn\":\"arn:aws:iam::999999999999:role/ServiceCatalogEndusers\"} ]"
+    with patch('set_tags.utils.get_ssm_parameter') as param_mock:
+      param_mock.side_effect = [MOCK_GET_PARAMETER_RESPONSE, new_response]
+      utils.get_synapse_team_ids()
+      result = utils.get_synapse_team_ids()
+      self.assertListEqual(result, ["3333333"])
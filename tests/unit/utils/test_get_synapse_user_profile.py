@@ -34,3 +34,19 @@ class TestGetSynapseUserProfile(unittest.TestCase):
     MockSynapse.return_value.getUserProfile=mock_get_user_profile
     with self.assertRaises(SynapseHTTPError):
       utils.get_synapse_user_profile("3333333")
+
+  @patch('synapseclient.Synapse')
+  def test_cached(self, MockSynapse):
+    MockSynapse.return_value.getUserProfile = MagicMock(side_effect=mock_get_user_profile)
+    utils.get_synapse_user_profile("1111111")
+    result = utils.get_synapse_user_profile("1111111")
+    self.assertEqual(result, TEST_USER_PROFILE)
+    MockSynapse.return_value.getUserProfile.assert_called_once()
+
+  @patch('synapseclient.Synapse')
+  def test_invalidate(self, MockSynapse):
+    MockSynapse.return_value.getUserProfile = MagicMock(side_effect=mock_get_user_profile)
+    utils.get_synapse_user_profile("1111111")
+    utils.invalidate_synapse_user("1111111")
+    utils.get_synapse_user_profile("1111111")
+    self.assertEqual(MockSynapse.return_value.getUserProfile.call_count, 2)
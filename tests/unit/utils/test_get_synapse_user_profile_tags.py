@@ -32,7 +32,7 @@ class TestGetSynapseUserProfileTags(unittest.TestCase):
         {'Key': 'synapse:company', 'Value': 'Sage Bionetworks'},
         {'Key': 'synapse:teamName', 'Value': 'Sage Team'}
     ]
-    self.assertListEqual(result, expected)
+    self.assertListEqual(result.as_list(), expected)
 
   def test_happy_mulitple_includes(self):
     result = utils.get_synapse_user_profile_tags(TEST_USER_PROFILE,
@@ -43,14 +43,14 @@ class TestGetSynapseUserProfileTags(unittest.TestCase):
         {'Key': 'OwnerEmail', 'Value': 'jsmith@synapse.org'},
         {'Key': 'synapse:userName', 'Value': 'jsmith'},
     ]
-    self.assertListEqual(result, expected)
+    self.assertListEqual(result.as_list(), expected)
 
   def test_happy_not_include_user_name(self):
     result = utils.get_synapse_user_profile_tags(TEST_USER_PROFILE, ["ownerId"])
     expected = [
         {'Key': 'synapse:ownerId', 'Value': '1111111'}
     ]
-    self.assertListEqual(result, expected)
+    self.assertListEqual(result.as_list(), expected)
 
   def test_sanitiz_tag_values(self):
     INVALID_CHAR_USER_PROFILE = {
@@ -73,4 +73,4 @@ class TestGetSynapseUserProfileTags(unittest.TestCase):
         {'Key': 'synapse:company', 'Value': 'Sage-Bionetworks in Seattle  WA'},
         {'Key': 'synapse:teamName', 'Value': 'CompOnc Tesla SysBio'}
     ]
-    self.assertListEqual(result, expected)
+    self.assertListEqual(result.as_list(), expected)
@@ -1,3 +1,5 @@
+import threading
+import time
 import unittest
 import boto3
 
@@ -39,3 +41,56 @@ class TestGetSynapseUserTeamId(unittest.TestCase):
         result = utils.get_synapse_user_team_id(3333333, ["1111111","2222222"])
         expected = None
         self.assertEqual(result, expected)
+
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
+  def test_first_team_in_list_order(self):
+    def get_membership_status(synapse_id, team_id):
+      # the last team answers first
+      if team_id == "1111111":
+        time.sleep(0.1)
+      return {"isMember": True}
+
+    with patch('synapseclient.Synapse') as syn_mock:
+      syn_mock.return_value.get_membership_status = get_membership_status
+      result = utils.get_synapse_user_team_id(1111111, ["1111111","2222222","3333333"])
+      self.assertEqual(result, "1111111")
+
+
+  @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region',
+                             'SYNAPSE_TEAM_LOOKUP_WORKERS': '4'})
+  def test_concurrent_lookups(self):
+    # each lookup blocks until all four lookups are in flight
+    barrier = threading.Barrier(4, timeout=5)
+    def get_membership_status(synapse_id, team_id):
+      barrier.wait()
+      return {"isMember": team_id == "4444444"}
+
+    with patch('synapseclient.Synapse') as syn_mock:
+      syn_mock.return_value.get_membership_status = get_membership_status
+      result = utils.get_synapse_user_team_id(1111111, ["1111111","2222222","3333333","4444444"])
+      self.assertEqual(result, "4444444")
+
+
+  def test_no_teams(self):
+    with patch('synapseclient.Synapse') as syn_mock:
+      result = utils.get_synapse_user_team_id(1111111, [])
+      self.assertEqual(result, None)
+      syn_mock.return_value.get_membership_status.assert_not_called()
+
+
+  def test_cached(self):
+    with patch('synapseclient.Synapse') as syn_mock:
+      syn_mock.return_value.get_membership_status.return_value = {"isMember": False}
+      utils.get_synapse_user_team_id(1111111, ["1111111","2222222"])
+      result = utils.get_synapse_user_team_id(1111111, ["1111111","2222222"])
+      self.assertEqual(result, None)
+      self.assertEqual(syn_mock.return_value.get_membership_status.call_count, 2)
+
+
+  def test_cache_miss_on_new_team_ids(self):
+    with patch('synapseclient.Synapse') as syn_mock:
+      syn_mock.return_value.get_membership_status.return_value = {"isMember": True}
+      utils.get_synapse_user_team_id(1111111, ["1111111"])
+      result = utils.get_synapse_user_team_id(1111111, ["2222222"])
+      self.assertEqual(result, "2222222")
@@ -15,7 +15,7 @@ class TestGetSynapseUserTeamTags(unittest.TestCase):
         user_team_id_mock.return_value = "1111111"
         result = utils.get_synapse_user_team_tags(1234567,["1111111","222222"])
         expected = [{'Key': 'synapse:teamId', 'Value': '1111111'}]
-        self.assertListEqual(result, expected)
+        self.assertListEqual(result.as_list(), expected)
 
   @patch.dict('os.environ', {'AWS_DEFAULT_REGION': 'test-region'})
   def test_user_not_in_a_team(self):
@@ -25,4 +25,4 @@ class TestGetSynapseUserTeamTags(unittest.TestCase):
         user_team_id_mock.return_value = None
         result = utils.get_synapse_user_team_tags(1234567,["1111111","222222"])
         expected = []
-        self.assertListEqual(result, expected)
+        self.assertListEqual(result.as_list(), expected)